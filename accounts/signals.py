@@ -0,0 +1,16 @@
+"""
+Signal handlers for accounts
+"""
+
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .username_cache import username_cache
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def update_username_cache(sender, instance, **kwargs):
+    """Keep cached usernames current when a user is saved"""
+    if instance.username:
+        username_cache.update(instance.id, instance.username)
@@ -0,0 +1,174 @@
+"""
+Cached user_id -> username lookups
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+import redis.asyncio as aioredis
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+logger = logging.getLogger(__name__)
+
+USERNAMES_KEY = "usernames"
+
+
+class UsernameCache:
+    """
+    Two-level cache of usernames by user ID
+
+    Lets compact stream entries store only the sender's ID. Usernames live
+    in a single Redis hash, written the first time a process sees a user
+    send a message and kept current by the User post_save signal, with a
+    per-process LRU in front. Missing users are loaded from the database in
+    one query and written back.
+    """
+
+    def __init__(self, local_ttl: float = 300, local_max_size: int = 10000):
+        """
+        Args:
+            local_ttl: Lifetime of an in-process entry in seconds
+            local_max_size: Maximum number of in-process entries
+        """
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.local_ttl = local_ttl
+        self.local_max_size = local_max_size
+        # user_id -> (username, monotonic expiry)
+        self._local: OrderedDict[int, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_local(self, user_id: int):
+        """Return a username from the in-process cache, or None"""
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._local[user_id]
+                return None
+            self._local.move_to_end(user_id)
+            return entry[0]
+
+    def set_local(self, user_id: int, username: str):
+        """Store a username in the in-process cache"""
+        with self._lock:
+            self._local[user_id] = (username, time.monotonic() + self.local_ttl)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.local_max_size:
+                self._local.popitem(last=False)
+
+    def _split_local(self, user_ids) -> tuple[dict[int, str], list[int]]:
+        """Split user IDs into in-process hits and misses"""
+        found, missing = {}, []
+        for user_id in user_ids:
+            username = self.get_local(user_id)
+            if username is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = username
+        return found, missing
+
+    def _load_usernames(self, user_ids: list[int]) -> dict[int, str]:
+        """Load usernames from the database"""
+        User = get_user_model()
+        return dict(User.objects.filter(id__in=user_ids).values_list("id", "username"))
+
+    def get_many(self, user_ids) -> dict[int, str]:
+        """
+        Get usernames for several users
+
+        Args:
+            user_ids: IDs of the users
+
+        Returns:
+            Mapping of user ID to username; unknown users are left out
+        """
+        found, missing = self._split_local(user_ids)
+        if not missing:
+            return found
+
+        try:
+            names = self.redis_client.hmget(USERNAMES_KEY, [str(user_id) for user_id in missing])
+            loaded = {user_id: name for user_id, name in zip(missing, names) if name is not None}
+            unresolved = [user_id for user_id in missing if user_id not in loaded]
+            if unresolved:
+                from_db = self._load_usernames(unresolved)
+                if from_db:
+                    self.redis_client.hset(
+                        USERNAMES_KEY,
+                        mapping={str(user_id): name for user_id, name in from_db.items()},
+                    )
+                loaded.update(from_db)
+        except redis.RedisError as e:
+            logger.error("Username cache lookup failed", extra={"error": str(e)})
+            loaded = self._load_usernames(missing)
+
+        for user_id, username in loaded.items():
+            self.set_local(user_id, username)
+        found.update(loaded)
+        return found
+
+    async def aget_many(self, user_ids) -> dict[int, str]:
+        """
+        Get usernames for several users without blocking the event loop
+
+        Args:
+            user_ids: IDs of the users
+
+        Returns:
+            Mapping of user ID to username; unknown users are left out
+        """
+        found, missing = self._split_local(user_ids)
+        if not missing:
+            return found
+
+        load_usernames = database_sync_to_async(self._load_usernames)
+        try:
+            names = await self.async_redis_client.hmget(
+                USERNAMES_KEY, [str(user_id) for user_id in missing]
+            )
+            loaded = {user_id: name for user_id, name in zip(missing, names) if name is not None}
+            unresolved = [user_id for user_id in missing if user_id not in loaded]
+            if unresolved:
+                from_db = await load_usernames(unresolved)
+                if from_db:
+                    await self.async_redis_client.hset(
+                        USERNAMES_KEY,
+                        mapping={str(user_id): name for user_id, name in from_db.items()},
+                    )
+                loaded.update(from_db)
+        except redis.RedisError as e:
+            logger.error("Username cache lookup failed", extra={"error": str(e)})
+            loaded = await load_usernames(missing)
+
+        for user_id, username in loaded.items():
+            self.set_local(user_id, username)
+        found.update(loaded)
+        return found
+
+    def update(self, user_id: int, username: str):
+        """
+        Record a user's current username
+
+        Args:
+            user_id: ID of the user
+            username: Current username
+        """
+        self.set_local(user_id, username)
+        try:
+            self.redis_client.hset(USERNAMES_KEY, str(user_id), username)
+        except redis.RedisError as e:
+            logger.error(
+                "Username cache update failed",
+                extra={"user_id": user_id, "error": str(e)},
+            )
+
+
+# Singleton instance
+username_cache = UsernameCache()
@@ -11,6 +11,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 
 from messaging.redis_stream import redis_stream_client
+from messaging.send_queue import send_queue_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +21,8 @@ logger = logging.getLogger(__name__)
 def health_check(request):
     """
     Health check endpoint
-    Checks PostgreSQL and Redis connectivity
+    Checks PostgreSQL and Redis connectivity, and reports this worker's
+    WebSocket send queue depth
     """
     checks = {
         "postgres": False,
@@ -52,6 +54,7 @@ def health_check(request):
         {
             "status": "healthy" if overall_healthy else "unhealthy",
             "checks": checks,
+            "websocket_send_queues": send_queue_metrics.snapshot(),
         },
         status=response_status,
     )
@@ -0,0 +1,240 @@
+"""
+Cached conversation membership lookups
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .models import Participant
+
+logger = logging.getLogger(__name__)
+
+# Marker field so a conversation without participants is still a cache hit
+EMPTY_MARKER = "*"
+
+# Store members loaded from the database, unless the conversation was
+# invalidated since the load started, which would write back stale members.
+# KEYS: members hash, generation counter.
+# ARGV: generation seen before the load ("" if none), ttl, then user_id/role pairs.
+# Returns 1 if stored, 0 if skipped.
+FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class MembershipCache:
+    """
+    Two-level cache of conversation participants and their roles
+
+    Each conversation is stored in Redis as a hash of user_id -> role, loaded
+    from Postgres in one query on a miss. In front of it sits a small
+    per-process LRU with a short TTL, so repeated checks for the same user
+    (reconnect storms, history paging) do not even reach Redis. Participant
+    signals drop both levels for the affected conversation; other processes
+    see the change once their local entry expires.
+
+    Invalidation also bumps a per-conversation generation counter. A lookup
+    notes the generation before loading from Postgres and only stores what
+    it loaded if the generation is unchanged, so a load that raced with a
+    participant change cannot put the old members back.
+    """
+
+    def __init__(self, ttl: int = 3600, local_ttl: float = 5, local_max_size: int = 10000):
+        """
+        Args:
+            ttl: Lifetime of a conversation's Redis hash in seconds
+            local_ttl: Lifetime of an in-process entry in seconds
+            local_max_size: Maximum number of in-process entries
+        """
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.fill_script = self.redis_client.register_script(FILL_SCRIPT)
+        self.async_fill_script = self.async_redis_client.register_script(FILL_SCRIPT)
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_max_size = local_max_size
+        # (conversation_id, user_id) -> (role or None, monotonic expiry)
+        self._local: OrderedDict[tuple[str, int], tuple[Optional[str], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_members_key(self, conversation_id) -> str:
+        """Generate Redis key for a conversation's members"""
+        return f"members:conv:{conversation_id}"
+
+    def _get_generation_key(self, conversation_id) -> str:
+        """Generate Redis key for a conversation's membership generation"""
+        return f"members:conv:{conversation_id}:gen"
+
+    def _fill_args(self, generation: Optional[str], members: dict[str, str]) -> list:
+        """Build the ARGV list for the fill script"""
+        args = [generation or "", self.ttl]
+        for user_id, role in members.items():
+            args.extend([user_id, role])
+        return args
+
+    def _get_local(self, conversation_id: str, user_id: int):
+        """Return (hit, role) from the in-process cache"""
+        with self._lock:
+            entry = self._local.get((conversation_id, user_id))
+            if entry is None:
+                return False, None
+            if entry[1] <= time.monotonic():
+                del self._local[(conversation_id, user_id)]
+                return False, None
+            self._local.move_to_end((conversation_id, user_id))
+            return True, entry[0]
+
+    def _set_local(self, conversation_id: str, user_id: int, role: Optional[str]):
+        """Store a role (or non-membership) in the in-process cache"""
+        with self._lock:
+            self._local[(conversation_id, user_id)] = (role, time.monotonic() + self.local_ttl)
+            self._local.move_to_end((conversation_id, user_id))
+            while len(self._local) > self.local_max_size:
+                self._local.popitem(last=False)
+
+    def _load_members(self, conversation_id: str) -> dict[str, str]:
+        """Load a conversation's participants from the database"""
+        members = {
+            str(user_id): role
+            for user_id, role in Participant.objects.filter(
+                conversation_id=conversation_id
+            ).values_list("user_id", "role")
+        }
+        members[EMPTY_MARKER] = ""
+        return members
+
+    def get_role(self, conversation_id, user_id: int) -> Optional[str]:
+        """
+        Get a user's role in a conversation
+
+        Args:
+            conversation_id: UUID of the conversation
+            user_id: ID of the user
+
+        Returns:
+            Participant role, or None if the user is not a participant
+        """
+        conversation_id = str(conversation_id)
+        hit, role = self._get_local(conversation_id, user_id)
+        if hit:
+            return role
+
+        key = self._get_members_key(conversation_id)
+        generation_key = self._get_generation_key(conversation_id)
+        cache_locally = True
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hget(key, str(user_id))
+            pipe.exists(key)
+            pipe.get(generation_key)
+            role, exists, generation = pipe.execute()
+            if not exists:
+                members = self._load_members(conversation_id)
+                cache_locally = self.fill_script(
+                    keys=[key, generation_key], args=self._fill_args(generation, members)
+                )
+                role = members.get(str(user_id))
+        except redis.RedisError as e:
+            logger.error(
+                "Membership cache lookup failed",
+                extra={"conversation_id": conversation_id, "error": str(e)},
+            )
+            role = self._load_members(conversation_id).get(str(user_id))
+
+        if cache_locally:
+            self._set_local(conversation_id, user_id, role)
+        return role
+
+    async def aget_role(self, conversation_id, user_id: int) -> Optional[str]:
+        """
+        Get a user's role in a conversation without blocking the event loop
+
+        Args:
+            conversation_id: UUID of the conversation
+            user_id: ID of the user
+
+        Returns:
+            Participant role, or None if the user is not a participant
+        """
+        conversation_id = str(conversation_id)
+        hit, role = self._get_local(conversation_id, user_id)
+        if hit:
+            return role
+
+        key = self._get_members_key(conversation_id)
+        generation_key = self._get_generation_key(conversation_id)
+        load_members = database_sync_to_async(self._load_members)
+        cache_locally = True
+        try:
+            pipe = self.async_redis_client.pipeline(transaction=False)
+            pipe.hget(key, str(user_id))
+            pipe.exists(key)
+            pipe.get(generation_key)
+            role, exists, generation = await pipe.execute()
+            if not exists:
+                members = await load_members(conversation_id)
+                cache_locally = await self.async_fill_script(
+                    keys=[key, generation_key], args=self._fill_args(generation, members)
+                )
+                role = members.get(str(user_id))
+        except redis.RedisError as e:
+            logger.error(
+                "Membership cache lookup failed",
+                extra={"conversation_id": conversation_id, "error": str(e)},
+            )
+            role = (await load_members(conversation_id)).get(str(user_id))
+
+        if cache_locally:
+            self._set_local(conversation_id, user_id, role)
+        return role
+
+    def is_participant(self, conversation_id, user_id: int) -> bool:
+        """Check if a user is a participant in a conversation"""
+        return self.get_role(conversation_id, user_id) is not None
+
+    async def ais_participant(self, conversation_id, user_id: int) -> bool:
+        """Check if a user is a participant in a conversation (async)"""
+        return await self.aget_role(conversation_id, user_id) is not None
+
+    def invalidate(self, conversation_id):
+        """
+        Drop cached membership for a conversation
+
+        Args:
+            conversation_id: UUID of the conversation
+        """
+        conversation_id = str(conversation_id)
+        with self._lock:
+            for key in [key for key in self._local if key[0] == conversation_id]:
+                del self._local[key]
+        try:
+            generation_key = self._get_generation_key(conversation_id)
+            pipe = self.redis_client.pipeline()
+            pipe.delete(self._get_members_key(conversation_id))
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(
+                "Membership cache invalidation failed",
+                extra={"conversation_id": conversation_id, "error": str(e)},
+            )
+
+
+# Singleton instance
+membership_cache = MembershipCache()
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conversations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="retention_days",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="retention_max_messages",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -22,6 +22,9 @@ class Conversation(models.Model):
         on_delete=models.CASCADE,
         related_name="created_conversations",
     )
+    # Stream retention overrides; null uses REDIS_STREAM_RETENTION, 0 is unlimited
+    retention_days = models.PositiveIntegerField(null=True, blank=True)
+    retention_max_messages = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
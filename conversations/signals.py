@@ -0,0 +1,24 @@
+"""
+Signal handlers for conversations
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .membership import membership_cache
+from .models import Participant
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def invalidate_membership_cache(sender, instance, **kwargs):
+    """
+    Drop cached membership when a participant is added, changed or removed
+
+    Invalidated immediately and again after commit, so a lookup that reloads
+    the old rows while the transaction is still open cannot keep them cached.
+    """
+    conversation_id = instance.conversation_id
+    membership_cache.invalidate(conversation_id)
+    transaction.on_commit(lambda: membership_cache.invalidate(conversation_id))
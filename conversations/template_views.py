@@ -2,13 +2,21 @@
 Template-based views for conversations
 """
 
+import logging
+
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views import View
 
+from messaging.read_cursors import read_cursors
+from messaging.redis_stream import RedisStreamError, redis_stream_client
+
+from .membership import membership_cache
 from .models import Conversation, Participant
 from .serializers import ConversationCreateSerializer
 
+logger = logging.getLogger(__name__)
+
 
 class ConversationListTemplateView(LoginRequiredMixin, View):
     """List all conversations for the current user"""
@@ -16,8 +24,27 @@ class ConversationListTemplateView(LoginRequiredMixin, View):
     login_url = "/login"
 
     def get(self, request):
-        conversations = Conversation.objects.filter(participants__user=request.user).distinct()
-        return render(request, "conversations/list.html", {"conversations": conversations})
+        conversations = list(
+            Conversation.objects.filter(participants__user=request.user).distinct()
+        )
+
+        # Last message and unread count per conversation, each fetched in
+        # one pipelined batch
+        conversation_ids = [str(conversation.id) for conversation in conversations]
+        try:
+            previews = redis_stream_client.get_previews(conversation_ids)
+        except RedisStreamError:
+            previews = {}
+        unread_counts = read_cursors.get_unread_counts(request.user.id, conversation_ids)
+        for conversation in conversations:
+            conversation.preview = previews.get(str(conversation.id))
+            conversation.unread_count = unread_counts.get(str(conversation.id), 0)
+
+        return render(
+            request,
+            "conversations/list.html",
+            {"conversations": conversations, "max_unread": read_cursors.max_unread},
+        )
 
 
 class CreateConversationTemplateView(LoginRequiredMixin, View):
@@ -49,11 +76,9 @@ class ChatRoomTemplateView(LoginRequiredMixin, View):
         conversation = get_object_or_404(Conversation, id=conversation_id)
 
         # Check if user is a participant
-        participant = Participant.objects.filter(
-            conversation=conversation, user=request.user
-        ).first()
+        role = membership_cache.get_role(conversation.id, request.user.id)
 
-        if not participant:
+        if role is None:
             return render(
                 request,
                 "conversations/list.html",
@@ -65,7 +90,7 @@ class ChatRoomTemplateView(LoginRequiredMixin, View):
                 },
             )
 
-        is_admin = participant.role == Participant.Role.ADMIN
+        is_admin = role == Participant.Role.ADMIN
 
         return render(
             request,
@@ -9,6 +9,7 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .membership import membership_cache
 from .models import Conversation, Participant
 from .serializers import ConversationCreateSerializer, ConversationSerializer
 
@@ -56,10 +57,7 @@ class ConversationViewSet(viewsets.ModelViewSet):
         Retrieve conversation only if user is a participant
         """
         conversation = self.get_object()
-        if not Participant.objects.filter(
-            conversation=conversation,
-            user=request.user,
-        ).exists():
+        if not membership_cache.is_participant(conversation.id, request.user.id):
             return Response(
                 {"error": "You are not a participant in this conversation"},
                 status=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,226 @@
+"""
+Admission control for WebSocket connections
+"""
+
+import asyncio
+import json
+import logging
+import random
+import socket
+import time
+import uuid
+from typing import NamedTuple, Optional
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NODE = "node"
+USER = "user"
+
+# Close code for refused connections, after HTTP 429
+CLOSE_CODE_RETRY_LATER = 4429
+
+# Drop expired leases, then admit if both the node's and the user's open
+# connections are below their limits.
+# KEYS: node leases, user leases (optional).
+# ARGV: now_ms, expires_ms, lease_id, node_limit, user_limit, key_ttl_ms.
+# Returns 0 if admitted, 1 if the node is full, 2 if the user is.
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+end
+if tonumber(ARGV[4]) > 0 and redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 1
+end
+if KEYS[2] and tonumber(ARGV[5]) > 0 and redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[5]) then
+    return 2
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, ARGV[2], ARGV[3])
+    redis.call('PEXPIRE', key, ARGV[6])
+end
+return 0
+"""
+
+
+class Admission(NamedTuple):
+    """Result of asking to open a connection"""
+
+    allowed: bool
+    # Lease to release when the connection closes, None if not allowed
+    lease_id: Optional[str]
+    # Limit that refused the connection (NODE or USER)
+    limit: Optional[str] = None
+    retry_after: Optional[float] = None
+
+
+def get_node_id() -> str:
+    """Name of this node from settings.WEBSOCKET_ADMISSION, the hostname by default"""
+    return settings.WEBSOCKET_ADMISSION.get("NODE_ID") or socket.gethostname()
+
+
+class ConnectionAdmission:
+    """
+    Per-node and per-user limits on open WebSocket connections
+
+    Every open connection holds a lease in a Redis sorted set for its node
+    and one for its user, scored by expiry time. Leases of this process are
+    renewed together by one background task, so a crashed worker's
+    connections stop counting once LEASE_SECONDS have passed. Workers that
+    share a NODE_ID, by default all workers on a host, share its limit.
+    """
+
+    def __init__(self):
+        config = settings.WEBSOCKET_ADMISSION
+        self.redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.admit_script = self.redis_client.register_script(ADMIT_SCRIPT)
+        self.node_limit = config["MAX_CONNECTIONS_PER_NODE"]
+        self.user_limit = config["MAX_CONNECTIONS_PER_USER"]
+        self.lease_seconds = config["LEASE_SECONDS"]
+        self.retry_after = config["RETRY_AFTER_SECONDS"]
+        self.node_key = f"conns:node:{get_node_id()}"
+        # lease_id -> lease keys, for this process's open connections
+        self.leases = {}
+        self.renew_task = None
+
+    def _get_user_key(self, user_id: int) -> str:
+        """Generate Redis key for a user's connection leases"""
+        return f"conns:user:{user_id}"
+
+    async def acquire(self, user_id: Optional[int]) -> Admission:
+        """
+        Take a lease for a new connection if the limits allow it
+
+        Args:
+            user_id: ID of the authenticated user, None for anonymous connections
+
+        Returns:
+            Admission with the lease to release, or the limit that refused it
+        """
+        lease_id = uuid.uuid4().hex
+        keys = [self.node_key]
+        if user_id is not None:
+            keys.append(self._get_user_key(user_id))
+
+        now_ms = int(time.time() * 1000)
+        try:
+            result = await self.admit_script(
+                keys=keys,
+                args=[
+                    now_ms,
+                    now_ms + self.lease_seconds * 1000,
+                    lease_id,
+                    self.node_limit,
+                    self.user_limit,
+                    self.lease_seconds * 2000,
+                ],
+            )
+        except redis.RedisError as e:
+            # Fail open: chat keeps working while Redis is unavailable
+            logger.error(
+                "Failed to check connection limits",
+                extra={"user_id": user_id, "error": str(e)},
+            )
+            return Admission(True, None)
+
+        if result:
+            limit = NODE if result == 1 else USER
+            logger.warning(
+                "WebSocket connection refused",
+                extra={"user_id": user_id, "limit": limit, "node": self.node_key},
+            )
+            # Spread retries over [base, 2 * base] so a refused burst does
+            # not come back at the same instant
+            retry_after = round(random.uniform(self.retry_after, 2 * self.retry_after), 1)
+            return Admission(False, None, limit, retry_after)
+
+        self.leases[lease_id] = keys
+        if self.renew_task is None or self.renew_task.done():
+            self.renew_task = asyncio.create_task(self.renew())
+        return Admission(True, lease_id)
+
+    async def release(self, lease_id: Optional[str]):
+        """Give back a connection's lease"""
+        keys = self.leases.pop(lease_id, None)
+        if not keys:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.zrem(key, lease_id)
+            await pipe.execute()
+        except redis.RedisError as e:
+            # The lease expires on its own
+            logger.error(
+                "Failed to release connection lease",
+                extra={"lease_id": lease_id, "error": str(e)},
+            )
+
+    async def renew(self):
+        """Extend this process's leases in one pipeline while any are held"""
+        while self.leases:
+            await asyncio.sleep(self.lease_seconds / 3)
+            expires_ms = int(time.time() * 1000) + self.lease_seconds * 1000
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for lease_id, keys in list(self.leases.items()):
+                    for key in keys:
+                        pipe.zadd(key, {lease_id: expires_ms}, xx=True)
+                for key in {key for keys in self.leases.values() for key in keys}:
+                    pipe.pexpire(key, self.lease_seconds * 2000)
+                await pipe.execute()
+            except redis.RedisError as e:
+                logger.error("Failed to renew connection leases", extra={"error": str(e)})
+
+
+class ConnectionAdmissionMiddleware:
+    """
+    ASGI middleware refusing WebSockets over the per-node or per-user limit
+
+    Sits after authentication and before the consumers, so an excess
+    connection is turned away before any membership lookups. Refused
+    connections are accepted and closed at once with code 4429 and a
+    `{"retry_after": seconds}` reason, since a handshake rejected before
+    accepting cannot carry a close code.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            return await self.inner(scope, receive, send)
+
+        user = scope.get("user")
+        user_id = user.id if user is not None and user.is_authenticated else None
+        admission = await connection_admission.acquire(user_id)
+        if not admission.allowed:
+            await self.refuse(receive, send, admission.retry_after)
+            return
+
+        try:
+            return await self.inner(scope, receive, send)
+        finally:
+            await connection_admission.release(admission.lease_id)
+
+    async def refuse(self, receive, send, retry_after: float):
+        """Complete the handshake and close with the retry-after hint"""
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        await send({"type": "websocket.accept"})
+        await send(
+            {
+                "type": "websocket.close",
+                "code": CLOSE_CODE_RETRY_LATER,
+                "reason": json.dumps({"retry_after": retry_after}),
+            }
+        )
+
+
+# Singleton instance
+connection_admission = ConnectionAdmission()
@@ -0,0 +1,414 @@
+"""
+Write-behind archive of conversation streams in Postgres
+"""
+
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import redis
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ArchivedMessage
+from .redis_stream import (
+    STREAM_KEY_PREFIX,
+    WRITTEN_STREAMS_KEY,
+    parse_stream_id,
+    previous_stream_id,
+    redis_stream_client,
+    scan_conversation_streams,
+    stream_id_to_timestamp,
+)
+
+logger = logging.getLogger(__name__)
+
+# Streams named in one XREADGROUP call
+STREAMS_PER_READ = 100
+# Written streams taken from WRITTEN_STREAMS_KEY per pass
+WRITTEN_STREAMS_PER_PASS = 1000
+# Stream IDs are unsigned 64-bit pairs; the archive stores them as bigint
+MAX_ARCHIVED_PART = 2**63 - 1
+
+
+class MessageArchiver:
+    """
+    Copies conversation streams into ArchivedMessage rows
+
+    Every stream gets a consumer group, read with XREADGROUP across many
+    streams at once. Entries are bulk-inserted and only then acknowledged,
+    so a crash leaves them pending for the next recovery pass; inserts
+    ignore entries already archived, which makes redelivery harmless.
+
+    Writers add each stream they write to WRITTEN_STREAMS_KEY, and a pass
+    normally reads only the streams it takes from that set, so the work
+    follows write volume rather than the number of conversations. Every
+    rescan_seconds a full pass instead walks all streams with SCAN, which
+    picks up anything a crashed pass took from the set without reading,
+    and claims entries left pending by archivers that went away.
+
+    Entries trimmed from a stream before they were read are not archived,
+    so the archiver has to keep up with the streams' MAXLEN.
+    """
+
+    def __init__(
+        self,
+        consumer: str,
+        group: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        recover_seconds: float = 60,
+        rescan_seconds: Optional[float] = None,
+    ):
+        """
+        Args:
+            consumer: Name of this archiver within the consumer group
+            group: Consumer group name (default: MESSAGE_ARCHIVE["GROUP"])
+            batch_size: Entries read per stream and rows per insert
+                (default: MESSAGE_ARCHIVE["BATCH_SIZE"])
+            recover_seconds: How long an entry must be pending before
+                another archiver claims it
+            rescan_seconds: Interval between full passes over every stream
+                (default: MESSAGE_ARCHIVE["RESCAN_SECONDS"])
+        """
+        self.redis_client = redis_stream_client.redis_client
+        self.consumer = consumer
+        self.group = group or settings.MESSAGE_ARCHIVE["GROUP"]
+        self.batch_size = batch_size or settings.MESSAGE_ARCHIVE["BATCH_SIZE"]
+        self.recover_seconds = recover_seconds
+        if rescan_seconds is None:
+            rescan_seconds = settings.MESSAGE_ARCHIVE["RESCAN_SECONDS"]
+        self.rescan_seconds = rescan_seconds
+        self.known_groups: set[str] = set()
+        self.next_full_pass = 0.0
+
+    def ensure_groups(self, keys: list[str]) -> list[str]:
+        """Create the consumer group where missing; returns the keys that still exist"""
+        existing = []
+        for key in keys:
+            if key not in self.known_groups:
+                try:
+                    self.redis_client.xgroup_create(key, self.group, id="0")
+                except redis.ResponseError as e:
+                    if "BUSYGROUP" not in str(e):
+                        # Deleted after it was written
+                        continue
+                self.known_groups.add(key)
+            existing.append(key)
+        return existing
+
+    def discover_streams(self) -> list[str]:
+        """Keys of all conversation streams, each with the consumer group in place"""
+        return self.ensure_groups(list(scan_conversation_streams(self.redis_client, 1000)))
+
+    def run_once(self) -> int:
+        """
+        Archive the next batch of the written streams, or of every stream on a full pass
+
+        Returns:
+            Number of entries archived
+        """
+        full_pass = time.monotonic() >= self.next_full_pass
+        if full_pass:
+            # Everything written from here on is either read by the scan
+            # below or added to the set again
+            self.redis_client.delete(WRITTEN_STREAMS_KEY)
+            keys = self.discover_streams()
+        else:
+            keys = self.ensure_groups(
+                self.redis_client.spop(WRITTEN_STREAMS_KEY, WRITTEN_STREAMS_PER_PASS) or []
+            )
+
+        archived = 0
+        unfinished = []
+        for start in range(0, len(keys), STREAMS_PER_READ):
+            chunk = keys[start : start + STREAMS_PER_READ]
+            if full_pass:
+                archived += self.recover(chunk)
+            response = self.redis_client.xreadgroup(
+                self.group,
+                self.consumer,
+                dict.fromkeys(chunk, ">"),
+                count=self.batch_size,
+            )
+            archived += self.archive(response)
+            unfinished.extend(
+                key for key, entries in response or [] if len(entries) >= self.batch_size
+            )
+        if unfinished:
+            # Streams with more entries than one read takes are read again next pass
+            self.redis_client.sadd(WRITTEN_STREAMS_KEY, *unfinished)
+        if full_pass:
+            self.next_full_pass = time.monotonic() + self.rescan_seconds
+        return archived
+
+    def recover(self, keys: list[str]) -> int:
+        """Claim stale pending entries and archive everything pending for this consumer"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.xautoclaim(
+                key,
+                self.group,
+                self.consumer,
+                min_idle_time=int(self.recover_seconds * 1000),
+                count=self.batch_size,
+                justid=True,
+            )
+        pipe.execute()
+
+        archived = 0
+        while True:
+            # "0" re-reads this consumer's delivered but unacknowledged entries
+            response = self.redis_client.xreadgroup(
+                self.group,
+                self.consumer,
+                dict.fromkeys(keys, "0"),
+                count=self.batch_size,
+            )
+            count = self.archive(response)
+            if not count:
+                return archived
+            archived += count
+
+    def archive(self, response) -> int:
+        """Insert entries from an XREADGROUP response, then acknowledge them"""
+        rows = []
+        acks = {}
+        for key, entries in response or []:
+            if not entries:
+                continue
+            acks[key] = [entry_id for entry_id, _ in entries]
+            try:
+                conversation_id = uuid.UUID(key[len(STREAM_KEY_PREFIX) :])
+            except ValueError:
+                logger.warning("Skipping stream of unknown conversation", extra={"key": key})
+                continue
+            # Pending entries trimmed from the stream come back without fields
+            present = [(entry_id, data) for entry_id, data in entries if data]
+            for message in redis_stream_client._parse_messages(present):
+                milliseconds, sequence = parse_stream_id(message["id"])
+                rows.append(
+                    ArchivedMessage(
+                        conversation_id=conversation_id,
+                        stream_ms=milliseconds,
+                        stream_seq=sequence,
+                        user_id=message["user_id"],
+                        content=message["content"],
+                        created_at=datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc),
+                    )
+                )
+
+        if rows:
+            ArchivedMessage.objects.bulk_create(
+                rows, batch_size=self.batch_size, ignore_conflicts=True
+            )
+        if acks:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, entry_ids in acks.items():
+                pipe.xack(key, self.group, *entry_ids)
+            pipe.execute()
+
+        return sum(len(entry_ids) for entry_ids in acks.values())
+
+
+def archive_position(message_id: str) -> tuple[int, int]:
+    """Parts of a stream ID cursor, capped to what the archive columns hold"""
+    return tuple(min(part, MAX_ARCHIVED_PART) for part in parse_stream_id(message_id))
+
+
+def get_archived_page(
+    conversation_id: str,
+    from_id: str = "-",
+    before: Optional[str] = None,
+    limit: int = 50,
+) -> tuple[list[dict[str, Any]], bool]:
+    """
+    Retrieve a page of archived messages, like RedisStreamClient.get_message_page
+
+    Args:
+        conversation_id: UUID of the conversation
+        from_id: Message ID to page forward from (default: "-" for latest)
+        before: Message ID to page backward from
+        limit: Maximum number of messages to retrieve (default: 50)
+
+    Returns:
+        Tuple of (messages, has_more)
+    """
+    queryset = ArchivedMessage.objects.filter(conversation_id=conversation_id)
+    forward = from_id != "-"
+    if forward:
+        milliseconds, sequence = archive_position(from_id)
+        queryset = queryset.filter(
+            Q(stream_ms__gt=milliseconds) | Q(stream_ms=milliseconds, stream_seq__gt=sequence)
+        ).order_by("stream_ms", "stream_seq")
+    else:
+        if before:
+            milliseconds, sequence = archive_position(before)
+            queryset = queryset.filter(
+                Q(stream_ms__lt=milliseconds) | Q(stream_ms=milliseconds, stream_seq__lt=sequence)
+            )
+        queryset = queryset.order_by("-stream_ms", "-stream_seq")
+
+    rows = list(queryset.values("stream_ms", "stream_seq", "user_id", "content")[: limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not forward:
+        rows.reverse()
+
+    messages = []
+    for row in rows:
+        message_id = f"{row['stream_ms']}-{row['stream_seq']}"
+        messages.append(
+            {
+                "id": message_id,
+                "user_id": row["user_id"],
+                "username": None,
+                "content": row["content"],
+                "timestamp": stream_id_to_timestamp(message_id),
+            }
+        )
+    redis_stream_client._resolve_usernames(messages)
+    return messages, has_more
+
+
+def get_history_page(
+    conversation_id: str,
+    from_id: str = "-",
+    before: Optional[str] = None,
+    limit: int = 50,
+) -> tuple[list[dict[str, Any]], bool]:
+    """
+    Retrieve a page of history from the stream, continuing into the archive
+
+    Pages that reach past the start of the stream are completed from the
+    archive, so cursors keep working after entries are trimmed.
+
+    Args:
+        conversation_id: UUID of the conversation
+        from_id: Message ID to page forward from (default: "-" for latest)
+        before: Message ID to page backward from
+        limit: Maximum number of messages to retrieve (default: 50)
+
+    Returns:
+        Tuple of (messages, has_more)
+
+    Raises:
+        RedisStreamError: If the stream cannot be read
+    """
+    if not settings.MESSAGE_ARCHIVE["ENABLED"]:
+        return redis_stream_client.get_message_page(
+            conversation_id, from_id=from_id, before=before, limit=limit
+        )
+
+    if from_id != "-":
+        first_id = redis_stream_client.get_first_id(conversation_id)
+        if first_id is not None and parse_stream_id(first_id) <= parse_stream_id(from_id):
+            return redis_stream_client.get_message_page(
+                conversation_id, from_id=from_id, limit=limit
+            )
+        # The stream may no longer hold what follows from_id
+        messages, has_more = get_archived_page(conversation_id, from_id=from_id, limit=limit)
+        if has_more:
+            return messages, True
+        newer, has_more = redis_stream_client.get_message_page(
+            conversation_id,
+            from_id=messages[-1]["id"] if messages else from_id,
+            limit=limit - len(messages),
+        )
+        return messages + newer, has_more
+
+    messages, has_more = redis_stream_client.get_message_page(
+        conversation_id, before=before, limit=limit
+    )
+    if has_more:
+        return messages, True
+    # The page reached the start of the stream; older messages may be archived
+    older, has_more = get_archived_page(
+        conversation_id,
+        before=messages[0]["id"] if messages else before,
+        limit=limit - len(messages),
+    )
+    return older + messages, has_more
+
+
+def get_history_between(
+    conversation_id: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 50,
+) -> tuple[list[dict[str, Any]], bool]:
+    """
+    Retrieve messages within a time range, continuing into the archive
+
+    Like RedisStreamClient.get_messages_between, but ranges older than the
+    stream are read from the archive.
+
+    Args:
+        conversation_id: UUID of the conversation
+        since: Inclusive lower bound, from timestamp_to_stream_id
+        until: Inclusive upper bound, from timestamp_to_stream_id
+        limit: Maximum number of messages to retrieve (default: 50)
+
+    Returns:
+        Tuple of (messages, has_more)
+
+    Raises:
+        RedisStreamError: If the stream cannot be read
+    """
+    if not settings.MESSAGE_ARCHIVE["ENABLED"]:
+        return redis_stream_client.get_messages_between(
+            conversation_id, since=since, until=until, limit=limit
+        )
+
+    if since is None:
+        before = f"{int(until) + 1}-0" if until is not None else None
+        return get_history_page(conversation_id, before=before, limit=limit)
+
+    # One extra message tells whether the range continues past this page
+    messages, _ = get_history_page(conversation_id, from_id=_cursor_before(since), limit=limit + 1)
+    if until is not None:
+        messages = [
+            message for message in messages if parse_stream_id(message["id"])[0] <= int(until)
+        ]
+    return messages[:limit], len(messages) > limit
+
+
+def get_history_around(
+    conversation_id: str,
+    around: str,
+    limit: int = 25,
+) -> tuple[list[dict[str, Any]], bool, bool]:
+    """
+    Retrieve a window of messages around a point in time, continuing into the archive
+
+    Args:
+        conversation_id: UUID of the conversation
+        around: Millisecond stream ID bound, from timestamp_to_stream_id
+        limit: Maximum number of messages on each side (default: 25)
+
+    Returns:
+        Tuple of (messages, has_more_before, has_more_after)
+
+    Raises:
+        RedisStreamError: If the stream cannot be read
+    """
+    if not settings.MESSAGE_ARCHIVE["ENABLED"]:
+        return redis_stream_client.get_messages_around(conversation_id, around, limit=limit)
+
+    before, has_more_before = [], False
+    if int(around) > 0:
+        before, has_more_before = get_history_page(
+            conversation_id, before=f"{around}-0", limit=limit
+        )
+    after, has_more_after = get_history_page(
+        conversation_id, from_id=_cursor_before(around), limit=limit
+    )
+    return before + after, has_more_before, has_more_after
+
+
+def _cursor_before(bound: str) -> str:
+    """Exclusive from_id cursor that includes every entry of a millisecond bound"""
+    if int(bound) > 0:
+        return previous_stream_id(f"{bound}-0")
+    return "0-0"
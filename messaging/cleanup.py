@@ -0,0 +1,165 @@
+"""
+Removal of Redis keys and stored history left behind by deleted conversations
+"""
+
+import logging
+import time
+import uuid
+from typing import Optional
+
+import redis
+from django.db import DatabaseError
+
+from conversations.models import Conversation
+
+from .models import ArchivedMessage, ColdStreamChunk
+from .redis_stream import (
+    COLD_STREAMS_KEY,
+    COMPACTING_SUFFIX,
+    STREAM_KEY_PREFIX,
+    WRITTEN_STREAMS_KEY,
+    redis_stream_client,
+)
+
+logger = logging.getLogger(__name__)
+
+# Conversation keys that never expire; members:conv:* and throttle:* keys
+# carry a TTL and disappear on their own
+ORPHAN_KEY_PREFIXES = (STREAM_KEY_PREFIX, "reads:conv:")
+
+
+def conversation_keys(conversation_id) -> list[str]:
+    """Every Redis key that belongs to one conversation"""
+    stream_key = redis_stream_client._get_stream_key(conversation_id)
+    return [
+        stream_key,
+        f"{stream_key}{COMPACTING_SUFFIX}",
+        f"reads:conv:{conversation_id}",
+        f"members:conv:{conversation_id}",
+        f"members:conv:{conversation_id}:gen",
+        f"throttle:conv:{conversation_id}",
+        f"throttle:conv:{conversation_id}:bucket",
+    ]
+
+
+def conversation_id_from_key(key: str, prefix: str) -> Optional[uuid.UUID]:
+    """Conversation ID in a key such as stream:conv:{id}, or None"""
+    try:
+        return uuid.UUID(key[len(prefix) :].split(":", 1)[0])
+    except ValueError:
+        return None
+
+
+def purge_conversations(conversation_ids) -> int:
+    """
+    Delete the Redis keys, cold chunks and archived messages of conversations
+
+    Keys are removed with UNLINK, so large streams are freed in the
+    background instead of blocking Redis.
+
+    Args:
+        conversation_ids: IDs of conversations that no longer exist
+
+    Returns:
+        Number of Redis keys removed
+    """
+    conversation_ids = [str(conversation_id) for conversation_id in conversation_ids]
+    if not conversation_ids:
+        return 0
+
+    removed = 0
+    try:
+        pipe = redis_stream_client.redis_client.pipeline(transaction=False)
+        for conversation_id in conversation_ids:
+            pipe.unlink(*conversation_keys(conversation_id))
+        pipe.hdel(COLD_STREAMS_KEY, *conversation_ids)
+        stream_keys = [redis_stream_client._get_stream_key(cid) for cid in conversation_ids]
+        pipe.srem(WRITTEN_STREAMS_KEY, *stream_keys)
+        results = pipe.execute()
+        removed = sum(results[:-2]) + results[-2]
+    except redis.RedisError as e:
+        logger.error(
+            "Failed to remove conversation keys",
+            extra={"conversation_ids": conversation_ids, "error": str(e)},
+        )
+
+    try:
+        ColdStreamChunk.objects.filter(conversation_id__in=conversation_ids).delete()
+        ArchivedMessage.objects.filter(conversation_id__in=conversation_ids).delete()
+    except DatabaseError as e:
+        logger.error(
+            "Failed to remove stored conversation history",
+            extra={"conversation_ids": conversation_ids, "error": str(e)},
+        )
+    return removed
+
+
+def find_orphans(conversation_ids: set[uuid.UUID]) -> set[uuid.UUID]:
+    """The IDs without a conversation, checked in one query"""
+    existing = Conversation.objects.filter(id__in=conversation_ids).values_list("id", flat=True)
+    return conversation_ids - set(existing)
+
+
+def purge_orphans(batch_size: int = 500, dry_run: bool = False, on_orphan=None) -> dict[str, int]:
+    """
+    Walk conversation keys with SCAN and purge those of deleted conversations
+
+    Safe to run repeatedly on a live cluster: only keys whose conversation
+    row is gone are touched, and keys that are not named after a
+    conversation UUID are left alone.
+
+    Args:
+        batch_size: Keys per SCAN call and IDs checked per query
+        dry_run: Report orphans without removing anything
+        on_orphan: Optional callback for each orphaned conversation ID
+
+    Returns:
+        Totals of keys scanned, orphaned conversations and keys removed
+    """
+    client = redis_stream_client.redis_client
+    totals = {"keys": 0, "orphans": 0, "removed": 0}
+    purged = set()
+    started = time.monotonic()
+
+    def purge_batch(batch: set[uuid.UUID]):
+        orphans = find_orphans(batch) - purged
+        purged.update(orphans)
+        totals["orphans"] += len(orphans)
+        if on_orphan:
+            for conversation_id in orphans:
+                on_orphan(conversation_id)
+        if orphans and not dry_run:
+            totals["removed"] += purge_conversations(orphans)
+
+    sources = [
+        (prefix, client.scan_iter(match=f"{prefix}*", count=batch_size))
+        for prefix in ORPHAN_KEY_PREFIXES
+    ]
+    # Cold conversations are fields of one hash rather than keys
+    sources.append(
+        ("", (field for field, _ in client.hscan_iter(COLD_STREAMS_KEY, count=batch_size)))
+    )
+
+    batch = set()
+    for prefix, keys in sources:
+        for key in keys:
+            totals["keys"] += 1
+            conversation_id = conversation_id_from_key(key, prefix)
+            if conversation_id is None or conversation_id in purged:
+                continue
+            batch.add(conversation_id)
+            if len(batch) >= batch_size:
+                purge_batch(batch)
+                batch = set()
+    if batch:
+        purge_batch(batch)
+
+    logger.info(
+        "Orphaned conversation keys purged",
+        extra={
+            **totals,
+            "dry_run": dry_run,
+            "duration_ms": int((time.monotonic() - started) * 1000),
+        },
+    )
+    return totals
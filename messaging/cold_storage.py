@@ -0,0 +1,226 @@
+"""
+Compressed storage of idle conversation streams outside Redis
+"""
+
+import json
+import logging
+import time
+import uuid
+import zlib
+from typing import NamedTuple, Optional
+
+import redis
+import redis.asyncio as aioredis
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import ColdStreamChunk
+from .redis_stream import (
+    COLD_STREAMS_KEY,
+    STREAM_KEY_PREFIX,
+    parse_stream_id,
+    redis_stream_client,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CompactionResult(NamedTuple):
+    """Outcome of moving one stream out of Redis"""
+
+    key: str
+    entries: int
+    redis_bytes: int
+    stored_bytes: int
+
+
+class ColdStreamStore:
+    """
+    Moves idle conversation streams into compressed Postgres chunks
+
+    A stream whose newest entry is older than the idle threshold, and whose
+    consumer groups have processed every entry, is written to ColdStreamChunk
+    rows and removed from Redis. Its consumer group positions, length and
+    newest entry stay behind in the COLD_STREAMS_KEY hash, which marks the
+    conversation as cold and keeps inbox previews working.
+
+    Readers call ensure_hot / aensure_hot before touching a conversation's
+    stream. The stream is rebuilt under a temporary key, merged with anything
+    written while it was cold, and renamed into place.
+    """
+
+    def __init__(self, retries: int = 5):
+        """
+        Args:
+            retries: Attempts to rehydrate a stream that receives writes meanwhile
+        """
+        self.redis_client = redis_stream_client.redis_client
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.retries = retries
+
+    def compact(self, key: str, idle_ms: int, chunk_size: int) -> Optional[CompactionResult]:
+        """
+        Move one stream out of Redis if it is idle
+
+        Args:
+            key: Stream key
+            idle_ms: Minimum age of the newest entry in milliseconds
+            chunk_size: Entries per compressed chunk
+
+        Returns:
+            CompactionResult, or None if the stream was left in Redis
+        """
+        try:
+            conversation_id = uuid.UUID(key[len(STREAM_KEY_PREFIX) :])
+        except ValueError:
+            return None
+
+        try:
+            return self._compact(key, conversation_id, idle_ms, chunk_size)
+        except redis.WatchError:
+            # Written to meanwhile, so no longer idle
+            ColdStreamChunk.objects.filter(conversation_id=conversation_id).delete()
+            return None
+
+    def _compact(self, key: str, conversation_id: uuid.UUID, idle_ms: int, chunk_size: int):
+        """Compact one stream inside a WATCH on its key"""
+        with self.redis_client.pipeline() as pipe:
+            pipe.watch(key)
+            if pipe.hexists(COLD_STREAMS_KEY, str(conversation_id)):
+                # Written to while cold; rehydrating merges the two first
+                return None
+            newest = pipe.xrevrange(key, "+", "-", count=1)
+            if not newest:
+                return None
+            last_id = newest[0][0]
+            if parse_stream_id(last_id)[0] > time.time() * 1000 - idle_ms:
+                return None
+
+            groups = {}
+            for group in pipe.xinfo_groups(key):
+                if group["pending"] or group["last-delivered-id"] != last_id:
+                    # A consumer such as the archiver has not caught up
+                    return None
+                groups[group["name"]] = group["last-delivered-id"]
+
+            redis_bytes = pipe.memory_usage(key) or 0
+            entries = pipe.xrange(key)
+
+            chunks = []
+            for index, start in enumerate(range(0, len(entries), chunk_size)):
+                chunk = entries[start : start + chunk_size]
+                chunks.append(
+                    ColdStreamChunk(
+                        conversation_id=conversation_id,
+                        index=index,
+                        first_id=chunk[0][0],
+                        last_id=chunk[-1][0],
+                        entry_count=len(chunk),
+                        data=zlib.compress(json.dumps(chunk).encode()),
+                    )
+                )
+            with transaction.atomic():
+                ColdStreamChunk.objects.filter(conversation_id=conversation_id).delete()
+                ColdStreamChunk.objects.bulk_create(chunks)
+
+            meta = {"groups": groups, "length": len(entries), "last": list(newest[0])}
+            pipe.multi()
+            pipe.hset(COLD_STREAMS_KEY, str(conversation_id), json.dumps(meta))
+            pipe.unlink(key)
+            pipe.execute()
+
+        return CompactionResult(
+            key, len(entries), redis_bytes, sum(len(chunk.data) for chunk in chunks)
+        )
+
+    def ensure_hot(self, conversation_id) -> bool:
+        """
+        Rehydrate a conversation's stream if it was moved out of Redis
+
+        Args:
+            conversation_id: UUID of the conversation
+
+        Returns:
+            True if the stream was rehydrated
+        """
+        conversation_id = str(conversation_id)
+        try:
+            if not self.redis_client.hexists(COLD_STREAMS_KEY, conversation_id):
+                return False
+            for _ in range(self.retries):
+                try:
+                    return self._rehydrate(conversation_id)
+                except redis.WatchError:
+                    continue
+            logger.warning(
+                "Stream rehydration kept conflicting with writes",
+                extra={"conversation_id": conversation_id},
+            )
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to rehydrate stream",
+                extra={"conversation_id": conversation_id, "error": str(e)},
+            )
+        return False
+
+    async def aensure_hot(self, conversation_id) -> bool:
+        """Rehydrate a conversation's stream without blocking the event loop"""
+        try:
+            if not await self.async_redis_client.hexists(COLD_STREAMS_KEY, str(conversation_id)):
+                return False
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to check for a cold stream",
+                extra={"conversation_id": str(conversation_id), "error": str(e)},
+            )
+            return False
+        return await database_sync_to_async(self.ensure_hot)(conversation_id)
+
+    def _rehydrate(self, conversation_id: str) -> bool:
+        """Rebuild a stream under a temporary key and rename it into place"""
+        key = redis_stream_client._get_stream_key(conversation_id)
+        # Outside the stream key space so SCANs for streams never see it
+        temp_key = f"rehydrating:{conversation_id}:{uuid.uuid4().hex}"
+        try:
+            chunks = list(
+                ColdStreamChunk.objects.filter(conversation_id=conversation_id).order_by("index")
+            )
+            for chunk in chunks:
+                writer = self.redis_client.pipeline(transaction=False)
+                for entry_id, fields in json.loads(zlib.decompress(bytes(chunk.data))):
+                    writer.xadd(temp_key, fields, id=entry_id)
+                writer.execute()
+
+            with self.redis_client.pipeline() as pipe:
+                pipe.watch(key)
+                meta = pipe.hget(COLD_STREAMS_KEY, conversation_id)
+                if meta is None:
+                    # Rehydrated by someone else meanwhile
+                    return False
+
+                # Messages sent while the conversation was cold come after it
+                newer = pipe.xrange(key)
+                if newer:
+                    writer = self.redis_client.pipeline(transaction=False)
+                    for entry_id, fields in newer:
+                        writer.xadd(temp_key, fields, id=entry_id)
+                    writer.execute()
+
+                pipe.multi()
+                if newer or chunks:
+                    pipe.rename(temp_key, key)
+                    for name, last_delivered_id in json.loads(meta)["groups"].items():
+                        pipe.xgroup_create(key, name, id=last_delivered_id)
+                pipe.hdel(COLD_STREAMS_KEY, conversation_id)
+                pipe.execute()
+        finally:
+            self.redis_client.delete(temp_key)
+
+        ColdStreamChunk.objects.filter(conversation_id=conversation_id).delete()
+        logger.info("Stream rehydrated", extra={"conversation_id": conversation_id})
+        return True
+
+
+# Singleton instance
+cold_streams = ColdStreamStore()
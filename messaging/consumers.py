@@ -1,27 +1,596 @@
+import asyncio
 import json
 import logging
+import time
+import uuid
+from collections import deque
+from functools import cached_property
+from urllib.parse import parse_qs
 
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
-from conversations.models import Participant
-
-from .redis_stream import RedisStreamError, redis_stream_client
-from .throttle import message_throttler
+from conversations.membership import membership_cache
+
+from .cold_storage import cold_streams
+from .fanout import STREAM, get_fanout_engine, stream_fanout
+from .read_cursors import read_cursors
+from .redis_stream import (
+    STREAM_ID_RE,
+    RedisStreamError,
+    async_redis_stream_client,
+    parse_stream_id,
+)
+from .send_queue import SendQueue, send_queue_metrics
+from .shutdown import install_shutdown_handler, open_connections
+from .throttle import CONVERSATION, USER, async_message_throttler
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+THROTTLE_MESSAGES = {
+    USER: "You are sending too many messages across conversations. Please slow down.",
+    CONVERSATION: "This conversation is receiving too many messages. Please wait.",
+}
+
+
+MESSAGE_FRAME_PREFIX = '{"type": "message", "message": '
+
+
+def get_group_name(conversation_id: str) -> str:
+    """Channel layer group for a conversation"""
+    return f"chat_{conversation_id}"
+
+
+def build_message(message: dict, conversation_id: str) -> dict:
+    """Fields of a stored message as sent to clients in message frames"""
+    return {
+        "id": message["id"],
+        "user_id": message["user_id"],
+        "username": message["username"],
+        "content": message["content"],
+        "conversation_id": conversation_id,
+    }
+
+
+def encode_message_frame(message: dict) -> str:
+    """Encode a single-message frame; batching relies on its fixed prefix"""
+    return f"{MESSAGE_FRAME_PREFIX}{json.dumps(message)}}}"
+
+
+class BaseChatConsumer(AsyncWebsocketConsumer):
+    """
+    Message handling shared by the single-conversation and multiplexed consumers
+
+    A reconnecting client passes the ID of the last message it saw and is
+    sent the messages it missed from the conversation stream before live
+    delivery. Live messages arriving meanwhile are held back until the
+    replay is sent, and those it already contained are skipped. If the gap
+    is too large to replay it is sent a `resync` frame and should refetch
+    history over the REST API instead.
+
+    Clients that connect with `coalesce=1` may have live messages buffered
+    for CHAT_WEBSOCKET["COALESCE_MS"] and delivered together as one
+    `{"type": "messages", "messages": [...]}` frame.
+
+    `message.read` frames move the user's read cursor. They are debounced
+    for CHAT_WEBSOCKET["READ_DEBOUNCE_MS"] and stored together, and sending
+    a message marks it read for its sender.
+
+    Live messages arrive through the channel layer group of the
+    conversation, or, with CHAT_WEBSOCKET["FANOUT"] set to "stream", from
+    the worker's own read of the conversation stream (see StreamFanout).
+    They wait in a bounded SendQueue of CHAT_WEBSOCKET["SEND_QUEUE_SIZE"]
+    frames until written. Writing to the transport never blocks under most
+    ASGI servers, so the pace of the client is measured instead: each ping
+    notes how many frames had been written, and as clients answer pings in
+    order, each pong acknowledges the frames up to its ping. Once
+    CHAT_WEBSOCKET["SEND_WINDOW"] frames are unacknowledged, frames are held
+    back in the queue, and a ping is sent whenever half a window has gone
+    out since the last one. If a slow client lets the queue fill, the
+    "drop_oldest" SLOW_CLIENT_POLICY replaces the dropped messages with a
+    `resync` frame, and the "close" policy closes the connection with code
+    4008.
+
+    Every CHAT_WEBSOCKET["HEARTBEAT_SECONDS"] the server sends a
+    `{"type": "ping"}` frame, which clients answer with `{"type": "pong"}`.
+    A connection that sends nothing for IDLE_TIMEOUT_SECONDS is taken out
+    of its conversations right away and closed with code 4408.
+
+    When the worker gets SIGTERM, open connections are closed with code
+    4503 and a `{"retry_after": seconds}` reason, spread out so clients do
+    not all reconnect at once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # conversation_id -> ID of the newest message replayed; live copies
+        # up to it are skipped
+        self.last_replayed_ids = {}
+        # conversation_id -> live events held back while a replay runs
+        self.held_events = {}
+        # Encoded messages waiting for the next coalesced frame
+        self.outbox = []
+        self.flush_task = None
+        # conversation_id -> newest message ID read, not yet stored
+        self.pending_reads = {}
+        self.reads_task = None
+        self.send_queue = None
+        self.send_task = None
+        # Live frames written, and how many of them the client acknowledged
+        self.frames_sent = 0
+        self.frames_acked = 0
+        # frames_sent at each ping not answered yet, oldest first
+        self.unanswered_pings = deque()
+        # Conversations whose live messages this connection receives
+        self.joined_conversations = set()
+        self.last_seen = time.monotonic()
+        self.heartbeat_task = None
+
+    def get_query_param(self, name: str):
+        """Return a query string parameter of the connection, or None"""
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        return query.get(name, [None])[0]
+
+    @cached_property
+    def stream_fanout(self) -> bool:
+        """Whether live messages are read from the streams by this worker"""
+        return get_fanout_engine() == STREAM
+
+    async def join_conversation(self, conversation_id: str):
+        """Start receiving live messages of a conversation"""
+        self.joined_conversations.add(conversation_id)
+        if self.stream_fanout:
+            await stream_fanout.subscribe(conversation_id, self)
+        else:
+            await self.channel_layer.group_add(get_group_name(conversation_id), self.channel_name)
+
+    async def leave_conversation(self, conversation_id: str):
+        """Stop receiving live messages of a conversation"""
+        if conversation_id not in self.joined_conversations:
+            return
+        self.joined_conversations.discard(conversation_id)
+        self.held_events.pop(conversation_id, None)
+        if self.stream_fanout:
+            stream_fanout.unsubscribe(conversation_id, self)
+        else:
+            await self.channel_layer.group_discard(
+                get_group_name(conversation_id),
+                self.channel_name,
+            )
+
+    def connection_accepted(self):
+        """Register an accepted connection for heartbeats and graceful shutdown"""
+        open_connections.add(self)
+        install_shutdown_handler()
+        self.start_heartbeat()
+
+    async def close_with_retry_after(self, code: int, retry_after: float):
+        """Leave all conversations and close, telling the client when to reconnect"""
+        for conversation_id in list(self.joined_conversations):
+            await self.leave_conversation(conversation_id)
+        await self.base_send(
+            {
+                "type": "websocket.close",
+                "code": code,
+                "reason": json.dumps({"retry_after": retry_after}),
+            }
+        )
+
+    def start_heartbeat(self):
+        """Start pinging the client once the connection is accepted"""
+        self.last_seen = time.monotonic()
+        if settings.CHAT_WEBSOCKET["HEARTBEAT_SECONDS"] and self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+
+    async def heartbeat(self):
+        """Ping the client, and reap the connection once it stops responding"""
+        interval = settings.CHAT_WEBSOCKET["HEARTBEAT_SECONDS"]
+        idle_timeout = settings.CHAT_WEBSOCKET["IDLE_TIMEOUT_SECONDS"]
+        while True:
+            await asyncio.sleep(min(interval, idle_timeout))
+            idle = time.monotonic() - self.last_seen
+            if idle >= idle_timeout:
+                logger.info(
+                    "Closing idle WebSocket connection",
+                    extra={"user_id": self.user.id, "idle_seconds": round(idle, 1)},
+                )
+                self.heartbeat_task = None
+                # A half-open connection may not report its disconnect for
+                # a long time, so stop delivering to it now
+                for conversation_id in list(self.joined_conversations):
+                    await self.leave_conversation(conversation_id)
+                await self.close(code=4408)
+                return
+            await self.send_ping()
+
+    async def send_ping(self):
+        """Ping the client, noting the frames its pong will acknowledge"""
+        self.unanswered_pings.append(self.frames_sent)
+        await self.send(text_data='{"type": "ping"}')
+
+    def pong_received(self):
+        """Acknowledge the frames written before the oldest unanswered ping"""
+        if self.unanswered_pings:
+            self.frames_acked = max(self.frames_acked, self.unanswered_pings.popleft())
+        if self.send_queue and self.send_task is None:
+            self.send_task = asyncio.create_task(self.drain_send_queue())
+
+    async def websocket_receive(self, message):
+        """Note client activity and answer heartbeats before normal handling"""
+        self.last_seen = time.monotonic()
+        text = message.get("text")
+        if text and '"pong"' in text:
+            try:
+                if json.loads(text).get("type") == "pong":
+                    self.pong_received()
+                    return
+            except (ValueError, AttributeError):
+                pass
+        await super().websocket_receive(message)
+
+    @cached_property
+    def coalesce_ms(self) -> int:
+        """Delay for coalescing live messages, 0 if disabled for this connection"""
+        if self.get_query_param("coalesce") != "1":
+            return 0
+        return settings.CHAT_WEBSOCKET["COALESCE_MS"]
+
+    async def handle_message_send(self, conversation_id: str, data: dict):
+        """Handle message send request"""
+        content = data.get("content", "").strip()
+
+        # Validate content length
+        if not content or len(content) < 1:
+            await self.send_error(
+                "INVALID_CONTENT",
+                "Message content is required",
+                conversation_id=conversation_id,
+            )
+            return
+
+        if len(content) > 2000:
+            await self.send_error(
+                "CONTENT_TOO_LONG",
+                "Message content must be 2000 characters or less",
+                conversation_id=conversation_id,
+            )
+            return
+
+        # Check throttling
+        throttle = await async_message_throttler.check(self.user.id, conversation_id)
+        if not throttle.allowed:
+            await self.send_error(
+                "THROTTLED",
+                THROTTLE_MESSAGES.get(
+                    throttle.limit,
+                    "You are sending messages too quickly. Please slow down.",
+                ),
+                conversation_id=conversation_id,
+                limit=throttle.limit,
+                retry_after=throttle.retry_after,
+            )
+            return
+
+        # Add message to Redis Stream
+        try:
+            message_id = await async_redis_stream_client.add_message(
+                conversation_id,
+                self.user.id,
+                self.user.username,
+                content,
+            )
+
+            if not self.stream_fanout:
+                # Broadcast message to room group, encoded once for all recipients
+                message = build_message(
+                    {
+                        "id": message_id,
+                        "user_id": self.user.id,
+                        "username": self.user.username,
+                        "content": content,
+                    },
+                    conversation_id,
+                )
+                await self.channel_layer.group_send(
+                    get_group_name(conversation_id),
+                    {
+                        "type": "chat_message",
+                        "id": message_id,
+                        "conversation_id": conversation_id,
+                        "text": encode_message_frame(message),
+                    },
+                )
+
+            self.queue_read(conversation_id, message_id)
+
+            logger.info(
+                "Message sent",
+                extra={
+                    "user_id": self.user.id,
+                    "conversation_id": conversation_id,
+                    "message_id": message_id,
+                },
+            )
+
+        except RedisStreamError as e:
+            logger.error(
+                "Failed to add message to Redis Stream",
+                extra={
+                    "user_id": self.user.id,
+                    "conversation_id": conversation_id,
+                    "error": str(e),
+                },
+            )
+            await self.send_error(
+                "STORAGE_ERROR",
+                "Failed to save message",
+                conversation_id=conversation_id,
+            )
+
+    def hold_live_messages(self, conversation_id: str):
+        """
+        Hold back live messages of a conversation until its replay is sent
+
+        Stream fan-out hands messages to chat_message from its own task
+        rather than through this consumer's handler queue, so without this a
+        message written between joining and reading the replay would go out
+        live first and then again in the replay.
+        """
+        self.held_events.setdefault(conversation_id, [])
+
+    async def replay_messages(self, conversation_id: str, last_id: str):
+        """Send messages missed since last_id, or ask the client to refetch"""
+        self.hold_live_messages(conversation_id)
+        try:
+            await self.send_replay(conversation_id, last_id)
+        finally:
+            # Released after last_replayed_ids is set, so copies are skipped
+            for event in self.held_events.pop(conversation_id, []):
+                await self.chat_message(event)
+
+    async def send_replay(self, conversation_id: str, last_id: str):
+        """Send the messages of a replay, or a resync frame"""
+        messages = None
+        if STREAM_ID_RE.match(last_id):
+            try:
+                messages = await async_redis_stream_client.get_messages_since(
+                    conversation_id,
+                    last_id,
+                    limit=settings.CHAT_WEBSOCKET["REPLAY_LIMIT"],
+                )
+            except RedisStreamError:
+                # Already logged by the client; fall back to a refetch
+                pass
+
+        if messages is None:
+            logger.info(
+                "WebSocket replay gap too large",
+                extra={
+                    "user_id": self.user.id,
+                    "conversation_id": conversation_id,
+                    "last_id": last_id,
+                },
+            )
+            await self.send(
+                text_data=json.dumps(
+                    {
+                        "type": "resync",
+                        "conversation_id": conversation_id,
+                        "last_id": last_id,
+                    }
+                )
+            )
+            return
+
+        for message in messages:
+            await self.send(text_data=encode_message_frame(build_message(message, conversation_id)))
+
+        self.last_replayed_ids[conversation_id] = messages[-1]["id"] if messages else last_id
+
+    async def chat_message(self, event):
+        """
+        Handle broadcast message from group
+
+        The sender ships the ready-to-send frame as `text`, which is forwarded
+        verbatim. Events carrying a `message` dict instead (from workers on an
+        older release during a deploy) are encoded here.
+        """
+        if "text" in event:
+            message_id, conversation_id = event["id"], event["conversation_id"]
+        else:
+            message_id = event["message"]["id"]
+            conversation_id = event["message"]["conversation_id"]
+
+        held = self.held_events.get(conversation_id)
+        if held is not None:
+            held.append(event)
+            return
+
+        # Already delivered by replay
+        last_replayed_id = self.last_replayed_ids.get(conversation_id)
+        if last_replayed_id and parse_stream_id(message_id) <= parse_stream_id(last_replayed_id):
+            return
+
+        text = event.get("text") or encode_message_frame(event["message"])
+        await self.queue_message_frame(conversation_id, message_id, text)
+
+    async def queue_message_frame(self, conversation_id: str, message_id: str, text: str):
+        """Queue a live message frame, applying the slow client policy when full"""
+        if self.send_queue is None:
+            self.send_queue = SendQueue(
+                settings.CHAT_WEBSOCKET["SEND_QUEUE_SIZE"],
+                settings.CHAT_WEBSOCKET["SLOW_CLIENT_POLICY"],
+            )
+        elif self.send_queue.closed:
+            return
+
+        if not self.send_queue.put(conversation_id, message_id, text):
+            logger.warning(
+                "Closing WebSocket of slow client",
+                extra={
+                    "user_id": self.user.id,
+                    "conversation_id": conversation_id,
+                    "queue_depth": len(self.send_queue),
+                },
+            )
+            send_queue_metrics.closed += 1
+            self.send_queue.close()
+            await self.close(code=4008)
+            return
+
+        if self.send_task is None:
+            self.send_task = asyncio.create_task(self.drain_send_queue())
+
+    async def drain_send_queue(self):
+        """Write queued frames to the client while its send window has room"""
+        window = settings.CHAT_WEBSOCKET["SEND_WINDOW"]
+        try:
+            while not window or self.frames_sent - self.frames_acked < window:
+                frame = self.send_queue.get()
+                if frame is None:
+                    break
+                if frame.text is None:
+                    await self.send(
+                        text_data=json.dumps(
+                            {
+                                "type": "resync",
+                                "conversation_id": frame.conversation_id,
+                                "last_id": frame.message_id,
+                            }
+                        )
+                    )
+                else:
+                    await self.send_message_frame(frame.text)
+                self.frames_sent += 1
+
+                # Ask for an acknowledgement every half window
+                last_ping = (
+                    self.unanswered_pings[-1] if self.unanswered_pings else self.frames_acked
+                )
+                if window and self.frames_sent - last_ping >= max(window // 2, 1):
+                    await self.send_ping()
+        except Exception as e:
+            logger.error(
+                "Failed to write queued WebSocket frames",
+                extra={"user_id": self.user.id, "error": str(e)},
+            )
+        finally:
+            self.send_task = None
+
+    async def send_message_frame(self, text: str):
+        """Send a single-message frame now, or buffer it when coalescing"""
+        if not self.coalesce_ms:
+            await self.send(text_data=text)
+            return
+
+        self.outbox.append(text[len(MESSAGE_FRAME_PREFIX) : -1])
+        if len(self.outbox) >= settings.CHAT_WEBSOCKET["COALESCE_MAX_BATCH"]:
+            await self.flush_outbox()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_outbox_later())
+
+    async def flush_outbox_later(self):
+        """Flush buffered messages once the coalescing delay has passed"""
+        await asyncio.sleep(self.coalesce_ms / 1000)
+        self.flush_task = None
+        await self.flush_outbox()
+
+    async def flush_outbox(self):
+        """Send buffered messages, as a batch frame if there is more than one"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        self.flush_task = None
+
+        messages, self.outbox = self.outbox, []
+        if len(messages) == 1:
+            await self.send(text_data=f"{MESSAGE_FRAME_PREFIX}{messages[0]}}}")
+        elif messages:
+            await self.send(
+                text_data=f'{{"type": "messages", "messages": [{", ".join(messages)}]}}'
+            )
+
+    async def handle_message_read(self, conversation_id: str, data: dict):
+        """Handle a read receipt for the newest message the client has shown"""
+        message_id = str(data.get("message_id", ""))
+        if not STREAM_ID_RE.match(message_id):
+            await self.send_error(
+                "INVALID_MESSAGE_ID",
+                "A valid message_id is required",
+                conversation_id=conversation_id,
+            )
+            return
+        self.queue_read(conversation_id, message_id)
+
+    def queue_read(self, conversation_id: str, message_id: str):
+        """Remember a read cursor to store once the debounce delay has passed"""
+        pending = self.pending_reads.get(conversation_id)
+        if pending is None or parse_stream_id(message_id) > parse_stream_id(pending):
+            self.pending_reads[conversation_id] = message_id
+        if self.reads_task is None:
+            self.reads_task = asyncio.create_task(self.store_reads_later())
+
+    async def store_reads_later(self):
+        """Store queued read cursors once the debounce delay has passed"""
+        await asyncio.sleep(settings.CHAT_WEBSOCKET["READ_DEBOUNCE_MS"] / 1000)
+        self.reads_task = None
+        await self.store_reads()
+
+    async def store_reads(self):
+        """Store queued read cursors in one round trip"""
+        if self.reads_task is not None:
+            self.reads_task.cancel()
+        self.reads_task = None
+
+        reads, self.pending_reads = self.pending_reads, {}
+        if reads:
+            await read_cursors.amark_read(self.user.id, reads)
+
+    async def websocket_disconnect(self, message):
+        """Drop buffered messages and store read cursors before teardown"""
+        open_connections.discard(self)
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.outbox = []
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        if self.send_task is not None:
+            self.send_task.cancel()
+            self.send_task = None
+        if self.send_queue is not None and not self.send_queue.closed:
+            self.send_queue.close()
+        await self.store_reads()
+        await super().websocket_disconnect(message)
+
+    async def send_error(self, code: str, message: str, **extra):
+        """Send error message to client, with any extra fields for the code"""
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "error",
+                    "code": code,
+                    "message": message,
+                    **extra,
+                }
+            )
+        )
+
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(BaseChatConsumer):
     """
     WebSocket consumer for chat messages
+
+    The last seen message ID for replay is passed as a `last_id` query
+    parameter or in a `resume` frame.
     """
 
     async def connect(self):
         """Handle WebSocket connection"""
         self.conversation_id = self.scope["url_route"]["kwargs"]["conversation_id"]
-        self.room_group_name = f"chat_{self.conversation_id}"
+        self.room_group_name = get_group_name(self.conversation_id)
         self.user = self.scope["user"]
 
         # Check authentication
@@ -33,18 +602,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close(code=4001)
             return
 
-        # Check if user is a participant (sync to async)
+        # Check if user is a participant
         try:
-            from channels.db import database_sync_to_async
-
-            @database_sync_to_async
-            def is_participant():
-                return Participant.objects.filter(
-                    conversation_id=self.conversation_id,
-                    user=self.user,
-                ).exists()
-
-            if not await is_participant():
+            if not await membership_cache.ais_participant(self.conversation_id, self.user.id):
                 logger.warning(
                     "Non-participant WebSocket connection attempt",
                     extra={
@@ -67,10 +627,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close(code=4500)
             return
 
+        # Bring an idle conversation's stream back into Redis before use
+        await cold_streams.aensure_hot(self.conversation_id)
+
+        last_id = self.get_query_param("last_id")
+        if last_id:
+            self.hold_live_messages(self.conversation_id)
+
         # Join room group
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.join_conversation(self.conversation_id)
 
         await self.accept()
+        self.connection_accepted()
 
         logger.info(
             "WebSocket connection established",
@@ -80,13 +648,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             },
         )
 
+        if last_id:
+            await self.replay_messages(self.conversation_id, last_id)
+
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
         if hasattr(self, "room_group_name"):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name,
-            )
+            await self.leave_conversation(self.conversation_id)
 
             logger.info(
                 "WebSocket connection closed",
@@ -101,10 +669,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
         """Handle incoming WebSocket messages"""
         try:
             data = json.loads(text_data)
+            if not isinstance(data, dict):
+                await self.send_error("INVALID_JSON", "Expected a JSON object")
+                return
             message_type = data.get("type")
 
             if message_type == "message.send":
-                await self.handle_message_send(data)
+                await self.handle_message_send(self.conversation_id, data)
+            elif message_type == "message.read":
+                await self.handle_message_read(self.conversation_id, data)
+            elif message_type == "resume":
+                await self.replay_messages(self.conversation_id, str(data.get("last_id", "")))
             else:
                 await self.send_error(
                     "INVALID_TYPE",
@@ -124,102 +699,149 @@ class ChatConsumer(AsyncWebsocketConsumer):
             )
             await self.send_error("INTERNAL_ERROR", "An error occurred")
 
-    async def handle_message_send(self, data: dict):
-        """Handle message send request"""
-        content = data.get("content", "").strip()
 
-        # Validate content length
-        if not content or len(content) < 1:
-            await self.send_error("INVALID_CONTENT", "Message content is required")
-            return
+class MultiplexChatConsumer(BaseChatConsumer):
+    """
+    WebSocket consumer carrying any number of the user's conversations
 
-        if len(content) > 2000:
-            await self.send_error(
-                "CONTENT_TOO_LONG",
-                "Message content must be 2000 characters or less",
-            )
-            return
+    Every client frame names its conversation:
+    - {"type": "subscribe", "conversation_id": ..., "last_id": ... (optional)}
+    - {"type": "unsubscribe", "conversation_id": ...}
+    - {"type": "message.send", "conversation_id": ..., "content": ...}
+    - {"type": "message.read", "conversation_id": ..., "message_id": ...}
+    - {"type": "resume", "conversation_id": ..., "last_id": ...}
 
-        # Check throttling
-        if not message_throttler.is_allowed(self.user.id, self.conversation_id):
-            await self.send_error(
-                "THROTTLED",
-                "You are sending messages too quickly. Please slow down.",
-            )
+    Membership is checked per subscription, and messages can only be sent
+    to subscribed conversations.
+    """
+
+    async def connect(self):
+        """Handle WebSocket connection"""
+        self.user = self.scope["user"]
+        self.subscriptions = set()
+
+        # Check authentication
+        if not self.user.is_authenticated:
+            logger.warning("Unauthenticated multiplexed WebSocket connection attempt")
+            await self.close(code=4001)
             return
 
-        # Add message to Redis Stream
-        try:
-            from channels.db import database_sync_to_async
-
-            @database_sync_to_async
-            def add_to_stream():
-                return redis_stream_client.add_message(
-                    self.conversation_id,
-                    self.user.id,
-                    self.user.username,
-                    content,
-                )
+        await self.accept()
+        self.connection_accepted()
 
-            message_id = await add_to_stream()
+        logger.info(
+            "Multiplexed WebSocket connection established",
+            extra={"user_id": self.user.id},
+        )
 
-            # Broadcast message to room group
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": {
-                        "id": message_id,
-                        "user_id": self.user.id,
-                        "user_email": self.user.email,
-                        "username": self.user.username,
-                        "content": content,
-                        "conversation_id": self.conversation_id,
-                    },
-                },
-            )
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        for conversation_id in getattr(self, "subscriptions", ()):
+            await self.leave_conversation(conversation_id)
 
-            logger.info(
-                "Message sent",
-                extra={
-                    "user_id": self.user.id,
-                    "conversation_id": self.conversation_id,
-                    "message_id": message_id,
-                },
-            )
+        logger.info(
+            "Multiplexed WebSocket connection closed",
+            extra={
+                "user_id": getattr(self.user, "id", None),
+                "close_code": close_code,
+            },
+        )
 
-        except RedisStreamError as e:
+    async def receive(self, text_data):
+        """Handle incoming WebSocket messages"""
+        try:
+            data = json.loads(text_data)
+            if not isinstance(data, dict):
+                await self.send_error("INVALID_JSON", "Expected a JSON object")
+                return
+            message_type = data.get("type")
+
+            try:
+                conversation_id = str(uuid.UUID(str(data.get("conversation_id"))))
+            except ValueError:
+                await self.send_error("INVALID_CONVERSATION", "A valid conversation_id is required")
+                return
+
+            if message_type == "subscribe":
+                await self.subscribe(conversation_id, data.get("last_id"))
+            elif message_type == "unsubscribe":
+                await self.unsubscribe(conversation_id)
+            elif conversation_id not in self.subscriptions:
+                await self.send_error(
+                    "NOT_SUBSCRIBED",
+                    "Subscribe to the conversation first",
+                    conversation_id=conversation_id,
+                )
+            elif message_type == "message.send":
+                await self.handle_message_send(conversation_id, data)
+            elif message_type == "message.read":
+                await self.handle_message_read(conversation_id, data)
+            elif message_type == "resume":
+                await self.replay_messages(conversation_id, str(data.get("last_id", "")))
+            else:
+                await self.send_error(
+                    "INVALID_TYPE",
+                    f"Unknown message type: {message_type}",
+                )
+
+        except json.JSONDecodeError:
+            await self.send_error("INVALID_JSON", "Invalid JSON format")
+        except Exception as e:
             logger.error(
-                "Failed to add message to Redis Stream",
+                "Error processing WebSocket message",
                 extra={
                     "user_id": self.user.id,
-                    "conversation_id": self.conversation_id,
                     "error": str(e),
                 },
             )
-            await self.send_error("STORAGE_ERROR", "Failed to save message")
+            await self.send_error("INTERNAL_ERROR", "An error occurred")
 
-    async def chat_message(self, event):
-        """Handle broadcast message from group"""
-        message = event["message"]
+    async def subscribe(self, conversation_id: str, last_id=None):
+        """Start delivering a conversation on this connection"""
+        if conversation_id not in self.subscriptions:
+            if len(self.subscriptions) >= settings.CHAT_WEBSOCKET["MAX_SUBSCRIPTIONS"]:
+                await self.send_error(
+                    "TOO_MANY_SUBSCRIPTIONS",
+                    "Unsubscribe from a conversation first",
+                    conversation_id=conversation_id,
+                )
+                return
+
+            if not await membership_cache.ais_participant(conversation_id, self.user.id):
+                logger.warning(
+                    "Non-participant WebSocket subscription attempt",
+                    extra={
+                        "user_id": self.user.id,
+                        "conversation_id": conversation_id,
+                    },
+                )
+                await self.send_error(
+                    "FORBIDDEN",
+                    "You are not a participant in this conversation",
+                    conversation_id=conversation_id,
+                )
+                return
+
+            await cold_streams.aensure_hot(conversation_id)
+            if last_id:
+                self.hold_live_messages(conversation_id)
+            await self.join_conversation(conversation_id)
+            self.subscriptions.add(conversation_id)
 
         await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "message",
-                    "message": message,
-                }
-            )
+            text_data=json.dumps({"type": "subscribed", "conversation_id": conversation_id})
         )
 
-    async def send_error(self, code: str, message: str):
-        """Send error message to client"""
+        if last_id:
+            await self.replay_messages(conversation_id, str(last_id))
+
+    async def unsubscribe(self, conversation_id: str):
+        """Stop delivering a conversation on this connection"""
+        if conversation_id in self.subscriptions:
+            await self.leave_conversation(conversation_id)
+            self.subscriptions.discard(conversation_id)
+            self.last_replayed_ids.pop(conversation_id, None)
+
         await self.send(
-            text_data=json.dumps(
-                {
-                    "type": "error",
-                    "code": code,
-                    "message": message,
-                }
-            )
+            text_data=json.dumps({"type": "unsubscribed", "conversation_id": conversation_id})
         )
@@ -0,0 +1,173 @@
+"""
+Delivery of new stream entries to this worker's WebSockets
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from .redis_stream import async_redis_stream_client
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_LAYER = "channel_layer"
+STREAM = "stream"
+
+# Keeps a dead worker's wake-up stream from lingering
+WAKE_KEY_TTL_SECONDS = 3600
+
+
+def get_fanout_engine() -> str:
+    """Delivery engine from settings.CHAT_WEBSOCKET["FANOUT"]"""
+    return settings.CHAT_WEBSOCKET.get("FANOUT", CHANNEL_LAYER)
+
+
+class StreamFanout:
+    """
+    Per-worker fan-out that reads conversation streams directly
+
+    With the channel layer, every message is written to the stream and then
+    copied into the channel of every recipient socket. Here each worker
+    instead runs one blocking XREAD over the streams of the conversations
+    its sockets are subscribed to, and hands each new entry to those sockets
+    in-process. Redis work per message then grows with the number of
+    workers, not with the number of recipients.
+
+    A subscription to a conversation the worker was not reading yet starts
+    at the stream's newest entry and interrupts the running XREAD through a
+    private wake-up stream, so the next read includes it.
+    """
+
+    def __init__(self, block_ms: int = 5000, count: int = 100):
+        """
+        Args:
+            block_ms: Longest a single XREAD blocks
+            count: Most entries read per stream and call
+        """
+        self.redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.block_ms = block_ms
+        self.count = count
+        self.wake_key = f"fanout:wake:{uuid.uuid4().hex}"
+        # conversation_id -> subscribed consumers
+        self.subscribers = {}
+        # conversation_id -> ID of the newest entry dispatched
+        self.positions = {}
+        self.task = None
+
+    async def subscribe(self, conversation_id: str, consumer):
+        """
+        Deliver new messages of a conversation to a consumer
+
+        Args:
+            conversation_id: UUID of the conversation
+            consumer: Consumer whose chat_message handler receives each message
+        """
+        conversation_id = str(conversation_id)
+        subscribers = self.subscribers.get(conversation_id)
+        if subscribers is not None:
+            subscribers.add(consumer)
+            return
+
+        # Registered first so concurrent subscribers share the set; the
+        # stream is only read once it has a position
+        self.subscribers[conversation_id] = {consumer}
+        try:
+            newest = await self.redis_client.xrevrange(
+                async_redis_stream_client._get_stream_key(conversation_id), "+", "-", count=1
+            )
+            position = newest[0][0] if newest else "0-0"
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to read stream position for fan-out",
+                extra={"conversation_id": conversation_id, "error": str(e)},
+            )
+            position = f"{int(time.time() * 1000)}-0"
+        if conversation_id not in self.subscribers:
+            return
+        self.positions[conversation_id] = position
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        else:
+            await self.wake()
+
+    def unsubscribe(self, conversation_id: str, consumer):
+        """Stop delivering a conversation to a consumer"""
+        conversation_id = str(conversation_id)
+        subscribers = self.subscribers.get(conversation_id)
+        if subscribers is None:
+            return
+        subscribers.discard(consumer)
+        if not subscribers:
+            # The running XREAD still includes it; its entries are ignored
+            del self.subscribers[conversation_id]
+            self.positions.pop(conversation_id, None)
+
+    async def wake(self):
+        """Interrupt the running XREAD so it picks up new subscriptions"""
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xadd(self.wake_key, {"w": 1}, maxlen=1, approximate=False)
+            pipe.expire(self.wake_key, WAKE_KEY_TTL_SECONDS)
+            await pipe.execute()
+        except redis.RedisError as e:
+            # The subscription is picked up once the current XREAD times out
+            logger.error("Failed to wake stream fan-out", extra={"error": str(e)})
+
+    async def run(self):
+        """Read and dispatch new entries while any conversation has subscribers"""
+        wake_id = "$"
+        while self.subscribers:
+            streams = {
+                async_redis_stream_client._get_stream_key(cid): pos
+                for cid, pos in self.positions.items()
+            }
+            streams[self.wake_key] = wake_id
+            try:
+                response = await self.redis_client.xread(
+                    streams, count=self.count, block=self.block_ms
+                )
+                for key, entries in response or []:
+                    if key == self.wake_key:
+                        wake_id = entries[-1][0]
+                        continue
+                    await self.dispatch(key.rsplit(":", 1)[-1], entries)
+            except redis.RedisError as e:
+                logger.error("Stream fan-out read failed", extra={"error": str(e)})
+                await asyncio.sleep(1)
+
+    async def dispatch(self, conversation_id: str, entries: list):
+        """Encode new entries once and hand them to the conversation's consumers"""
+        if conversation_id not in self.subscribers:
+            return
+        self.positions[conversation_id] = entries[-1][0]
+
+        messages = async_redis_stream_client._parse_messages(entries)
+        await async_redis_stream_client._resolve_usernames(messages)
+        # Imported here; consumers import this module
+        from .consumers import build_message, encode_message_frame
+
+        for message in messages:
+            event = {
+                "type": "chat_message",
+                "id": message["id"],
+                "conversation_id": conversation_id,
+                "text": encode_message_frame(build_message(message, conversation_id)),
+            }
+            for consumer in list(self.subscribers.get(conversation_id, ())):
+                try:
+                    await consumer.chat_message(event)
+                except Exception as e:
+                    logger.error(
+                        "Failed to deliver message to WebSocket",
+                        extra={"conversation_id": conversation_id, "error": str(e)},
+                    )
+
+
+# Singleton instance
+stream_fanout = StreamFanout()
@@ -0,0 +1,64 @@
+"""
+Management command to archive conversation streams in Postgres
+"""
+
+import socket
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from messaging.archive import MessageArchiver
+
+
+class Command(BaseCommand):
+    help = "Copy conversation stream entries into the Postgres message archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--consumer",
+            default=socket.gethostname(),
+            help="Consumer name within the archiver group (default: hostname)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.MESSAGE_ARCHIVE["BATCH_SIZE"],
+            help="Entries read per stream and rows per insert",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Archive until caught up, then exit instead of polling",
+        )
+
+    def handle(self, *args, **options):
+        archiver = MessageArchiver(options["consumer"], batch_size=options["batch_size"])
+        poll_seconds = settings.MESSAGE_ARCHIVE["POLL_SECONDS"]
+        total = 0
+
+        while True:
+            try:
+                archived = archiver.run_once()
+            except (redis.RedisError, DatabaseError) as e:
+                # Deleted streams lose their group; recreate groups and
+                # retry pending entries on the next pass
+                self.stderr.write(self.style.ERROR(f"Archive pass failed: {e}"))
+                archiver.known_groups.clear()
+                archiver.next_full_pass = 0
+                if options["once"]:
+                    raise
+                time.sleep(poll_seconds)
+                continue
+
+            total += archived
+            if archived:
+                self.stdout.write(f"Archived {archived} entries")
+            elif options["once"]:
+                break
+            else:
+                time.sleep(poll_seconds)
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} entries"))
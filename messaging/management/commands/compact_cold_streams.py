@@ -0,0 +1,75 @@
+"""
+Management command to move idle conversation streams out of Redis
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from messaging.cold_storage import cold_streams
+from messaging.redis_stream import parse_stream_id, scan_conversation_streams
+
+
+class Command(BaseCommand):
+    help = "Move idle conversation streams into compressed chunks in Postgres"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--idle-days",
+            type=float,
+            default=settings.REDIS_STREAM_COLD_STORAGE["IDLE_DAYS"],
+            help="Minimum days since a stream's newest message",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Keys per SCAN call and streams checked per pipeline",
+        )
+
+    def handle(self, *args, **options):
+        client = cold_streams.redis_client
+        idle_ms = int(options["idle_days"] * 86400000)
+        chunk_size = settings.REDIS_STREAM_COLD_STORAGE["CHUNK_SIZE"]
+        totals = {"streams": 0, "compacted": 0, "entries": 0, "redis_bytes": 0, "stored_bytes": 0}
+
+        batch = []
+        for key in scan_conversation_streams(client, options["batch_size"]):
+            batch.append(key)
+            if len(batch) >= options["batch_size"]:
+                self.compact_batch(batch, idle_ms, chunk_size, totals)
+                batch = []
+        if batch:
+            self.compact_batch(batch, idle_ms, chunk_size, totals)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {totals['compacted']} of {totals['streams']} streams "
+                f"({totals['entries']} entries) out of Redis: {totals['redis_bytes']} bytes "
+                f"in Redis -> {totals['stored_bytes']} bytes compressed"
+            )
+        )
+
+    def compact_batch(self, keys: list[str], idle_ms: int, chunk_size: int, totals: dict):
+        """Compact the idle streams of a batch, found with one pipelined lookup"""
+        totals["streams"] += len(keys)
+        pipe = cold_streams.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.xrevrange(key, "+", "-", count=1)
+        cutoff = time.time() * 1000 - idle_ms
+
+        for key, newest in zip(keys, pipe.execute()):
+            if not newest or parse_stream_id(newest[0][0])[0] > cutoff:
+                continue
+            result = cold_streams.compact(key, idle_ms, chunk_size)
+            if result is None:
+                continue
+            totals["compacted"] += 1
+            totals["entries"] += result.entries
+            totals["redis_bytes"] += result.redis_bytes
+            totals["stored_bytes"] += result.stored_bytes
+            self.stdout.write(
+                f"{key}: {result.entries} entries, {result.redis_bytes} -> "
+                f"{result.stored_bytes} bytes"
+            )
@@ -0,0 +1,137 @@
+"""
+Management command to rewrite conversation streams in the compact encoding
+"""
+
+import redis
+from django.core.management.base import BaseCommand
+
+from accounts.username_cache import USERNAMES_KEY
+from messaging.redis_stream import (
+    COMPACTING_SUFFIX,
+    encode_compact_entry,
+    is_compact_entry,
+    previous_stream_id,
+    redis_stream_client,
+    scan_conversation_streams,
+)
+
+
+class Command(BaseCommand):
+    help = "Rewrite legacy conversation stream entries in the compact encoding"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Keys per SCAN call and entries per write pipeline",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=5,
+            help="Attempts per stream when it receives writes during the rewrite",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report legacy entries without rewriting anything",
+        )
+
+    def handle(self, *args, **options):
+        client = redis_stream_client.redis_client
+        totals = {"streams": 0, "rewritten": 0, "entries": 0, "bytes_before": 0, "bytes_after": 0}
+
+        for key in scan_conversation_streams(client, options["batch_size"]):
+            totals["streams"] += 1
+            for _ in range(options["retries"]):
+                try:
+                    result = self.compact_stream(
+                        client, key, options["batch_size"], options["dry_run"]
+                    )
+                    break
+                except redis.WatchError:
+                    continue
+            else:
+                client.delete(f"{key}{COMPACTING_SUFFIX}")
+                self.stdout.write(self.style.WARNING(f"{key}: busy, skipped"))
+                continue
+
+            if result is None:
+                continue
+            entries, bytes_before, bytes_after = result
+            totals["rewritten"] += 1
+            totals["entries"] += entries
+            totals["bytes_before"] += bytes_before
+            totals["bytes_after"] += bytes_after
+            self.stdout.write(
+                f"{key}: {entries} legacy entries, {bytes_before} -> {bytes_after} bytes"
+            )
+
+        verb = "Would rewrite" if options["dry_run"] else "Rewrote"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {totals['entries']} entries in {totals['rewritten']} of "
+                f"{totals['streams']} streams ({totals['bytes_before']} -> "
+                f"{totals['bytes_after']} bytes)"
+            )
+        )
+
+    def compact_stream(self, client, key: str, batch_size: int, dry_run: bool):
+        """
+        Rewrite one stream, keeping entry IDs
+
+        The compact copy is built under a temporary key and renamed over the
+        original in a transaction that aborts with WatchError if the stream
+        received writes in the meantime.
+
+        Renaming drops the stream's consumer groups, so they are recreated in
+        the same transaction. A group restarts before its oldest pending
+        entry, so unacknowledged entries are delivered again rather than lost.
+
+        Returns:
+            (legacy entries, bytes before, bytes after) or None if the stream
+            has no legacy entries
+        """
+        with client.pipeline() as pipe:
+            pipe.watch(key)
+            entries = pipe.xrange(key)
+            legacy = [(entry_id, data) for entry_id, data in entries if not is_compact_entry(data)]
+            if not legacy:
+                return None
+
+            bytes_before = pipe.memory_usage(key) or 0
+            if dry_run:
+                return len(legacy), bytes_before, bytes_before
+
+            groups = {}
+            for group in pipe.xinfo_groups(key):
+                start_id = group["last-delivered-id"]
+                if group["pending"]:
+                    start_id = previous_stream_id(pipe.xpending(key, group["name"])["min"])
+                groups[group["name"]] = start_id
+
+            temp_key = f"{key}{COMPACTING_SUFFIX}"
+            client.delete(temp_key)
+            usernames = {}
+            for start in range(0, len(entries), batch_size):
+                writer = client.pipeline(transaction=False)
+                for entry_id, data in entries[start : start + batch_size]:
+                    if not is_compact_entry(data):
+                        usernames[data.get("user_id", "0")] = data.get("username", "")
+                        data = encode_compact_entry(
+                            int(data.get("user_id", 0)), data.get("content", "")
+                        )
+                    writer.xadd(temp_key, data, id=entry_id)
+                writer.execute()
+
+            pipe.multi()
+            pipe.rename(temp_key, key)
+            for name, start_id in groups.items():
+                pipe.xgroup_create(key, name, id=start_id)
+            # Existing cache entries are current; only fill in unknown users
+            for user_id, username in usernames.items():
+                pipe.hsetnx(USERNAMES_KEY, user_id, username)
+            pipe.execute()
+
+        return len(legacy), bytes_before, client.memory_usage(key) or 0
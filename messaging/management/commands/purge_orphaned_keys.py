@@ -0,0 +1,39 @@
+"""
+Management command to remove Redis keys of conversations that no longer exist
+"""
+
+from django.core.management.base import BaseCommand
+
+from messaging.cleanup import purge_orphans
+
+
+class Command(BaseCommand):
+    help = "Remove stream and read cursor keys whose conversation has been deleted"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Keys per SCAN call and conversation IDs checked per query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List orphaned conversations without removing anything",
+        )
+
+    def handle(self, *args, **options):
+        totals = purge_orphans(
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            on_orphan=lambda conversation_id: self.stdout.write(str(conversation_id)),
+        )
+        if options["dry_run"]:
+            message = f"Found {totals['orphans']} orphaned conversations in {totals['keys']} keys"
+        else:
+            message = (
+                f"Removed {totals['removed']} keys of {totals['orphans']} orphaned "
+                f"conversations ({totals['keys']} keys scanned)"
+            )
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,72 @@
+"""
+Management command to report Redis memory used per conversation
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from messaging.memory import REPORT_METRICS, memory_report
+
+METRIC_TITLES = {
+    "bytes": "by memory",
+    "entries": "by entries",
+    "entries_per_day": "by growth (entries per day)",
+}
+
+
+class Command(BaseCommand):
+    help = "Report the conversations using the most Redis memory, and throttle key counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Conversations to list per metric",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Keys per SCAN call and streams measured per pipeline",
+        )
+        parser.add_argument(
+            "--max-keys",
+            type=int,
+            default=0,
+            help="Sample at most this many keys of each kind (default: all)",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the report as JSON",
+        )
+
+    def handle(self, *args, **options):
+        report = memory_report(
+            top=options["top"],
+            batch_size=options["batch_size"],
+            max_keys=options["max_keys"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report['streams']} streams, {report['entries']} entries, "
+                f"{report['bytes']} bytes (Redis used_memory: {report['used_memory']})"
+            )
+        )
+        for metric in REPORT_METRICS:
+            self.stdout.write(f"\nTop conversations {METRIC_TITLES[metric]}:")
+            for usage in report["top"][metric]:
+                self.stdout.write(
+                    f"  {usage['conversation_id']}  {usage['bytes']} bytes  "
+                    f"{usage['entries']} entries  {usage['entries_per_day']}/day"
+                )
+        throttle_keys = ", ".join(
+            f"{scope}: {count}" for scope, count in report["throttle_keys"].items()
+        )
+        self.stdout.write(f"\nThrottle keys: {throttle_keys}")
@@ -0,0 +1,63 @@
+"""
+Management command to apply retention policies to conversation streams
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from messaging.retention import trim_all_streams
+
+
+class Command(BaseCommand):
+    help = "Trim conversation streams to their retention policies and report reclaimed memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Keys per SCAN call and streams trimmed per batch",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Repeat every this many seconds instead of running once",
+        )
+        parser.add_argument(
+            "--verbose-streams",
+            action="store_true",
+            help="Report every stream trimmed or held back",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            totals = trim_all_streams(
+                batch_size=options["batch_size"],
+                on_result=self.report_stream if options["verbose_streams"] else None,
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Trimmed {totals['entries']} entries from {totals['trimmed_streams']} of "
+                    f"{totals['streams']} streams, reclaiming {totals['bytes']} bytes"
+                )
+            )
+            if totals["held_back"]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"{totals['held_back']} streams kept entries a consumer group "
+                        "has not processed"
+                    )
+                )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def report_stream(self, result):
+        """Write the outcome for one stream"""
+        held_back = " (held back by consumer group)" if result.held_back else ""
+        self.stdout.write(
+            f"{result.key}: {result.trimmed} entries, "
+            f"{result.bytes_before} -> {result.bytes_after} bytes{held_back}"
+        )
@@ -0,0 +1,153 @@
+"""
+Redis memory accounting per conversation
+"""
+
+import heapq
+import logging
+import time
+from typing import Any, NamedTuple
+
+from .redis_stream import (
+    STREAM_KEY_PREFIX,
+    parse_stream_id,
+    redis_stream_client,
+    scan_conversation_streams,
+)
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_KEY_PREFIX = "throttle:"
+
+DAY_MS = 86400000
+# Streams younger than this are rated as if they were this old, so a burst
+# of messages in a brand new conversation does not dominate the growth list
+MIN_GROWTH_WINDOW_MS = 3600000
+
+REPORT_METRICS = ("bytes", "entries", "entries_per_day")
+
+
+class StreamUsage(NamedTuple):
+    """Memory and size of one conversation stream"""
+
+    conversation_id: str
+    bytes: int
+    entries: int
+    # Average since the oldest entry still in the stream
+    entries_per_day: float
+    first_entry_id: str
+    last_entry_id: str
+
+
+def get_stream_usage(key: str, memory: int, info: dict[str, Any], now_ms: int) -> StreamUsage:
+    """Build a StreamUsage from a stream's MEMORY USAGE and XINFO STREAM replies"""
+    length = info.get("length", 0)
+    first_entry = info.get("first-entry")
+    last_entry = info.get("last-entry")
+    first_entry_id = first_entry[0] if first_entry else ""
+
+    entries_per_day = 0.0
+    if first_entry_id:
+        window_ms = max(now_ms - parse_stream_id(first_entry_id)[0], MIN_GROWTH_WINDOW_MS)
+        entries_per_day = round(length * DAY_MS / window_ms, 2)
+
+    return StreamUsage(
+        conversation_id=key[len(STREAM_KEY_PREFIX) :],
+        bytes=memory or 0,
+        entries=length,
+        entries_per_day=entries_per_day,
+        first_entry_id=first_entry_id,
+        last_entry_id=last_entry[0] if last_entry else "",
+    )
+
+
+def throttle_scope(key: str) -> str:
+    """Throttle scope a throttle key belongs to"""
+    parts = key[len(THROTTLE_KEY_PREFIX) :].split(":")
+    if parts[0] == "user":
+        return "user"
+    if parts[0] == "conv":
+        return "conversation"
+    return "user_conversation"
+
+
+def memory_report(top: int = 10, batch_size: int = 500, max_keys: int = 0) -> dict[str, Any]:
+    """
+    Sample Redis memory used by conversation streams and throttle keys
+
+    Stream keys are walked with SCAN; each batch is measured with one pipeline
+    of MEMORY USAGE and XINFO STREAM calls. Only the top conversations are
+    kept, so memory use does not grow with the number of streams.
+
+    Args:
+        top: Conversations to report per metric
+        batch_size: Keys per SCAN call and streams per pipeline
+        max_keys: Stop after this many keys of each kind; 0 means all
+
+    Returns:
+        Totals, the top conversations by bytes, entries and entries per day,
+        throttle key counts by scope and Redis' own used_memory
+    """
+    client = redis_stream_client.redis_client
+    started = time.monotonic()
+    now_ms = int(time.time() * 1000)
+    totals = {"streams": 0, "bytes": 0, "entries": 0}
+    leaders = {metric: [] for metric in REPORT_METRICS}
+
+    def measure(batch: list[str]):
+        pipe = client.pipeline(transaction=False)
+        for key in batch:
+            pipe.memory_usage(key)
+            pipe.xinfo_stream(key)
+        replies = pipe.execute(raise_on_error=False)
+
+        for index, key in enumerate(batch):
+            memory, info = replies[index * 2 : index * 2 + 2]
+            if isinstance(memory, Exception) or isinstance(info, Exception):
+                # Deleted since it was scanned
+                continue
+            usage = get_stream_usage(key, memory, info, now_ms)
+            totals["streams"] += 1
+            totals["bytes"] += usage.bytes
+            totals["entries"] += usage.entries
+            for metric, leader in leaders.items():
+                leader.append(usage)
+                if len(leader) > top * 2:
+                    leaders[metric] = heapq.nlargest(top, leader, key=lambda u: getattr(u, metric))
+
+    batch = []
+    keys = scan_conversation_streams(client, batch_size)
+    for scanned, key in enumerate(keys, 1):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            measure(batch)
+            batch = []
+        if max_keys and scanned >= max_keys:
+            break
+    if batch:
+        measure(batch)
+
+    throttle_keys = {"user": 0, "conversation": 0, "user_conversation": 0}
+    keys = client.scan_iter(match=f"{THROTTLE_KEY_PREFIX}*", count=batch_size)
+    for scanned, key in enumerate(keys, 1):
+        throttle_keys[throttle_scope(key)] += 1
+        if max_keys and scanned >= max_keys:
+            break
+
+    report = {
+        **totals,
+        "top": {
+            metric: [
+                usage._asdict()
+                for usage in heapq.nlargest(top, leader, key=lambda u: getattr(u, metric))
+            ]
+            for metric, leader in leaders.items()
+        },
+        "throttle_keys": throttle_keys,
+        "used_memory": client.info("memory").get("used_memory"),
+        "duration_ms": int((time.monotonic() - started) * 1000),
+    }
+    logger.info(
+        "Redis memory report",
+        extra={**totals, "throttle_keys": sum(throttle_keys.values())},
+    )
+    return report
@@ -0,0 +1,77 @@
+from django.db import migrations, models
+
+# Hash partitions of the archive table on PostgreSQL
+PARTITIONS = 16
+
+
+def create_archive_table(apps, schema_editor):
+    """Create the archive, hash-partitioned by conversation on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.create_model(apps.get_model("messaging", "ArchivedMessage"))
+        return
+
+    # Every unique constraint of a partitioned table must include the
+    # partition key, so the primary key is (conversation_id, id)
+    schema_editor.execute(
+        """
+        CREATE TABLE messages_archive (
+            id bigserial NOT NULL,
+            conversation_id uuid NOT NULL,
+            stream_ms bigint NOT NULL,
+            stream_seq bigint NOT NULL,
+            user_id bigint NOT NULL,
+            content text NOT NULL,
+            created_at timestamp with time zone NOT NULL,
+            PRIMARY KEY (conversation_id, id),
+            CONSTRAINT messages_archive_entry_unique
+                UNIQUE (conversation_id, stream_ms, stream_seq)
+        ) PARTITION BY HASH (conversation_id)
+        """
+    )
+    for remainder in range(PARTITIONS):
+        schema_editor.execute(
+            f"CREATE TABLE messages_archive_p{remainder} PARTITION OF messages_archive "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+        )
+
+
+def drop_archive_table(apps, schema_editor):
+    """Drop the archive and its partitions"""
+    schema_editor.delete_model(apps.get_model("messaging", "ArchivedMessage"))
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="ArchivedMessage",
+                    fields=[
+                        ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                        ("conversation_id", models.UUIDField()),
+                        ("stream_ms", models.BigIntegerField()),
+                        ("stream_seq", models.BigIntegerField()),
+                        ("user_id", models.BigIntegerField()),
+                        ("content", models.TextField()),
+                        ("created_at", models.DateTimeField()),
+                    ],
+                    options={
+                        "db_table": "messages_archive",
+                    },
+                ),
+                migrations.AddConstraint(
+                    model_name="archivedmessage",
+                    constraint=models.UniqueConstraint(
+                        fields=("conversation_id", "stream_ms", "stream_seq"),
+                        name="messages_archive_entry_unique",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
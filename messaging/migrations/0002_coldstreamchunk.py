@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ColdStreamChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("conversation_id", models.UUIDField()),
+                ("index", models.PositiveIntegerField()),
+                ("first_id", models.CharField(max_length=41)),
+                ("last_id", models.CharField(max_length=41)),
+                ("entry_count", models.PositiveIntegerField()),
+                ("data", models.BinaryField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "cold_stream_chunks",
+                "ordering": ["conversation_id", "index"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="coldstreamchunk",
+            constraint=models.UniqueConstraint(
+                fields=("conversation_id", "index"), name="cold_stream_chunks_unique"
+            ),
+        ),
+    ]
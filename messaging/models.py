@@ -0,0 +1,72 @@
+"""
+Models for messaging
+"""
+
+from django.db import models
+
+
+class ArchivedMessage(models.Model):
+    """
+    Message copied from a conversation stream for long-term storage
+
+    Written by the archiver, which consumes every stream through a consumer
+    group, so history survives stream trimming. On PostgreSQL the table is
+    hash-partitioned by conversation, keeping each conversation's history in
+    one partition; the entry ID is stored as its numeric parts so rows sort
+    in stream order.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    conversation_id = models.UUIDField()
+    stream_ms = models.BigIntegerField()
+    stream_seq = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    content = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "messages_archive"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["conversation_id", "stream_ms", "stream_seq"],
+                name="messages_archive_entry_unique",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.conversation_id} {self.message_id}"
+
+    @property
+    def message_id(self) -> str:
+        """Stream entry ID of the message"""
+        return f"{self.stream_ms}-{self.stream_seq}"
+
+
+class ColdStreamChunk(models.Model):
+    """
+    Compressed slice of an idle conversation stream moved out of Redis
+
+    Holds a zlib-compressed JSON list of [entry_id, fields] pairs, in stream
+    order, and is deleted once the stream has been rehydrated.
+    """
+
+    conversation_id = models.UUIDField()
+    index = models.PositiveIntegerField()
+    first_id = models.CharField(max_length=41)
+    last_id = models.CharField(max_length=41)
+    entry_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "cold_stream_chunks"
+        ordering = ["conversation_id", "index"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["conversation_id", "index"],
+                name="cold_stream_chunks_unique",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.conversation_id} #{self.index}"
@@ -0,0 +1,184 @@
+"""
+Per-participant read cursors and unread counts
+"""
+
+import logging
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from .redis_stream import redis_stream_client
+
+logger = logging.getLogger(__name__)
+
+# Unread counts saturate here; clients show e.g. "99+" past it
+MAX_UNREAD = 100
+
+# Move a participant's cursor forward, never back, and never past the newest
+# entry of the stream so a bogus ID cannot hide future messages.
+# KEYS: reads hash, stream. ARGV: user_id, message_id. Returns 1 if moved.
+MARK_READ_SCRIPT = """
+local function parse(id)
+    local ms, seq = string.match(id, '^(%d+)-(%d+)$')
+    return tonumber(ms), tonumber(seq)
+end
+local function before(a_ms, a_seq, b_ms, b_seq)
+    return a_ms < b_ms or (a_ms == b_ms and a_seq < b_seq)
+end
+local target = ARGV[2]
+local ms, seq = parse(target)
+local newest = redis.call('XREVRANGE', KEYS[2], '+', '-', 'COUNT', 1)[1]
+if not newest then
+    return 0
+end
+local newest_ms, newest_seq = parse(newest[1])
+if before(newest_ms, newest_seq, ms, seq) then
+    target, ms, seq = newest[1], newest_ms, newest_seq
+end
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current then
+    local current_ms, current_seq = parse(current)
+    if not before(current_ms, current_seq, ms, seq) then
+        return 0
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], target)
+return 1
+"""
+
+# Count entries after a participant's cursor, up to a cap, so the cost is
+# bounded however far behind they are.
+# KEYS: reads hash, stream. ARGV: user_id, cap. Returns the count.
+UNREAD_COUNT_SCRIPT = """
+local cursor = redis.call('HGET', KEYS[1], ARGV[1])
+local start = '-'
+if cursor then
+    start = '(' .. cursor
+end
+return #redis.call('XRANGE', KEYS[2], start, '+', 'COUNT', ARGV[2])
+"""
+
+
+class ReadCursorStore:
+    """
+    Last-read stream ID of every participant, per conversation
+
+    Each conversation has a Redis hash of user_id -> stream ID next to its
+    message stream. Unread counts are bounded XRANGEs after the cursor, run
+    as a script per conversation and pipelined so a whole inbox takes a
+    single round trip.
+    """
+
+    def __init__(self, max_unread: int = MAX_UNREAD):
+        """
+        Args:
+            max_unread: Value at which unread counts stop counting
+        """
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.max_unread = max_unread
+        self.mark_script = self.redis_client.register_script(MARK_READ_SCRIPT)
+        self.async_mark_script = self.async_redis_client.register_script(MARK_READ_SCRIPT)
+        self.unread_script = self.redis_client.register_script(UNREAD_COUNT_SCRIPT)
+
+    def _get_reads_key(self, conversation_id) -> str:
+        """Generate Redis key for a conversation's read cursors"""
+        return f"reads:conv:{conversation_id}"
+
+    def _get_keys(self, conversation_id) -> list[str]:
+        """Keys of a conversation's read cursors and stream, as the scripts expect"""
+        return [
+            self._get_reads_key(conversation_id),
+            redis_stream_client._get_stream_key(conversation_id),
+        ]
+
+    def mark_read(self, user_id: int, reads: dict[str, str]) -> bool:
+        """
+        Move a user's read cursors forward
+
+        Args:
+            user_id: ID of the user
+            reads: Dictionary of conversation ID -> ID of the last message read
+
+        Returns:
+            True if the cursors were stored, False if Redis failed
+        """
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for conversation_id, message_id in reads.items():
+                self.mark_script(
+                    keys=self._get_keys(conversation_id),
+                    args=[user_id, message_id],
+                    client=pipe,
+                )
+            pipe.execute()
+            return True
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to store read cursors",
+                extra={"user_id": user_id, "error": str(e)},
+            )
+            return False
+
+    async def amark_read(self, user_id: int, reads: dict[str, str]) -> bool:
+        """
+        Move a user's read cursors forward without blocking the event loop
+
+        Args:
+            user_id: ID of the user
+            reads: Dictionary of conversation ID -> ID of the last message read
+
+        Returns:
+            True if the cursors were stored, False if Redis failed
+        """
+        try:
+            pipe = self.async_redis_client.pipeline(transaction=False)
+            for conversation_id, message_id in reads.items():
+                await self.async_mark_script(
+                    keys=self._get_keys(conversation_id),
+                    args=[user_id, message_id],
+                    client=pipe,
+                )
+            await pipe.execute()
+            return True
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to store read cursors",
+                extra={"user_id": user_id, "error": str(e)},
+            )
+            return False
+
+    def get_unread_counts(self, user_id: int, conversation_ids: list[str]) -> dict[str, int]:
+        """
+        Count a user's unread messages in many conversations in one round trip
+
+        Args:
+            user_id: ID of the user
+            conversation_ids: UUIDs of the conversations
+
+        Returns:
+            Dictionary of conversation ID -> unread count, at most max_unread;
+            empty if Redis failed
+        """
+        if not conversation_ids:
+            return {}
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for conversation_id in conversation_ids:
+                self.unread_script(
+                    keys=self._get_keys(conversation_id),
+                    args=[user_id, self.max_unread],
+                    client=pipe,
+                )
+            return dict(zip(conversation_ids, pipe.execute()))
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to count unread messages",
+                extra={"user_id": user_id, "error": str(e)},
+            )
+            return {}
+
+
+# Singleton instance
+read_cursors = ReadCursorStore()
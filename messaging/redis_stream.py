@@ -1,12 +1,98 @@
+import json
 import logging
-from datetime import datetime
+import re
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 
 import redis
+import redis.asyncio as aioredis
 from django.conf import settings
 
+from accounts.username_cache import USERNAMES_KEY, username_cache
+
 logger = logging.getLogger(__name__)
 
+STREAM_ID_RE = re.compile(r"^\d+-\d+$")
+
+STREAM_KEY_PREFIX = "stream:conv:"
+# Temporary copy of a stream while compact_streams rewrites it
+COMPACTING_SUFFIX = ":compacting"
+
+# Compact entries hold one field, "<version>|<user_id>|<content>". The
+# username is resolved through the username cache and the timestamp is the
+# millisecond time already encoded in the entry ID.
+COMPACT_FIELD = "p"
+COMPACT_VERSION = "1"
+
+# Hash of conversation ID -> JSON metadata for streams moved out of Redis by
+# the cold storage compaction
+COLD_STREAMS_KEY = "streams:cold"
+
+# Set of stream keys written since the archiver last read them
+WRITTEN_STREAMS_KEY = "streams:written"
+
+
+def parse_stream_id(message_id: str) -> tuple[int, int]:
+    """Split a stream entry ID into comparable (milliseconds, sequence) parts"""
+    milliseconds, _, sequence = message_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def previous_stream_id(message_id: str) -> str:
+    """The greatest possible stream ID below message_id"""
+    milliseconds, sequence = parse_stream_id(message_id)
+    if sequence:
+        return f"{milliseconds}-{sequence - 1}"
+    return f"{milliseconds - 1}-18446744073709551615"
+
+
+def stream_id_to_timestamp(message_id: str) -> str:
+    """ISO timestamp (naive UTC) of the time encoded in a stream entry ID"""
+    milliseconds = parse_stream_id(message_id)[0]
+    return (datetime(1970, 1, 1) + timedelta(milliseconds=milliseconds)).isoformat()
+
+
+def timestamp_to_stream_id(value: datetime) -> str:
+    """
+    Millisecond stream ID bound for a point in time
+
+    Naive datetimes are taken as UTC, matching stream_id_to_timestamp. The
+    result is an incomplete ID, which Redis expands to the first entry of that
+    millisecond as a range start and to the last as a range end.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    milliseconds = int(value.timestamp() * 1000)
+    return str(max(milliseconds, 0))
+
+
+def scan_conversation_streams(client: redis.Redis, count: int = 500) -> Iterator[str]:
+    """
+    Walk the keys of all conversation streams with SCAN
+
+    Args:
+        client: Synchronous Redis client
+        count: Keys per SCAN call
+
+    Yields:
+        Stream keys, without the temporary copies made by compact_streams
+    """
+    keys = client.scan_iter(match=f"{STREAM_KEY_PREFIX}*", count=count, _type="stream")
+    for key in keys:
+        if not key.endswith(COMPACTING_SUFFIX):
+            yield key
+
+
+def encode_compact_entry(user_id: int, content: str) -> dict[str, str]:
+    """Build the fields of a compact stream entry"""
+    return {COMPACT_FIELD: f"{COMPACT_VERSION}|{user_id}|{content}"}
+
+
+def is_compact_entry(message_data: dict) -> bool:
+    """Whether a raw stream entry uses the compact encoding"""
+    return COMPACT_FIELD in message_data
+
 
 class RedisStreamError(Exception):
     """Custom exception for Redis Stream operations"""
@@ -14,7 +100,102 @@ class RedisStreamError(Exception):
     pass
 
 
-class RedisStreamClient:
+class BaseRedisStreamClient:
+    """
+    Stream key and entry encoding shared by the sync and async clients
+
+    New entries use the compact encoding unless
+    REDIS_STREAM_COMPACT_ENCODING is off; legacy entries with separate
+    user_id, username, content and timestamp fields are still decoded.
+    """
+
+    def _get_stream_key(self, conversation_id: str) -> str:
+        """Generate Redis stream key for a conversation"""
+        return f"{STREAM_KEY_PREFIX}{conversation_id}"
+
+    def _build_message_data(self, user_id: int, username: str, content: str) -> dict[str, str]:
+        """Build the stream entry fields for a message"""
+        if settings.REDIS_STREAM_COMPACT_ENCODING:
+            return encode_compact_entry(user_id, content)
+        return {
+            "user_id": str(user_id),
+            "username": username,
+            "content": content,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+
+    def _get_write_maxlen(self, maxlen: Optional[int]) -> Optional[int]:
+        """MAXLEN for XADD, None to leave trimming to the trim_streams command"""
+        if maxlen is None:
+            maxlen = settings.REDIS_STREAM_RETENTION["WRITE_MAXLEN"]
+        return maxlen or None
+
+    def _remember_username(self, pipe, user_id: int, username: str):
+        """Queue a username cache write on first sight of a sender in this process"""
+        if settings.REDIS_STREAM_COMPACT_ENCODING and username_cache.get_local(user_id) != username:
+            pipe.hset(USERNAMES_KEY, str(user_id), username)
+            username_cache.set_local(user_id, username)
+
+    def _parse_messages(self, messages: list) -> list[dict[str, Any]]:
+        """
+        Convert raw stream entries into message dictionaries
+
+        Compact entries get a username of None until resolved by the caller.
+        """
+        result = []
+        for message_id, message_data in messages:
+            if is_compact_entry(message_data):
+                version, user_id, content = message_data[COMPACT_FIELD].split("|", 2)
+                if version != COMPACT_VERSION:
+                    logger.warning(
+                        "Skipping stream entry with unknown encoding",
+                        extra={"message_id": message_id, "version": version},
+                    )
+                    continue
+                result.append(
+                    {
+                        "id": message_id,
+                        "user_id": int(user_id),
+                        "username": None,
+                        "content": content,
+                        "timestamp": stream_id_to_timestamp(message_id),
+                    }
+                )
+            else:
+                result.append(
+                    {
+                        "id": message_id,
+                        "user_id": int(message_data.get("user_id", 0)),
+                        "username": message_data.get("username", ""),
+                        "content": message_data.get("content", ""),
+                        "timestamp": message_data.get("timestamp", ""),
+                    }
+                )
+        return result
+
+    def _unresolved_user_ids(self, messages: list[dict[str, Any]]) -> set[int]:
+        """User IDs of parsed messages still missing a username"""
+        return {message["user_id"] for message in messages if message["username"] is None}
+
+    def _apply_usernames(self, messages: list[dict[str, Any]], usernames: dict[int, str]):
+        """Fill in usernames of compact messages"""
+        for message in messages:
+            if message["username"] is None:
+                message["username"] = usernames.get(message["user_id"], "")
+
+    def _parse_replay(
+        self, last_id: str, oldest: list, messages: list, limit: int
+    ) -> Optional[list[dict[str, Any]]]:
+        """Return replayable messages, or None if the gap cannot be closed from the stream"""
+        if len(messages) > limit:
+            return None
+        if oldest and parse_stream_id(oldest[0][0]) > parse_stream_id(last_id):
+            # Entries after last_id may already have been trimmed
+            return None
+        return self._parse_messages(messages)
+
+
+class RedisStreamClient(BaseRedisStreamClient):
     """
     Client for managing messages in Redis Streams
     """
@@ -22,9 +203,11 @@ class RedisStreamClient:
     def __init__(self):
         self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
 
-    def _get_stream_key(self, conversation_id: str) -> str:
-        """Generate Redis stream key for a conversation"""
-        return f"stream:conv:{conversation_id}"
+    def _resolve_usernames(self, messages: list[dict[str, Any]]):
+        """Fill in usernames of compact messages from the username cache"""
+        user_ids = self._unresolved_user_ids(messages)
+        if user_ids:
+            self._apply_usernames(messages, username_cache.get_many(user_ids))
 
     def add_message(
         self,
@@ -32,7 +215,7 @@ class RedisStreamClient:
         user_id: int,
         username: str,
         content: str,
-        maxlen: int = 5000,
+        maxlen: Optional[int] = None,
     ) -> str:
         """
         Add a message to a conversation stream
@@ -41,7 +224,8 @@ class RedisStreamClient:
             conversation_id: UUID of the conversation
             user_id: ID of the user sending the message
             content: Message content
-            maxlen: Maximum length of the stream (default: 5000)
+            maxlen: Approximate maximum length of the stream, 0 for none
+                (default: REDIS_STREAM_RETENTION["WRITE_MAXLEN"])
 
         Returns:
             Message ID from Redis Streams
@@ -51,19 +235,18 @@ class RedisStreamClient:
         """
         try:
             stream_key = self._get_stream_key(conversation_id)
-            message_data = {
-                "user_id": str(user_id),
-                "username": username,
-                "content": content,
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-
-            message_id = self.redis_client.xadd(
+            message_data = self._build_message_data(user_id, username, content)
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xadd(
                 stream_key,
                 message_data,
-                maxlen=maxlen,
+                maxlen=self._get_write_maxlen(maxlen),
                 approximate=True,
             )
+            pipe.sadd(WRITTEN_STREAMS_KEY, stream_key)
+            self._remember_username(pipe, user_id, username)
+            message_id = pipe.execute()[0]
 
             logger.info(
                 "Message added to Redis Stream",
@@ -104,42 +287,66 @@ class RedisStreamClient:
         Returns:
             List of message dictionaries
 
+        Raises:
+            RedisStreamError: If message retrieval fails
+        """
+        return self.get_message_page(conversation_id, from_id=from_id, limit=limit)[0]
+
+    def get_message_page(
+        self,
+        conversation_id: str,
+        from_id: str = "-",
+        before: Optional[str] = None,
+        limit: int = 50,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        """
+        Retrieve a page of messages from a conversation stream
+
+        Without cursors this is the latest page. `from_id` pages forward
+        (newer than the ID) and `before` pages backward (older than the ID);
+        both are exclusive. Messages are always in chronological order.
+
+        Args:
+            conversation_id: UUID of the conversation
+            from_id: Message ID to page forward from (default: "-" for latest)
+            before: Message ID to page backward from
+            limit: Maximum number of messages to retrieve (default: 50)
+
+        Returns:
+            Tuple of (messages, has_more), where has_more tells whether further
+            messages exist in the paging direction
+
         Raises:
             RedisStreamError: If message retrieval fails
         """
         try:
             stream_key = self._get_stream_key(conversation_id)
 
-            # Use XRANGE to get messages
-            if from_id == "-":
-                # Get latest messages
-                messages = self.redis_client.xrevrange(
-                    stream_key,
-                    "+",
-                    "-",
-                    count=limit,
-                )
-                messages.reverse()  # Reverse to chronological order
-            else:
+            # Fetch one extra entry to learn whether there is another page
+            if from_id != "-":
                 # Get messages after a specific ID
                 messages = self.redis_client.xrange(
                     stream_key,
                     f"({from_id}",  # Exclusive start
                     "+",
-                    count=limit,
+                    count=limit + 1,
                 )
-
-            result = []
-            for message_id, message_data in messages:
-                result.append(
-                    {
-                        "id": message_id,
-                        "user_id": int(message_data.get("user_id", 0)),
-                        "username": message_data.get("username", ""),
-                        "content": message_data.get("content", ""),
-                        "timestamp": message_data.get("timestamp", ""),
-                    }
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+            else:
+                # Get latest messages, or those before a specific ID
+                messages = self.redis_client.xrevrange(
+                    stream_key,
+                    f"({before}" if before else "+",  # Exclusive end
+                    "-",
+                    count=limit + 1,
                 )
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+                messages.reverse()  # Reverse to chronological order
+
+            result = self._parse_messages(messages)
+            self._resolve_usernames(result)
 
             logger.info(
                 "Messages retrieved from Redis Stream",
@@ -147,10 +354,11 @@ class RedisStreamClient:
                     "conversation_id": conversation_id,
                     "count": len(result),
                     "from_id": from_id,
+                    "before": before,
                 },
             )
 
-            return result
+            return result, has_more
 
         except redis.RedisError as e:
             logger.error(
@@ -162,6 +370,241 @@ class RedisStreamClient:
             )
             raise RedisStreamError(f"Failed to retrieve messages: {str(e)}") from e
 
+    def get_first_id(self, conversation_id: str) -> Optional[str]:
+        """
+        Get the ID of the oldest entry still in a conversation stream
+
+        Args:
+            conversation_id: UUID of the conversation
+
+        Returns:
+            Message ID, or None if the stream is empty
+
+        Raises:
+            RedisStreamError: If the lookup fails
+        """
+        try:
+            entries = self.redis_client.xrange(
+                self._get_stream_key(conversation_id), "-", "+", count=1
+            )
+            return entries[0][0] if entries else None
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to read the start of a Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "error": str(e),
+                },
+            )
+            raise RedisStreamError(f"Failed to read stream: {str(e)}") from e
+
+    def get_messages_between(
+        self,
+        conversation_id: str,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 50,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        """
+        Retrieve messages within a time range
+
+        With `since` the page starts at the oldest message in the range and
+        has_more means newer messages remain; with only `until` it ends at the
+        newest one and has_more means older messages remain.
+
+        Args:
+            conversation_id: UUID of the conversation
+            since: Inclusive lower bound, from timestamp_to_stream_id
+            until: Inclusive upper bound, from timestamp_to_stream_id
+            limit: Maximum number of messages to retrieve (default: 50)
+
+        Returns:
+            Tuple of (messages, has_more)
+
+        Raises:
+            RedisStreamError: If message retrieval fails
+        """
+        try:
+            stream_key = self._get_stream_key(conversation_id)
+            if since is not None:
+                messages = self.redis_client.xrange(
+                    stream_key, since, until or "+", count=limit + 1
+                )
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+            else:
+                messages = self.redis_client.xrevrange(
+                    stream_key, until or "+", "-", count=limit + 1
+                )
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+                messages.reverse()
+
+            result = self._parse_messages(messages)
+            self._resolve_usernames(result)
+            return result, has_more
+
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to retrieve messages from Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "since": since,
+                    "until": until,
+                    "error": str(e),
+                },
+            )
+            raise RedisStreamError(f"Failed to retrieve messages: {str(e)}") from e
+
+    def get_messages_around(
+        self,
+        conversation_id: str,
+        around: str,
+        limit: int = 25,
+    ) -> tuple[list[dict[str, Any]], bool, bool]:
+        """
+        Retrieve a window of messages around a point in time
+
+        Args:
+            conversation_id: UUID of the conversation
+            around: Millisecond stream ID bound, from timestamp_to_stream_id
+            limit: Maximum number of messages on each side (default: 25)
+
+        Returns:
+            Tuple of (messages, has_more_before, has_more_after)
+
+        Raises:
+            RedisStreamError: If message retrieval fails
+        """
+        try:
+            stream_key = self._get_stream_key(conversation_id)
+            milliseconds = int(around)
+            pipe = self.redis_client.pipeline(transaction=False)
+            if milliseconds > 0:
+                # Everything before the millisecond; an incomplete end ID
+                # covers all of that millisecond's sequence numbers
+                pipe.xrevrange(stream_key, str(milliseconds - 1), "-", count=limit + 1)
+            pipe.xrange(stream_key, str(milliseconds), "+", count=limit + 1)
+            results = pipe.execute()
+            after = results.pop()
+            before = results.pop() if results else []
+
+            has_more_before = len(before) > limit
+            has_more_after = len(after) > limit
+            messages = before[:limit][::-1] + after[:limit]
+
+            result = self._parse_messages(messages)
+            self._resolve_usernames(result)
+            return result, has_more_before, has_more_after
+
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to retrieve messages from Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "around": around,
+                    "error": str(e),
+                },
+            )
+            raise RedisStreamError(f"Failed to retrieve messages: {str(e)}") from e
+
+    def get_previews(self, conversation_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """
+        Retrieve the last message and length of many conversation streams
+
+        All lookups go out in a single pipelined round trip.
+
+        Args:
+            conversation_ids: UUIDs of the conversations
+
+        Returns:
+            Dictionary of conversation ID -> {"last_message", "message_count"},
+            where last_message is None for an empty stream. Streams moved to
+            cold storage report the state they were moved in.
+
+        Raises:
+            RedisStreamError: If the lookup fails
+        """
+        if not conversation_ids:
+            return {}
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for conversation_id in conversation_ids:
+                stream_key = self._get_stream_key(conversation_id)
+                pipe.xrevrange(stream_key, "+", "-", count=1)
+                pipe.xlen(stream_key)
+            pipe.hmget(COLD_STREAMS_KEY, conversation_ids)
+            results = pipe.execute()
+            cold = results.pop()
+
+            previews = {}
+            last_messages = []
+            for index, conversation_id in enumerate(conversation_ids):
+                entries, count = results[2 * index], results[2 * index + 1]
+                if cold[index]:
+                    meta = json.loads(cold[index])
+                    entries = entries or [tuple(meta["last"])]
+                    count += meta["length"]
+                last_message = self._parse_messages(entries)[0] if entries else None
+                if last_message:
+                    last_messages.append(last_message)
+                previews[conversation_id] = {
+                    "last_message": last_message,
+                    "message_count": count,
+                }
+            self._resolve_usernames(last_messages)
+            return previews
+
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to retrieve conversation previews from Redis Stream",
+                extra={"count": len(conversation_ids), "error": str(e)},
+            )
+            raise RedisStreamError(f"Failed to retrieve previews: {str(e)}") from e
+
+    def get_messages_since(
+        self,
+        conversation_id: str,
+        last_id: str,
+        limit: int = 200,
+    ) -> Optional[list[dict[str, Any]]]:
+        """
+        Retrieve every message after last_id, for replay on reconnect
+
+        Args:
+            conversation_id: UUID of the conversation
+            last_id: ID of the last message the client has seen
+            limit: Maximum number of messages to replay (default: 200)
+
+        Returns:
+            List of message dictionaries, or None if more than `limit`
+            messages were missed or some may have been trimmed
+
+        Raises:
+            RedisStreamError: If message retrieval fails
+        """
+        try:
+            stream_key = self._get_stream_key(conversation_id)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xrange(stream_key, "-", "+", count=1)
+            pipe.xrange(stream_key, f"({last_id}", "+", count=limit + 1)
+            oldest, messages = pipe.execute()
+            result = self._parse_replay(last_id, oldest, messages, limit)
+            if result:
+                self._resolve_usernames(result)
+            return result
+
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to replay messages from Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "last_id": last_id,
+                    "error": str(e),
+                },
+            )
+            raise RedisStreamError(f"Failed to replay messages: {str(e)}") from e
+
     def ping_redis(self) -> bool:
         """
         Check if Redis is accessible
@@ -203,5 +646,222 @@ class RedisStreamClient:
             return None
 
 
-# Singleton instance
+class AsyncRedisStreamClient(BaseRedisStreamClient):
+    """
+    asyncio client for managing messages in Redis Streams
+
+    Used from WebSocket consumers and async views so stream access does not
+    have to hop through the sync thread executor.
+    """
+
+    def __init__(self):
+        self.redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+
+    async def _resolve_usernames(self, messages: list[dict[str, Any]]):
+        """Fill in usernames of compact messages from the username cache"""
+        user_ids = self._unresolved_user_ids(messages)
+        if user_ids:
+            self._apply_usernames(messages, await username_cache.aget_many(user_ids))
+
+    async def add_message(
+        self,
+        conversation_id: str,
+        user_id: int,
+        username: str,
+        content: str,
+        maxlen: Optional[int] = None,
+    ) -> str:
+        """
+        Add a message to a conversation stream
+
+        Args:
+            conversation_id: UUID of the conversation
+            user_id: ID of the user sending the message
+            content: Message content
+            maxlen: Approximate maximum length of the stream, 0 for none
+                (default: REDIS_STREAM_RETENTION["WRITE_MAXLEN"])
+
+        Returns:
+            Message ID from Redis Streams
+
+        Raises:
+            RedisStreamError: If message addition fails
+        """
+        try:
+            stream_key = self._get_stream_key(conversation_id)
+            message_data = self._build_message_data(user_id, username, content)
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xadd(
+                stream_key,
+                message_data,
+                maxlen=self._get_write_maxlen(maxlen),
+                approximate=True,
+            )
+            pipe.sadd(WRITTEN_STREAMS_KEY, stream_key)
+            self._remember_username(pipe, user_id, username)
+            message_id = (await pipe.execute())[0]
+
+            logger.info(
+                "Message added to Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "user_id": user_id,
+                    "message_id": message_id,
+                },
+            )
+
+            return message_id
+
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to add message to Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "user_id": user_id,
+                    "error": str(e),
+                },
+            )
+            raise RedisStreamError(f"Failed to add message: {str(e)}") from e
+
+    async def get_messages(
+        self,
+        conversation_id: str,
+        from_id: str = "-",
+        limit: int = 50,
+    ) -> list[dict[str, Any]]:
+        """
+        Retrieve messages from a conversation stream
+
+        Args:
+            conversation_id: UUID of the conversation
+            from_id: Message ID to start from (default: "-" for beginning)
+            limit: Maximum number of messages to retrieve (default: 50)
+
+        Returns:
+            List of message dictionaries
+
+        Raises:
+            RedisStreamError: If message retrieval fails
+        """
+        return (await self.get_message_page(conversation_id, from_id=from_id, limit=limit))[0]
+
+    async def get_message_page(
+        self,
+        conversation_id: str,
+        from_id: str = "-",
+        before: Optional[str] = None,
+        limit: int = 50,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        """
+        Retrieve a page of messages from a conversation stream
+
+        Args:
+            conversation_id: UUID of the conversation
+            from_id: Message ID to page forward from (default: "-" for latest)
+            before: Message ID to page backward from
+            limit: Maximum number of messages to retrieve (default: 50)
+
+        Returns:
+            Tuple of (messages, has_more), see RedisStreamClient.get_message_page
+
+        Raises:
+            RedisStreamError: If message retrieval fails
+        """
+        try:
+            stream_key = self._get_stream_key(conversation_id)
+
+            if from_id != "-":
+                messages = await self.redis_client.xrange(
+                    stream_key,
+                    f"({from_id}",
+                    "+",
+                    count=limit + 1,
+                )
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+            else:
+                messages = await self.redis_client.xrevrange(
+                    stream_key,
+                    f"({before}" if before else "+",
+                    "-",
+                    count=limit + 1,
+                )
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+                messages.reverse()
+
+            result = self._parse_messages(messages)
+            await self._resolve_usernames(result)
+            return result, has_more
+
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to retrieve messages from Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "error": str(e),
+                },
+            )
+            raise RedisStreamError(f"Failed to retrieve messages: {str(e)}") from e
+
+    async def get_messages_since(
+        self,
+        conversation_id: str,
+        last_id: str,
+        limit: int = 200,
+    ) -> Optional[list[dict[str, Any]]]:
+        """
+        Retrieve every message after last_id, for replay on reconnect
+
+        Args:
+            conversation_id: UUID of the conversation
+            last_id: ID of the last message the client has seen
+            limit: Maximum number of messages to replay (default: 200)
+
+        Returns:
+            List of message dictionaries, or None if more than `limit`
+            messages were missed or some may have been trimmed
+
+        Raises:
+            RedisStreamError: If message retrieval fails
+        """
+        try:
+            stream_key = self._get_stream_key(conversation_id)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xrange(stream_key, "-", "+", count=1)
+            pipe.xrange(stream_key, f"({last_id}", "+", count=limit + 1)
+            oldest, messages = await pipe.execute()
+            result = self._parse_replay(last_id, oldest, messages, limit)
+            if result:
+                await self._resolve_usernames(result)
+            return result
+
+        except redis.RedisError as e:
+            logger.error(
+                "Failed to replay messages from Redis Stream",
+                extra={
+                    "conversation_id": conversation_id,
+                    "last_id": last_id,
+                    "error": str(e),
+                },
+            )
+            raise RedisStreamError(f"Failed to replay messages: {str(e)}") from e
+
+    async def ping_redis(self) -> bool:
+        """
+        Check if Redis is accessible
+
+        Returns:
+            True if Redis is accessible, False otherwise
+        """
+        try:
+            return await self.redis_client.ping()
+        except redis.RedisError as e:
+            logger.error("Redis ping failed", extra={"error": str(e)})
+            return False
+
+
+# Singleton instances
 redis_stream_client = RedisStreamClient()
+async_redis_stream_client = AsyncRedisStreamClient()
@@ -0,0 +1,262 @@
+"""
+Retention of conversation streams
+"""
+
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+import redis
+from django.conf import settings
+from django.db.models import Q
+
+from conversations.models import Conversation
+
+from .redis_stream import (
+    STREAM_KEY_PREFIX,
+    parse_stream_id,
+    redis_stream_client,
+    scan_conversation_streams,
+    timestamp_to_stream_id,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy(NamedTuple):
+    """How much of a conversation stream to keep; 0 means no limit"""
+
+    max_age_days: int
+    max_length: int
+
+
+class TrimResult(NamedTuple):
+    """Outcome of trimming one stream"""
+
+    key: str
+    trimmed: int
+    bytes_before: int
+    bytes_after: int
+    # Entries a consumer group has not processed yet were kept
+    held_back: bool
+
+
+def get_retention_policy() -> RetentionPolicy:
+    """Read the default retention policy from settings.REDIS_STREAM_RETENTION"""
+    config = getattr(settings, "REDIS_STREAM_RETENTION", {})
+    return RetentionPolicy(config.get("MAX_AGE_DAYS", 0), config.get("MAX_LENGTH", 0))
+
+
+def next_stream_id(message_id: str) -> str:
+    """The smallest possible stream ID above message_id"""
+    milliseconds, sequence = parse_stream_id(message_id)
+    return f"{milliseconds}-{sequence + 1}"
+
+
+def later_stream_id(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    """The later of two stream IDs, either of which may be None"""
+    if first is None or second is None:
+        return first or second
+    return max(first, second, key=parse_stream_id)
+
+
+class StreamTrimmer:
+    """
+    Applies retention policies to batches of conversation streams
+
+    Age and length limits are both turned into a MINID bound, so each stream
+    is trimmed by a single exact XTRIM. The length bound is read from
+    whichever end of the stream is closer: the oldest excess entries when a
+    stream is a little over its limit, the newest max_length entries when it
+    is far over. Entries not yet acknowledged by a consumer group, such as
+    the archiver, are never trimmed. A batch takes three pipelined round
+    trips however many streams it holds.
+    """
+
+    def __init__(self, policy: Optional[RetentionPolicy] = None):
+        """
+        Args:
+            policy: Default policy (default: settings.REDIS_STREAM_RETENTION)
+        """
+        self.redis_client = redis_stream_client.redis_client
+        self.policy = policy or get_retention_policy()
+
+    def get_policies(self, keys: list[str]) -> dict[str, RetentionPolicy]:
+        """Policy of each stream, with per-conversation overrides loaded in one query"""
+        conversation_ids = {}
+        for key in keys:
+            try:
+                conversation_ids[uuid.UUID(key[len(STREAM_KEY_PREFIX) :])] = key
+            except ValueError:
+                continue
+
+        policies = dict.fromkeys(keys, self.policy)
+        overrides = (
+            Conversation.objects.filter(id__in=conversation_ids)
+            .filter(Q(retention_days__isnull=False) | Q(retention_max_messages__isnull=False))
+            .values_list("id", "retention_days", "retention_max_messages")
+        )
+        for conversation_id, days, max_messages in overrides:
+            policies[conversation_ids[conversation_id]] = RetentionPolicy(
+                self.policy.max_age_days if days is None else days,
+                self.policy.max_length if max_messages is None else max_messages,
+            )
+        return policies
+
+    def trim(self, keys: list[str]) -> list[TrimResult]:
+        """
+        Trim a batch of streams to their retention policies
+
+        Args:
+            keys: Stream keys, e.g. from a SCAN
+
+        Returns:
+            Results for the streams that were trimmed
+        """
+        policies = self.get_policies(keys)
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.xlen(key)
+            pipe.xinfo_groups(key)
+            pipe.memory_usage(key)
+        state = pipe.execute(raise_on_error=False)
+
+        # Bounds from the policies, then what consumer groups still need
+        streams = {}
+        pipe = self.redis_client.pipeline(transaction=False)
+        now = datetime.now(timezone.utc)
+        for index, key in enumerate(keys):
+            length, groups, bytes_before = state[index * 3 : index * 3 + 3]
+            if any(isinstance(value, Exception) for value in (length, groups)):
+                # Deleted since it was scanned
+                continue
+            policy = policies[key]
+            excess = length - policy.max_length if policy.max_length else 0
+            if not policy.max_age_days and excess <= 0:
+                continue
+
+            streams[key] = {
+                "min_id": (
+                    timestamp_to_stream_id(now - timedelta(days=policy.max_age_days))
+                    if policy.max_age_days
+                    else None
+                ),
+                "excess": excess,
+                "max_length": policy.max_length,
+                "groups": groups,
+                "bytes_before": bytes_before or 0,
+            }
+            if 0 < excess <= policy.max_length:
+                # The entries to drop, the newest of which bounds the trim
+                pipe.xrange(key, "-", "+", count=excess)
+            elif excess > 0:
+                # The entries to keep, the oldest of which bounds the trim
+                pipe.xrevrange(key, "+", "-", count=policy.max_length)
+            for group in groups:
+                if group["pending"]:
+                    pipe.xpending(key, group["name"])
+        bounds = iter(pipe.execute())
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, stream in streams.items():
+            min_id = stream["min_id"]
+            excess = stream["excess"]
+            if 0 < excess <= stream["max_length"]:
+                entries = next(bounds)
+                if len(entries) == excess:
+                    min_id = later_stream_id(min_id, next_stream_id(entries[-1][0]))
+            elif excess > 0:
+                entries = next(bounds)
+                if len(entries) == stream["max_length"]:
+                    min_id = later_stream_id(min_id, entries[-1][0])
+
+            floor = None
+            for group in stream["groups"]:
+                if group["pending"]:
+                    needed = next(bounds)["min"]
+                else:
+                    needed = next_stream_id(group["last-delivered-id"])
+                if floor is None or parse_stream_id(needed) < parse_stream_id(floor):
+                    floor = needed
+
+            stream["held_back"] = (
+                min_id is not None
+                and floor is not None
+                and parse_stream_id(floor) < parse_stream_id(min_id)
+            )
+            if stream["held_back"]:
+                min_id = floor
+            stream["queued"] = min_id is not None
+            if stream["queued"]:
+                pipe.xtrim(key, minid=min_id, approximate=False)
+                pipe.memory_usage(key)
+        trimmed = iter(pipe.execute())
+
+        results = []
+        for key, stream in streams.items():
+            if not stream["queued"]:
+                continue
+            count, bytes_after = next(trimmed), next(trimmed)
+            if count or stream["held_back"]:
+                results.append(
+                    TrimResult(
+                        key, count, stream["bytes_before"], bytes_after or 0, stream["held_back"]
+                    )
+                )
+        return results
+
+
+def trim_all_streams(batch_size: int = 500, on_result=None) -> dict[str, int]:
+    """
+    Walk every conversation stream with SCAN and apply its retention policy
+
+    Args:
+        batch_size: Keys per SCAN call and streams per batch
+        on_result: Optional callback for each TrimResult
+
+    Returns:
+        Totals of streams seen, streams trimmed, entries trimmed, bytes
+        reclaimed and streams held back by consumer groups
+    """
+    trimmer = StreamTrimmer()
+    totals = {"streams": 0, "trimmed_streams": 0, "entries": 0, "bytes": 0, "held_back": 0}
+    started = time.monotonic()
+
+    batch = []
+    for key in scan_conversation_streams(trimmer.redis_client, batch_size):
+        batch.append(key)
+        if len(batch) < batch_size:
+            continue
+        _trim_batch(trimmer, batch, totals, on_result)
+        batch = []
+    if batch:
+        _trim_batch(trimmer, batch, totals, on_result)
+
+    logger.info(
+        "Stream retention applied",
+        extra={**totals, "duration_ms": int((time.monotonic() - started) * 1000)},
+    )
+    return totals
+
+
+def _trim_batch(trimmer: StreamTrimmer, batch: list[str], totals: dict[str, int], on_result):
+    """Trim one batch of streams and add its results to totals"""
+    totals["streams"] += len(batch)
+    try:
+        results = trimmer.trim(batch)
+    except redis.RedisError as e:
+        logger.error(
+            "Failed to trim streams",
+            extra={"count": len(batch), "error": str(e)},
+        )
+        return
+    for result in results:
+        totals["trimmed_streams"] += 1 if result.trimmed else 0
+        totals["entries"] += result.trimmed
+        totals["bytes"] += max(result.bytes_before - result.bytes_after, 0)
+        totals["held_back"] += 1 if result.held_back else 0
+        if on_result:
+            on_result(result)
@@ -1,10 +1,11 @@
 from django.urls import re_path
 
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, MultiplexChatConsumer
 
 websocket_urlpatterns = [
     re_path(
         r"ws/conversations/(?P<conversation_id>[0-9a-f-]+)/$",
         ChatConsumer.as_asgi(),
     ),
+    re_path(r"ws/conversations/$", MultiplexChatConsumer.as_asgi()),
 ]
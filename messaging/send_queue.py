@@ -0,0 +1,143 @@
+"""
+Bounded outbound queues for WebSocket connections
+"""
+
+import logging
+from collections import deque
+from typing import NamedTuple, Optional
+
+from .redis_stream import previous_stream_id
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+CLOSE = "close"
+
+
+class QueuedFrame(NamedTuple):
+    """A live message frame waiting to be sent, or a resync hint if text is None"""
+
+    conversation_id: str
+    message_id: str
+    text: Optional[str]
+
+
+class SendQueueMetrics:
+    """Queue depth and overflow counters of this worker's connections"""
+
+    def __init__(self):
+        self.queues = 0
+        self.depth = 0
+        self.max_depth = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.closed = 0
+
+    def snapshot(self) -> dict[str, int]:
+        """Current values, e.g. for the health check"""
+        return {
+            "queues": self.queues,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+            "closed": self.closed,
+        }
+
+
+class SendQueue:
+    """
+    Live message frames waiting to be written to one WebSocket
+
+    Holds at most max_size frames. When a slow client lets it fill up, the
+    drop_oldest policy discards the queued frames of the conversation whose
+    frame is oldest and queues a resync hint in their place, naming the last
+    message of that conversation the client was sent, so the client refetches
+    the gap. The close policy refuses the frame instead, and the connection is
+    expected to be closed.
+    """
+
+    def __init__(self, max_size: int, policy: str = DROP_OLDEST):
+        """
+        Args:
+            max_size: Most frames held
+            policy: DROP_OLDEST or CLOSE
+        """
+        self.max_size = max_size
+        self.policy = policy
+        self.frames = deque()
+        # conversation_id -> ID of the newest message sent to the client
+        self.last_sent_ids = {}
+        self.closed = False
+        send_queue_metrics.queues += 1
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def put(self, conversation_id: str, message_id: str, text: str) -> bool:
+        """
+        Queue a message frame
+
+        Returns:
+            False if the queue is full and the policy is to close
+        """
+        if len(self.frames) >= self.max_size and self.policy == CLOSE:
+            return False
+
+        self._append(QueuedFrame(conversation_id, message_id, text))
+        if len(self.frames) > self.max_size:
+            self._drop_oldest()
+        return True
+
+    def get(self) -> Optional[QueuedFrame]:
+        """Take the next frame to send, or None if the queue is empty"""
+        if not self.frames:
+            return None
+        frame = self.frames.popleft()
+        send_queue_metrics.depth -= 1
+        if frame.text is not None:
+            self.last_sent_ids[frame.conversation_id] = frame.message_id
+        return frame
+
+    def close(self):
+        """Discard queued frames when the connection goes away"""
+        self.closed = True
+        send_queue_metrics.depth -= len(self.frames)
+        send_queue_metrics.queues -= 1
+        self.frames.clear()
+
+    def _append(self, frame: QueuedFrame):
+        self.frames.append(frame)
+        send_queue_metrics.depth += 1
+        send_queue_metrics.max_depth = max(send_queue_metrics.max_depth, len(self.frames))
+
+    def _drop_oldest(self):
+        """Replace the oldest conversation's queued frames with a resync hint"""
+        oldest = next(frame for frame in self.frames if frame.text is not None)
+        conversation_id = oldest.conversation_id
+
+        last_id = self.last_sent_ids.get(conversation_id) or previous_stream_id(oldest.message_id)
+        kept = deque()
+        dropped = 0
+        for frame in self.frames:
+            if frame.conversation_id != conversation_id:
+                kept.append(frame)
+            elif frame.text is None:
+                # An earlier hint already covers the start of the gap
+                last_id = frame.message_id
+            else:
+                dropped += 1
+        send_queue_metrics.depth -= len(self.frames) - len(kept)
+        send_queue_metrics.dropped += dropped
+        send_queue_metrics.resyncs += 1
+        self.frames = kept
+
+        self._append(QueuedFrame(conversation_id, last_id, None))
+        logger.warning(
+            "WebSocket send queue full, dropped messages",
+            extra={"conversation_id": conversation_id, "dropped": dropped, "last_id": last_id},
+        )
+
+
+# Worker-wide metrics
+send_queue_metrics = SendQueueMetrics()
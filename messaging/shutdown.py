@@ -0,0 +1,74 @@
+"""
+Graceful shutdown of this worker's WebSocket connections
+"""
+
+import asyncio
+import logging
+import random
+import signal
+import threading
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Close code for connections closed by a restarting server, after HTTP 503
+CLOSE_CODE_RESTARTING = 4503
+
+# Open consumers of this worker
+open_connections = weakref.WeakSet()
+
+_installed = False
+
+
+async def close_all_connections(code: int = CLOSE_CODE_RESTARTING):
+    """
+    Close every open connection with its own reconnect delay
+
+    Delays are spread uniformly over
+    CHAT_WEBSOCKET["SHUTDOWN_RECONNECT_SPREAD_SECONDS"], so clients come back
+    over that window instead of all at once.
+    """
+    spread = settings.CHAT_WEBSOCKET["SHUTDOWN_RECONNECT_SPREAD_SECONDS"]
+    consumers = list(open_connections)
+    logger.info("Closing WebSocket connections for shutdown", extra={"count": len(consumers)})
+    for consumer in consumers:
+        try:
+            await consumer.close_with_retry_after(code, round(random.uniform(0, spread), 1))
+        except Exception as e:
+            logger.error("Failed to close WebSocket for shutdown", extra={"error": str(e)})
+
+
+def install_shutdown_handler():
+    """
+    Close connections with reconnect hints when the worker gets SIGTERM
+
+    Installed from the event loop on the first connection, after the ASGI
+    server has set up its own handler, which is then called once
+    CHAT_WEBSOCKET["SHUTDOWN_GRACE_SECONDS"] have passed so the close frames
+    can go out first.
+    """
+    global _installed
+    if _installed or threading.current_thread() is not threading.main_thread():
+        return
+    _installed = True
+
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def shut_down():
+        """Hand over to the server's own SIGTERM handling"""
+        if callable(previous):
+            previous(signal.SIGTERM, None)
+        else:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.raise_signal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        loop.call_soon_threadsafe(lambda: asyncio.ensure_future(close_all_connections()))
+        loop.call_soon_threadsafe(
+            loop.call_later, settings.CHAT_WEBSOCKET["SHUTDOWN_GRACE_SECONDS"], shut_down
+        )
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
@@ -0,0 +1,22 @@
+"""
+Signal handlers for messaging
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from conversations.models import Conversation
+
+from .cleanup import purge_conversations
+
+
+@receiver(post_delete, sender=Conversation)
+def purge_deleted_conversation(sender, instance, **kwargs):
+    """
+    Remove a deleted conversation's Redis keys and stored history
+
+    Runs after commit, so a rolled back deletion keeps its messages.
+    """
+    conversation_id = instance.id
+    transaction.on_commit(lambda: purge_conversations([conversation_id]))
@@ -1,29 +1,465 @@
 import logging
+import threading
+import time
+from typing import NamedTuple, Optional, Union
 
 import redis
+import redis.asyncio as aioredis
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+FIXED_WINDOW = "fixed_window"
+TOKEN_BUCKET = "token_bucket"
 
-class MessageThrottler:
+# Limit scopes, checked together on every send
+USER_CONVERSATION = "user_conversation"
+USER = "user"
+CONVERSATION = "conversation"
+
+# Fixed window counters, one per limit. The window TTL is set in the same
+# call as the increment, and a counter that somehow lost its TTL is repaired
+# on the next check, so a key can never outlive its window. Nothing is
+# consumed unless every limit has room.
+# ARGV: limit, window_ms, cost and min_cost for each key. Up to `cost` is
+# granted from a key as long as at least `min_cost` fits under every limit.
+# Returns {allowed, tripped_index, remaining, retry_after_ms, granted...}
+# with the amount granted from each key.
+FIXED_WINDOW_SCRIPT = """
+local tripped = 0
+local retry_after = 0
+local remaining = -1
+local left = -1
+local ttls = {}
+local grants = {}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 4 - 3])
+    local window = tonumber(ARGV[i * 4 - 2])
+    local cost = tonumber(ARGV[i * 4 - 1])
+    local min_cost = tonumber(ARGV[i * 4])
+    local count = tonumber(redis.call('GET', key) or '0')
+    local ttl = redis.call('PTTL', key)
+    if ttl == -1 then
+        redis.call('PEXPIRE', key, window)
+    end
+    if ttl < 0 then
+        ttl = window
+    end
+    ttls[i] = ttl
+    local available = math.max(limit - count, 0)
+    if available < min_cost and (tripped == 0 or ttl > retry_after) then
+        tripped = i
+        retry_after = ttl
+    end
+    grants[i] = math.min(cost, available)
+    if remaining < 0 or available < remaining then
+        remaining = available
+    end
+    if left < 0 or available - grants[i] < left then
+        left = available - grants[i]
+    end
+end
+if tripped > 0 then
+    return {0, tripped, remaining, retry_after}
+end
+local result = {1, 0, left, 0}
+for i, key in ipairs(KEYS) do
+    if grants[i] > 0 then
+        redis.call('INCRBY', key, grants[i])
+        redis.call('PEXPIRE', key, ttls[i])
+    end
+    result[i + 4] = grants[i]
+end
+return result
+"""
+
+# Token buckets, one per limit, each holding `limit` tokens and refilling the
+# whole bucket over its window. Uses the Redis clock so all workers agree on
+# elapsed time. Nothing is consumed unless every bucket has enough tokens.
+# ARGV and return value as for FIXED_WINDOW_SCRIPT.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tripped = 0
+local retry_after = 0
+local remaining = -1
+local left = -1
+local levels = {}
+local grants = {}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 4 - 3])
+    local rate = limit / tonumber(ARGV[i * 4 - 2])
+    local cost = tonumber(ARGV[i * 4 - 1])
+    local min_cost = tonumber(ARGV[i * 4])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or limit
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(limit, tokens + math.max(now - ts, 0) * rate)
+    levels[i] = tokens
+    if tokens < min_cost then
+        local wait = math.ceil((min_cost - tokens) / rate)
+        if tripped == 0 or wait > retry_after then
+            tripped = i
+            retry_after = wait
+        end
+    end
+    grants[i] = math.min(cost, math.floor(tokens))
+    if remaining < 0 or tokens < remaining then
+        remaining = tokens
+    end
+    if left < 0 or tokens - grants[i] < left then
+        left = tokens - grants[i]
+    end
+end
+if tripped > 0 then
+    return {0, tripped, math.floor(remaining), retry_after}
+end
+local result = {1, 0, math.floor(left), 0}
+for i, key in ipairs(KEYS) do
+    if grants[i] > 0 then
+        local limit = tonumber(ARGV[i * 4 - 3])
+        local rate = limit / tonumber(ARGV[i * 4 - 2])
+        local tokens = levels[i] - grants[i]
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+        redis.call('PEXPIRE', key, math.ceil((limit - tokens) / rate) + 1)
+    end
+    result[i + 4] = grants[i]
+end
+return result
+"""
+
+# Upper bound on locally held leases before expired ones are pruned
+MAX_LEASES = 10000
+
+THROTTLE_SCRIPTS = {
+    FIXED_WINDOW: FIXED_WINDOW_SCRIPT,
+    TOKEN_BUCKET: TOKEN_BUCKET_SCRIPT,
+}
+
+
+class ThrottleLimit(NamedTuple):
+    """A single send limit within a throttle policy"""
+
+    scope: str
+    max_messages: int
+    window_seconds: int
+
+
+class ThrottleResult(NamedTuple):
+    """Outcome of a throttle check"""
+
+    allowed: bool
+    remaining: int
+    retry_after: float
+    # Scope of the limit that rejected the message, None when allowed
+    limit: Optional[str] = None
+
+
+class ThrottleCall(NamedTuple):
+    """Keys and script arguments of a check that needs Redis"""
+
+    keys: list[str]
+    limits: list[ThrottleLimit]
+    args: list[int]
+    # Keys whose quota came from local leases, given back if refused
+    leased_keys: tuple[str, ...] = ()
+    leasing: bool = False
+
+
+def get_throttle_policy() -> tuple[str, list[ThrottleLimit]]:
     """
-    Rate limiter for messages using Redis
+    Read the throttle algorithm and limits from settings.MESSAGE_THROTTLE
+
+    Returns:
+        Tuple of (algorithm, limits); limits set to None in settings are skipped
+    """
+    config = getattr(settings, "MESSAGE_THROTTLE", {})
+    algorithm = config.get("ALGORITHM", FIXED_WINDOW)
+    limits = [
+        ThrottleLimit(scope, limit["max_messages"], limit["window_seconds"])
+        for scope, limit in config.get("LIMITS", {}).items()
+        if limit
+    ]
+    return algorithm, limits or [ThrottleLimit(USER_CONVERSATION, 10, 60)]
+
+
+def get_lease_policy() -> tuple[int, float]:
+    """
+    Read the quota leasing options from settings.MESSAGE_THROTTLE
+
+    Returns:
+        Tuple of (lease_size, lease_seconds); a lease_size of 0 disables leasing
+    """
+    config = getattr(settings, "MESSAGE_THROTTLE", {})
+    return config.get("LEASE_SIZE", 0), config.get("LEASE_SECONDS", 5)
+
+
+class BaseMessageThrottler:
+    """
+    Limits and key scheme shared by the sync and async throttlers
+
+    Each check is a single EVALSHA of a server-side script, registered once
+    per client and reloaded automatically if Redis loses its script cache.
+    All limits of the policy are checked and consumed in that one call.
+
+    With leasing enabled, a check takes up to `lease_size` messages of quota
+    from a limit's Redis key at once, and the rest is spent in process memory
+    by every later message that counts against the same key, until the lease
+    runs out or is `lease_seconds` old. Leases are held per key, so the
+    per-user lease is shared by all of a user's conversations on this worker
+    and the conversation-wide lease by all of its senders. A message whose
+    keys all have leased quota left needs no Redis call, and otherwise only
+    the keys without it are taken from Redis. Leased quota counts against
+    the limits as soon as it is taken, so leasing never lets a user exceed a
+    limit within one window. Per worker and key, at most `lease_size - 1`
+    messages can be refused early while another worker holds quota, or
+    carried across a window boundary.
     """
 
-    def __init__(self, max_messages: int = 10, window_seconds: int = 60):
+    def __init__(
+        self,
+        max_messages: int = 10,
+        window_seconds: int = 60,
+        algorithm: str = FIXED_WINDOW,
+        limits: Optional[list[ThrottleLimit]] = None,
+        lease_size: int = 0,
+        lease_seconds: float = 5,
+    ):
         """
         Args:
             max_messages: Maximum messages allowed in the time window
             window_seconds: Time window in seconds
+            algorithm: FIXED_WINDOW or TOKEN_BUCKET
+            limits: Limits to enforce together; overrides max_messages and
+                window_seconds, which otherwise define a single
+                per-user-per-conversation limit
+            lease_size: Messages of quota to lease per Redis call (0 or 1
+                disables leasing)
+            lease_seconds: How long leased quota may be spent locally
         """
-        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-        self.max_messages = max_messages
-        self.window_seconds = window_seconds
+        if algorithm not in THROTTLE_SCRIPTS:
+            raise ValueError(f"Unknown throttle algorithm: {algorithm}")
+        self.limits = limits or [ThrottleLimit(USER_CONVERSATION, max_messages, window_seconds)]
+        for limit in self.limits:
+            if limit.scope not in (USER_CONVERSATION, USER, CONVERSATION):
+                raise ValueError(f"Unknown throttle scope: {limit.scope}")
+        self.max_messages = min(limit.max_messages for limit in self.limits)
+        self.algorithm = algorithm
+        self.lease_size = lease_size
+        self.lease_seconds = lease_seconds
+        # Redis key -> [messages left, monotonic expiry]
+        self._leases: dict[str, list] = {}
+        self._lease_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        """Build a throttler from settings.MESSAGE_THROTTLE"""
+        algorithm, limits = get_throttle_policy()
+        lease_size, lease_seconds = get_lease_policy()
+        return cls(
+            algorithm=algorithm,
+            limits=limits,
+            lease_size=lease_size,
+            lease_seconds=lease_seconds,
+        )
 
-    def _get_throttle_key(self, user_id: int, conversation_id: str) -> str:
+    def _get_throttle_key(self, scope: str, user_id: int, conversation_id: str) -> str:
         """Generate Redis key for throttling"""
-        return f"throttle:{user_id}:{conversation_id}"
+        if scope == USER:
+            key = f"throttle:user:{user_id}"
+        elif scope == CONVERSATION:
+            key = f"throttle:conv:{conversation_id}"
+        else:
+            key = f"throttle:{user_id}:{conversation_id}"
+        if self.algorithm == TOKEN_BUCKET:
+            return f"{key}:bucket"
+        return key
+
+    def _get_throttle_keys(self, user_id: int, conversation_id: str) -> list[str]:
+        """Generate Redis keys for every limit of the policy"""
+        return [
+            self._get_throttle_key(limit.scope, user_id, conversation_id) for limit in self.limits
+        ]
+
+    def _script_args(
+        self, limits: list[ThrottleLimit], costs: list[int], min_costs: list[int]
+    ) -> list[int]:
+        """Build the ARGV list for the throttle script"""
+        args = []
+        for limit, cost, min_cost in zip(limits, costs, min_costs):
+            args.extend([limit.max_messages, limit.window_seconds * 1000, cost, min_cost])
+        return args
+
+    def _is_leasing(self, cost: int) -> bool:
+        """Whether a check of this cost is served from leased quota"""
+        return self.lease_size > 1 and cost == 1
+
+    def _plan_check(
+        self, user_id: int, conversation_id: str, cost: int
+    ) -> Union[ThrottleResult, ThrottleCall]:
+        """
+        Work out which limits a check needs Redis for
+
+        Returns:
+            ThrottleResult if local leases cover the whole message, otherwise
+            a ThrottleCall for the throttle script
+        """
+        keys = self._get_throttle_keys(user_id, conversation_id)
+        if not self._is_leasing(cost):
+            costs = [cost] * len(keys)
+            return ThrottleCall(keys, self.limits, self._script_args(self.limits, costs, costs))
+
+        taken = self._take_leases(keys)
+        if all(left is not None for left in taken):
+            return ThrottleResult(True, min(taken), 0.0)
+
+        call_keys, call_limits, leased_keys = [], [], []
+        for key, limit, left in zip(keys, self.limits, taken):
+            if left is None:
+                call_keys.append(key)
+                call_limits.append(limit)
+            else:
+                leased_keys.append(key)
+        args = self._script_args(
+            call_limits, [self.lease_size] * len(call_keys), [1] * len(call_keys)
+        )
+        return ThrottleCall(call_keys, call_limits, args, tuple(leased_keys), leasing=True)
+
+    def _finish_check(
+        self, user_id: int, conversation_id: str, call: ThrottleCall, response: list
+    ) -> ThrottleResult:
+        """Turn a script response into a ThrottleResult, keeping any new leases"""
+        allowed, tripped, remaining, retry_after_ms = response[:4]
+        result = ThrottleResult(
+            bool(allowed),
+            int(remaining),
+            int(retry_after_ms) / 1000,
+            call.limits[tripped - 1].scope if tripped else None,
+        )
+        if call.leasing:
+            if result.allowed:
+                self._store_leases(call.keys, [int(granted) for granted in response[4:]])
+            else:
+                self._return_leases(call.leased_keys)
+        if not result.allowed:
+            self._log_throttled(user_id, conversation_id, result)
+        return result
+
+    def _take_leases(self, keys: list[str]) -> list[Optional[int]]:
+        """
+        Spend one message from the local lease of every key that has one
+
+        Returns:
+            Messages left in each key's lease, None for keys without quota
+        """
+        now = time.monotonic()
+        taken = []
+        with self._lease_lock:
+            for key in keys:
+                lease = self._leases.get(key)
+                if lease and lease[0] > 0 and lease[1] > now:
+                    lease[0] -= 1
+                    taken.append(lease[0])
+                else:
+                    taken.append(None)
+        return taken
+
+    def _return_leases(self, keys: tuple[str, ...]):
+        """Give back messages taken from local leases for a refused message"""
+        with self._lease_lock:
+            for key in keys:
+                lease = self._leases.get(key)
+                if lease:
+                    lease[0] += 1
+
+    def _store_leases(self, keys: list[str], grants: list[int]):
+        """Keep quota granted beyond the current message for local spending"""
+        with self._lease_lock:
+            if len(self._leases) >= MAX_LEASES:
+                now = time.monotonic()
+                self._leases = {key: lease for key, lease in self._leases.items() if lease[1] > now}
+            expires = time.monotonic() + self.lease_seconds
+            for key, granted in zip(keys, grants):
+                self._leases[key] = [granted - 1, expires]
+
+    def _fail_open(self) -> ThrottleResult:
+        """Result used when Redis is unavailable"""
+        return ThrottleResult(True, self.max_messages, 0.0)
+
+    def _log_throttled(self, user_id: int, conversation_id: str, result: ThrottleResult):
+        """Log a rejected message"""
+        logger.warning(
+            "User throttled",
+            extra={
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "limit": result.limit,
+                "retry_after": result.retry_after,
+            },
+        )
+
+    def _log_failure(self, user_id: int, conversation_id: str, error: Exception):
+        """Log a Redis failure during a throttle check"""
+        logger.error(
+            "Throttle check failed",
+            extra={
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "error": str(error),
+            },
+        )
+
+
+class MessageThrottler(BaseMessageThrottler):
+    """
+    Rate limiter for messages using Redis
+    """
+
+    def __init__(
+        self,
+        max_messages: int = 10,
+        window_seconds: int = 60,
+        algorithm: str = FIXED_WINDOW,
+        limits: Optional[list[ThrottleLimit]] = None,
+        lease_size: int = 0,
+        lease_seconds: float = 5,
+    ):
+        super().__init__(
+            max_messages=max_messages,
+            window_seconds=window_seconds,
+            algorithm=algorithm,
+            limits=limits,
+            lease_size=lease_size,
+            lease_seconds=lease_seconds,
+        )
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.script = self.redis_client.register_script(THROTTLE_SCRIPTS[algorithm])
+
+    def check(self, user_id: int, conversation_id: str, cost: int = 1) -> ThrottleResult:
+        """
+        Atomically check and consume quota against every limit of the policy
+
+        Args:
+            user_id: ID of the user
+            conversation_id: UUID of the conversation
+            cost: Number of messages to consume (0 only inspects the quota)
+
+        Returns:
+            ThrottleResult with allowed flag, remaining quota, retry-after
+            seconds and the scope of the limit that tripped
+        """
+        call = self._plan_check(user_id, conversation_id, cost)
+        if isinstance(call, ThrottleResult):
+            return call
+
+        try:
+            response = self.script(keys=call.keys, args=call.args)
+        except redis.RedisError as e:
+            self._log_failure(user_id, conversation_id, e)
+            # Allow message on Redis failure (fail open)
+            return self._fail_open()
+
+        return self._finish_check(user_id, conversation_id, call, response)
 
     def is_allowed(self, user_id: int, conversation_id: str) -> bool:
         """
@@ -36,44 +472,89 @@ class MessageThrottler:
         Returns:
             True if allowed, False if throttled
         """
-        try:
-            key = self._get_throttle_key(user_id, conversation_id)
+        return self.check(user_id, conversation_id).allowed
 
-            # Increment counter
-            count = self.redis_client.incr(key)
+    def get_remaining(self, user_id: int, conversation_id: str) -> int:
+        """
+        Get remaining messages allowed in current window
 
-            # Set expiry on first message
-            if count == 1:
-                self.redis_client.expire(key, self.window_seconds)
+        Args:
+            user_id: ID of the user
+            conversation_id: UUID of the conversation
 
-            is_allowed = count <= self.max_messages
+        Returns:
+            Number of remaining messages allowed
+        """
+        return self.check(user_id, conversation_id, cost=0).remaining
 
-            if not is_allowed:
-                logger.warning(
-                    "User throttled",
-                    extra={
-                        "user_id": user_id,
-                        "conversation_id": conversation_id,
-                        "count": count,
-                        "max": self.max_messages,
-                    },
-                )
 
-            return is_allowed
+class AsyncMessageThrottler(BaseMessageThrottler):
+    """
+    asyncio rate limiter for messages using Redis
 
+    Safe to await from WebSocket consumers without blocking the event loop.
+    """
+
+    def __init__(
+        self,
+        max_messages: int = 10,
+        window_seconds: int = 60,
+        algorithm: str = FIXED_WINDOW,
+        limits: Optional[list[ThrottleLimit]] = None,
+        lease_size: int = 0,
+        lease_seconds: float = 5,
+    ):
+        super().__init__(
+            max_messages=max_messages,
+            window_seconds=window_seconds,
+            algorithm=algorithm,
+            limits=limits,
+            lease_size=lease_size,
+            lease_seconds=lease_seconds,
+        )
+        self.redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.script = self.redis_client.register_script(THROTTLE_SCRIPTS[algorithm])
+
+    async def check(self, user_id: int, conversation_id: str, cost: int = 1) -> ThrottleResult:
+        """
+        Atomically check and consume quota against every limit of the policy
+
+        Args:
+            user_id: ID of the user
+            conversation_id: UUID of the conversation
+            cost: Number of messages to consume (0 only inspects the quota)
+
+        Returns:
+            ThrottleResult with allowed flag, remaining quota, retry-after
+            seconds and the scope of the limit that tripped
+        """
+        call = self._plan_check(user_id, conversation_id, cost)
+        if isinstance(call, ThrottleResult):
+            return call
+
+        try:
+            response = await self.script(keys=call.keys, args=call.args)
         except redis.RedisError as e:
-            logger.error(
-                "Throttle check failed",
-                extra={
-                    "user_id": user_id,
-                    "conversation_id": conversation_id,
-                    "error": str(e),
-                },
-            )
+            self._log_failure(user_id, conversation_id, e)
             # Allow message on Redis failure (fail open)
-            return True
+            return self._fail_open()
 
-    def get_remaining(self, user_id: int, conversation_id: str) -> int:
+        return self._finish_check(user_id, conversation_id, call, response)
+
+    async def is_allowed(self, user_id: int, conversation_id: str) -> bool:
+        """
+        Check if user is allowed to send a message
+
+        Args:
+            user_id: ID of the user
+            conversation_id: UUID of the conversation
+
+        Returns:
+            True if allowed, False if throttled
+        """
+        return (await self.check(user_id, conversation_id)).allowed
+
+    async def get_remaining(self, user_id: int, conversation_id: str) -> int:
         """
         Get remaining messages allowed in current window
 
@@ -84,13 +565,9 @@ class MessageThrottler:
         Returns:
             Number of remaining messages allowed
         """
-        try:
-            key = self._get_throttle_key(user_id, conversation_id)
-            count = int(self.redis_client.get(key) or 0)
-            return max(0, self.max_messages - count)
-        except redis.RedisError:
-            return self.max_messages
+        return (await self.check(user_id, conversation_id, cost=0)).remaining
 
 
-# Default throttler instance
-message_throttler = MessageThrottler(max_messages=10, window_seconds=60)
+# Default throttler instances
+message_throttler = MessageThrottler.from_settings()
+async_message_throttler = AsyncMessageThrottler.from_settings()
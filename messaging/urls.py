@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import MessageHistoryView
+from .views import InboxView, MessageHistoryView, RedisMemoryView
 
 app_name = "messaging"
 
@@ -10,4 +10,6 @@ urlpatterns = [
         MessageHistoryView.as_view(),
         name="message-history",
     ),
+    path("inbox", InboxView.as_view(), name="inbox"),
+    path("admin/redis-memory", RedisMemoryView.as_view(), name="redis-memory"),
 ]
@@ -1,16 +1,45 @@
 import logging
+from datetime import datetime, time
+from typing import Optional
 
+import redis
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from conversations.models import Participant
+from conversations.membership import membership_cache
+from conversations.models import Conversation
 
-from .redis_stream import RedisStreamError, redis_stream_client
+from .archive import get_history_around, get_history_between, get_history_page
+from .cold_storage import cold_streams
+from .memory import memory_report
+from .read_cursors import read_cursors
+from .redis_stream import (
+    STREAM_ID_RE,
+    RedisStreamError,
+    parse_stream_id,
+    redis_stream_client,
+    timestamp_to_stream_id,
+)
 
 logger = logging.getLogger(__name__)
 
+TIME_PARAMS = ("around", "since", "until")
+
+
+def parse_time_param(value: str) -> Optional[datetime]:
+    """Parse an ISO 8601 date or datetime query parameter, None if invalid"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            parsed = datetime.combine(date, time.min) if date else None
+    except ValueError:
+        return None
+    return parsed
+
 
 class MessageHistoryView(APIView):
     """
@@ -24,15 +53,19 @@ class MessageHistoryView(APIView):
         """
         Retrieve message history for a conversation
 
+        Pages and time seeks reaching past the start of the conversation's
+        stream continue into the Postgres archive.
+
         Query parameters:
-        - from: Message ID to start from (optional)
-        - limit: Maximum number of messages to retrieve (default: 50, max: 100)
+        - from: Return messages after this ID (optional)
+        - before: Return messages before this ID, for scrolling back (optional)
+        - around: ISO timestamp to center a window of `limit` messages on
+          each side (optional)
+        - since / until: ISO timestamps bounding the messages returned (optional)
+        - limit: Maximum number of messages to retrieve (default: 50, clamped to 1-100)
         """
         # Check if user is a participant
-        if not Participant.objects.filter(
-            conversation_id=conversation_id,
-            user=request.user,
-        ).exists():
+        if not membership_cache.is_participant(conversation_id, request.user.id):
             logger.warning(
                 "Unauthorized message history access attempt",
                 extra={
@@ -47,21 +80,80 @@ class MessageHistoryView(APIView):
 
         # Parse query parameters
         from_id = request.query_params.get("from", "-")
+        before = request.query_params.get("before")
+        if from_id != "-" and before:
+            return Response(
+                {"error": "Use either 'from' or 'before', not both"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        for cursor in (from_id if from_id != "-" else None, before):
+            if cursor is not None and not STREAM_ID_RE.match(cursor):
+                return Response(
+                    {"error": "'from' and 'before' must be message IDs"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
         try:
-            limit = min(int(request.query_params.get("limit", 50)), 100)
+            limit = int(request.query_params.get("limit", 50))
         except ValueError:
             limit = 50
+        limit = max(1, min(limit, 100))
+
+        # Time-based seeks are converted to millisecond stream ID bounds
+        bounds = {}
+        for name in TIME_PARAMS:
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            parsed = parse_time_param(value)
+            if parsed is None:
+                return Response(
+                    {"error": f"'{name}' must be an ISO 8601 date or datetime"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            bounds[name] = timestamp_to_stream_id(parsed)
+        if (bounds and (from_id != "-" or before)) or ("around" in bounds and len(bounds) > 1):
+            return Response(
+                {"error": "'around', 'since'/'until' and 'from'/'before' cannot be combined"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         # Retrieve messages from Redis Stream
+        cold_streams.ensure_hot(conversation_id)
         try:
-            messages = redis_stream_client.get_messages(
-                conversation_id=conversation_id,
-                from_id=from_id,
-                limit=limit,
-            )
+            if "around" in bounds:
+                messages, has_more_before, has_more_after = get_history_around(
+                    conversation_id=conversation_id,
+                    around=bounds["around"],
+                    limit=limit,
+                )
+                has_more = has_more_before or has_more_after
+                paging_forward = False
+                older_exhausted = not has_more_before
+            else:
+                if bounds:
+                    messages, has_more = get_history_between(
+                        conversation_id=conversation_id,
+                        since=bounds.get("since"),
+                        until=bounds.get("until"),
+                        limit=limit,
+                    )
+                    paging_forward = "since" in bounds
+                else:
+                    messages, has_more = get_history_page(
+                        conversation_id=conversation_id,
+                        from_id=from_id,
+                        before=before,
+                        limit=limit,
+                    )
+                    paging_forward = from_id != "-"
+                older_exhausted = not paging_forward and not has_more
 
-            # Determine next_from for pagination
-            next_from = messages[-1]["id"] if messages else None
+            # Cursors for the neighbouring pages: prev pages back from the
+            # oldest message returned, next pages forward from the newest
+            prev_cursor = messages[0]["id"] if messages else before
+            next_cursor = messages[-1]["id"] if messages else (from_id if paging_forward else None)
+            if older_exhausted:
+                prev_cursor = None
 
             logger.info(
                 "Message history retrieved",
@@ -76,7 +168,10 @@ class MessageHistoryView(APIView):
                 {
                     "conversation_id": conversation_id,
                     "messages": messages,
-                    "next_from": next_from,
+                    "has_more": has_more,
+                    "prev": prev_cursor,
+                    "next": next_cursor,
+                    "next_from": next_cursor,
                 },
                 status=status.HTTP_200_OK,
             )
@@ -94,3 +189,98 @@ class MessageHistoryView(APIView):
                 {"error": "Failed to retrieve messages"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+
+class InboxView(APIView):
+    """
+    API endpoint for the requesting user's inbox
+    GET /api/v1/inbox
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        List the user's conversations with their last message, message count
+        and unread count, most recently active first
+        """
+        conversations = list(
+            Conversation.objects.filter(participants__user=request.user)
+            .distinct()
+            .values("id", "name")
+        )
+        conversation_ids = [str(conversation["id"]) for conversation in conversations]
+
+        try:
+            previews = redis_stream_client.get_previews(conversation_ids)
+        except RedisStreamError as e:
+            logger.error(
+                "Failed to retrieve inbox",
+                extra={"user_id": request.user.id, "error": str(e)},
+            )
+            return Response(
+                {"error": "Failed to retrieve inbox"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        unread_counts = read_cursors.get_unread_counts(request.user.id, conversation_ids)
+
+        inbox = [
+            {
+                "conversation_id": conversation_id,
+                "name": conversation["name"],
+                **previews[conversation_id],
+                "unread_count": unread_counts.get(conversation_id, 0),
+            }
+            for conversation_id, conversation in zip(conversation_ids, conversations)
+        ]
+        # Conversations without messages keep their creation order at the end
+        inbox.sort(
+            key=lambda entry: (
+                parse_stream_id(entry["last_message"]["id"]) if entry["last_message"] else (0, 0)
+            ),
+            reverse=True,
+        )
+
+        return Response({"conversations": inbox}, status=status.HTTP_200_OK)
+
+
+class RedisMemoryView(APIView):
+    """
+    Admin-only API endpoint for Redis memory used per conversation
+    GET /api/v1/admin/redis-memory
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        Sample stream memory and throttle keys
+
+        Query parameters:
+        - top: Conversations to list per metric (default: 10, max: 100)
+        - max_keys: Keys of each kind to sample (default: 10000, 0 for all)
+        """
+        try:
+            top = min(int(request.query_params.get("top", 10)), 100)
+            max_keys = int(request.query_params.get("max_keys", 10000))
+        except ValueError:
+            return Response(
+                {"error": "top and max_keys must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if top < 1 or max_keys < 0:
+            return Response(
+                {"error": "top must be positive and max_keys not negative"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            report = memory_report(top=top, max_keys=max_keys)
+        except redis.RedisError as e:
+            logger.error("Failed to build Redis memory report", extra={"error": str(e)})
+            return Response(
+                {"error": "Failed to build Redis memory report"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response(report, status=status.HTTP_200_OK)
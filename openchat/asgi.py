@@ -13,13 +13,14 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "openchat.settings.dev")
 
 django_asgi_app = get_asgi_application()
 
+from messaging.admission import ConnectionAdmissionMiddleware  # noqa: E402
 from messaging.routing import websocket_urlpatterns  # noqa: E402
 
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
         "websocket": AllowedHostsOriginValidator(
-            AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+            AuthMiddlewareStack(ConnectionAdmissionMiddleware(URLRouter(websocket_urlpatterns)))
         ),
     }
 )
@@ -92,6 +92,122 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Store new stream entries in the compact single-field encoding. Turn off
+# while workers on a release that only reads legacy entries are still running.
+REDIS_STREAM_COMPACT_ENCODING = os.getenv("REDIS_STREAM_COMPACT_ENCODING", "True") == "True"
+
+# Retention of conversation streams, enforced by the trim_streams command.
+# Conversations can override MAX_AGE_DAYS and MAX_LENGTH; 0 means no limit.
+REDIS_STREAM_RETENTION = {
+    "MAX_AGE_DAYS": int(os.getenv("REDIS_STREAM_MAX_AGE_DAYS", "0")),
+    "MAX_LENGTH": int(os.getenv("REDIS_STREAM_MAX_LENGTH", "5000")),
+    # Approximate MAXLEN applied on every XADD, twice MAX_LENGTH by default.
+    # Unlike trim_streams it does not wait for the archiver, so streams stay
+    # bounded when the archiver stops (0 leaves trimming to the command)
+    "WRITE_MAXLEN": int(
+        os.getenv("REDIS_STREAM_WRITE_MAXLEN")
+        or 2 * int(os.getenv("REDIS_STREAM_MAX_LENGTH", "5000"))
+    ),
+}
+
+# Streams idle this long are moved to compressed chunks in Postgres by the
+# compact_cold_streams command and rehydrated when next read
+REDIS_STREAM_COLD_STORAGE = {
+    "IDLE_DAYS": int(os.getenv("REDIS_STREAM_COLD_IDLE_DAYS", "14")),
+    # Entries per compressed chunk
+    "CHUNK_SIZE": 1000,
+}
+
+# Write-behind archive of stream messages in Postgres, fed by the
+# archive_messages command through a Redis consumer group
+MESSAGE_ARCHIVE = {
+    # Fall back to the archive for history older than a conversation's stream
+    "ENABLED": os.getenv("MESSAGE_ARCHIVE_ENABLED", "True") == "True",
+    "GROUP": "archiver",
+    # Entries read per stream and rows per insert
+    "BATCH_SIZE": int(os.getenv("MESSAGE_ARCHIVE_BATCH_SIZE", "500")),
+    # Pause between passes when there was nothing to archive
+    "POLL_SECONDS": float(os.getenv("MESSAGE_ARCHIVE_POLL_SECONDS", "2")),
+    # Interval between full passes that scan every stream rather than only
+    # those written since the last pass
+    "RESCAN_SECONDS": float(os.getenv("MESSAGE_ARCHIVE_RESCAN_SECONDS", "300")),
+}
+
+# WebSocket chat
+CHAT_WEBSOCKET = {
+    # Most missed messages replayed on reconnect before asking for a refetch
+    "REPLAY_LIMIT": int(os.getenv("CHAT_REPLAY_LIMIT", "200")),
+    # Most conversations a single multiplexed connection may subscribe to
+    "MAX_SUBSCRIPTIONS": int(os.getenv("CHAT_MAX_SUBSCRIPTIONS", "200")),
+    # Buffer live messages this long and send them as one batch frame, for
+    # clients connecting with ?coalesce=1 (0 disables)
+    "COALESCE_MS": int(os.getenv("CHAT_COALESCE_MS", "0")),
+    # Flush a batch early once it holds this many messages
+    "COALESCE_MAX_BATCH": 50,
+    # Read receipts are collected this long and stored together
+    "READ_DEBOUNCE_MS": int(os.getenv("CHAT_READ_DEBOUNCE_MS", "1000")),
+    # "channel_layer" copies each message to every recipient's channel;
+    # "stream" has each worker XREAD the streams its sockets subscribe to
+    "FANOUT": os.getenv("CHAT_FANOUT", "channel_layer"),
+    # Most live messages waiting to be written to one socket. When a slow
+    # client fills the queue, "drop_oldest" replaces dropped messages with a
+    # resync frame and "close" closes the socket with code 4008
+    "SEND_QUEUE_SIZE": int(os.getenv("CHAT_SEND_QUEUE_SIZE", "256")),
+    "SLOW_CLIENT_POLICY": os.getenv("CHAT_SLOW_CLIENT_POLICY", "drop_oldest"),
+    # Most live frames written to a socket before the client acknowledges
+    # them by answering a ping; later frames wait in the queue (0 disables)
+    "SEND_WINDOW": int(os.getenv("CHAT_SEND_WINDOW", "128")),
+    # Ping clients this often (0 disables), and close sockets that send
+    # nothing, pongs included, for IDLE_TIMEOUT_SECONDS
+    "HEARTBEAT_SECONDS": int(os.getenv("CHAT_HEARTBEAT_SECONDS", "25")),
+    "IDLE_TIMEOUT_SECONDS": int(os.getenv("CHAT_IDLE_TIMEOUT_SECONDS", "60")),
+    # On SIGTERM, sockets are closed with reconnect delays spread over this
+    # many seconds, and the server shuts down SHUTDOWN_GRACE_SECONDS later
+    "SHUTDOWN_RECONNECT_SPREAD_SECONDS": int(os.getenv("CHAT_SHUTDOWN_RECONNECT_SPREAD", "30")),
+    "SHUTDOWN_GRACE_SECONDS": 2,
+}
+
+# WebSocket admission control. Open connections hold Redis leases of
+# LEASE_SECONDS, renewed while open; connections over a limit are closed
+# with code 4429 and a retry_after hint between RETRY_AFTER_SECONDS and
+# twice that. 0 disables a limit. Workers that share a NODE_ID (the
+# hostname by default) share MAX_CONNECTIONS_PER_NODE.
+WEBSOCKET_ADMISSION = {
+    "NODE_ID": os.getenv("WEBSOCKET_NODE_ID", ""),
+    "MAX_CONNECTIONS_PER_NODE": int(os.getenv("WEBSOCKET_MAX_CONNECTIONS_PER_NODE", "10000")),
+    "MAX_CONNECTIONS_PER_USER": int(os.getenv("WEBSOCKET_MAX_CONNECTIONS_PER_USER", "20")),
+    "LEASE_SECONDS": 60,
+    "RETRY_AFTER_SECONDS": int(os.getenv("WEBSOCKET_RETRY_AFTER_SECONDS", "10")),
+}
+
+# Message throttling
+# Every send is checked against all limits in one Redis call. A limit set to
+# None is disabled. ALGORITHM is "fixed_window" or "token_bucket".
+# LEASE_SIZE > 1 lets each worker take that many messages of quota per Redis
+# call and spend them locally for up to LEASE_SECONDS.
+MESSAGE_THROTTLE = {
+    "ALGORITHM": os.getenv("MESSAGE_THROTTLE_ALGORITHM", "fixed_window"),
+    "LEASE_SIZE": int(os.getenv("MESSAGE_THROTTLE_LEASE_SIZE", "0")),
+    "LEASE_SECONDS": 5,
+    "LIMITS": {
+        # Per user within a single conversation
+        "user_conversation": {
+            "max_messages": int(os.getenv("THROTTLE_USER_CONVERSATION_MAX", "10")),
+            "window_seconds": 60,
+        },
+        # Per user across all conversations
+        "user": {
+            "max_messages": int(os.getenv("THROTTLE_USER_MAX", "30")),
+            "window_seconds": 60,
+        },
+        # All users combined within a single conversation
+        "conversation": {
+            "max_messages": int(os.getenv("THROTTLE_CONVERSATION_MAX", "300")),
+            "window_seconds": 60,
+        },
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -0,0 +1,16 @@
+"""
+Shared test fixtures
+"""
+
+import pytest
+
+from messaging.redis_stream import RedisStreamClient
+
+
+@pytest.fixture
+def stream_client():
+    """Fixture for RedisStreamClient, with Redis emptied before and after"""
+    client = RedisStreamClient()
+    client.redis_client.flushdb()
+    yield client
+    client.redis_client.flushdb()
@@ -0,0 +1,103 @@
+"""
+Tests for WebSocket admission control
+"""
+
+import json
+
+import pytest
+
+from messaging.admission import (
+    CLOSE_CODE_RETRY_LATER,
+    NODE,
+    USER,
+    ConnectionAdmission,
+    ConnectionAdmissionMiddleware,
+)
+
+
+class FakeUser:
+    """Authenticated user for the middleware scope"""
+
+    id = 7
+    is_authenticated = True
+
+
+@pytest.fixture
+async def admission():
+    """ConnectionAdmission with small limits on a clean Redis"""
+    admission = ConnectionAdmission()
+    admission.node_limit = 3
+    admission.user_limit = 2
+    await admission.redis_client.flushdb()
+    yield admission
+    admission.leases.clear()
+    if admission.renew_task is not None:
+        admission.renew_task.cancel()
+    await admission.redis_client.flushdb()
+
+
+class TestConnectionAdmission:
+    """Test connection limits"""
+
+    async def test_user_limit(self, admission):
+        """Test a user's connections beyond the limit are refused until one closes"""
+        first = await admission.acquire(1)
+        await admission.acquire(1)
+
+        refused = await admission.acquire(1)
+
+        assert refused.allowed is False
+        assert refused.limit == USER
+        assert admission.retry_after <= refused.retry_after <= 2 * admission.retry_after
+        assert (await admission.acquire(2)).allowed is True
+
+        await admission.release(first.lease_id)
+        assert (await admission.acquire(1)).allowed is True
+
+    async def test_node_limit(self, admission):
+        """Test the node refuses connections once full, anonymous ones included"""
+        for user_id in (1, 2, None):
+            assert (await admission.acquire(user_id)).allowed is True
+
+        refused = await admission.acquire(3)
+
+        assert refused.limit == NODE
+
+    async def test_expired_leases(self, admission):
+        """Test leases that were not renewed stop counting"""
+        admission.lease_seconds = -1
+        await admission.acquire(1)
+        await admission.acquire(1)
+
+        admission.lease_seconds = 60
+        assert (await admission.acquire(1)).allowed is True
+
+
+class TestConnectionAdmissionMiddleware:
+    """Test refusing connections in the ASGI stack"""
+
+    async def test_refused_with_retry_after(self, admission, monkeypatch):
+        """Test an excess connection is closed with 4429 and a retry_after reason"""
+        monkeypatch.setattr("messaging.admission.connection_admission", admission)
+        admission.user_limit = 0
+        admission.node_limit = 0
+        await admission.acquire(FakeUser.id)
+        admission.node_limit = 1
+        sent = []
+
+        async def inner(scope, receive, send):
+            raise AssertionError("Refused connections must not reach the consumer")
+
+        async def receive():
+            return {"type": "websocket.connect"}
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = ConnectionAdmissionMiddleware(inner)
+        await middleware({"type": "websocket", "user": FakeUser()}, receive, send)
+
+        assert sent[0] == {"type": "websocket.accept"}
+        assert sent[1]["code"] == CLOSE_CODE_RETRY_LATER
+        retry_after = json.loads(sent[1]["reason"])["retry_after"]
+        assert admission.retry_after <= retry_after <= 2 * admission.retry_after
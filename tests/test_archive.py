@@ -0,0 +1,157 @@
+"""
+Tests for the Postgres message archive
+"""
+
+import uuid
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from messaging.archive import (
+    MessageArchiver,
+    get_history_around,
+    get_history_between,
+    get_history_page,
+)
+from messaging.models import ArchivedMessage
+
+
+@pytest.fixture
+def conversation_id():
+    """Fixture for a conversation ID; the archiver only keeps UUID streams"""
+    return str(uuid.uuid4())
+
+
+def add_messages(stream_client, conversation_id, count):
+    """Add `count` messages to a conversation and return their IDs"""
+    return [
+        stream_client.add_message(conversation_id, 1, "user1", f"Message {i}") for i in range(count)
+    ]
+
+
+@pytest.mark.django_db
+class TestMessageArchiver:
+    """Test copying streams into the archive"""
+
+    def test_run_once(self, stream_client, conversation_id):
+        """Test entries are archived and acknowledged"""
+        ids = add_messages(stream_client, conversation_id, 3)
+        archiver = MessageArchiver("test", batch_size=2)
+
+        assert archiver.run_once() == 2
+        assert archiver.run_once() == 1
+        assert archiver.run_once() == 0
+
+        archived = ArchivedMessage.objects.filter(conversation_id=conversation_id)
+        assert sorted(message.message_id for message in archived) == sorted(ids)
+        stream_key = f"stream:conv:{conversation_id}"
+        assert stream_client.redis_client.xpending(stream_key, "archiver")["pending"] == 0
+
+    def test_recovers_pending_entries(self, stream_client, conversation_id):
+        """Test entries delivered but never acknowledged are archived again"""
+        add_messages(stream_client, conversation_id, 2)
+        stream_key = f"stream:conv:{conversation_id}"
+        archiver = MessageArchiver("test")
+        archiver.discover_streams()
+        # Deliver without archiving, as if the archiver crashed mid-batch
+        stream_client.redis_client.xreadgroup("archiver", "test", {stream_key: ">"})
+
+        assert archiver.run_once() == 2
+        assert ArchivedMessage.objects.filter(conversation_id=conversation_id).count() == 2
+
+    def test_reads_only_written_streams(self, stream_client, conversation_id, monkeypatch):
+        """Test passes between full passes read only the streams written since"""
+        quiet_id = str(uuid.uuid4())
+        add_messages(stream_client, conversation_id, 1)
+        add_messages(stream_client, quiet_id, 1)
+        archiver = MessageArchiver("test", rescan_seconds=3600)
+        assert archiver.run_once() == 2
+
+        read = []
+        xreadgroup = archiver.redis_client.xreadgroup
+
+        def recording_xreadgroup(group, consumer, streams, **kwargs):
+            read.extend(streams)
+            return xreadgroup(group, consumer, streams, **kwargs)
+
+        monkeypatch.setattr(archiver.redis_client, "xreadgroup", recording_xreadgroup)
+        add_messages(stream_client, conversation_id, 1)
+
+        assert archiver.run_once() == 1
+        assert read == [f"stream:conv:{conversation_id}"]
+        read.clear()
+        assert archiver.run_once() == 0
+        assert read == []
+
+    def test_command_once(self, stream_client, conversation_id):
+        """Test archive_messages --once exits when caught up"""
+        add_messages(stream_client, conversation_id, 3)
+        out = StringIO()
+
+        call_command("archive_messages", "--once", "--batch-size", "2", stdout=out)
+
+        assert "Archived 3 entries" in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestHistoryFallback:
+    """Test history pages continuing into the archive"""
+
+    @pytest.fixture
+    def trimmed(self, stream_client, conversation_id):
+        """Five archived messages of which only the last two remain in the stream"""
+        ids = add_messages(stream_client, conversation_id, 5)
+        MessageArchiver("test").run_once()
+        stream_client.redis_client.xtrim(f"stream:conv:{conversation_id}", maxlen=2)
+        return ids
+
+    def test_backward_into_archive(self, conversation_id, trimmed):
+        """Test the latest page is completed from the archive"""
+        messages, has_more = get_history_page(conversation_id, limit=3)
+        assert [message["id"] for message in messages] == trimmed[2:]
+        assert messages[0]["username"] == "user1"
+        assert has_more is True
+
+        messages, has_more = get_history_page(conversation_id, before=trimmed[2], limit=3)
+        assert [message["id"] for message in messages] == trimmed[:2]
+        assert has_more is False
+
+    def test_forward_from_trimmed_cursor(self, conversation_id, trimmed):
+        """Test a cursor older than the stream pages through the archive"""
+        messages, has_more = get_history_page(conversation_id, from_id=trimmed[0], limit=2)
+        assert [message["id"] for message in messages] == trimmed[1:3]
+        assert has_more is True
+
+        messages, has_more = get_history_page(conversation_id, from_id=trimmed[2], limit=5)
+        assert [message["id"] for message in messages] == trimmed[3:]
+        assert has_more is False
+
+    def test_time_seeks_into_archive(self, stream_client, conversation_id):
+        """Test time seeks older than the stream read the archive"""
+        stream_key = f"stream:conv:{conversation_id}"
+        ids = [
+            stream_client.redis_client.xadd(
+                stream_key, {"p": f"1|1|At {second}"}, id=f"{second}000-0"
+            )
+            for second in range(1000, 1005)
+        ]
+        MessageArchiver("test").run_once()
+        stream_client.redis_client.xtrim(stream_key, maxlen=2)
+
+        messages, has_more_before, has_more_after = get_history_around(
+            conversation_id, around="1001000", limit=1
+        )
+        assert [message["id"] for message in messages] == ids[:2]
+        assert has_more_before is False
+        assert has_more_after is True
+
+        messages, has_more = get_history_between(
+            conversation_id, since="1000000", until="1003000", limit=3
+        )
+        assert [message["id"] for message in messages] == ids[:3]
+        assert has_more is True
+
+        messages, has_more = get_history_between(conversation_id, until="1001000", limit=5)
+        assert [message["id"] for message in messages] == ids[:2]
+        assert has_more is False
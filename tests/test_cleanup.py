@@ -0,0 +1,89 @@
+"""
+Tests for removing data of deleted conversations
+"""
+
+import uuid
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from conversations.models import Conversation
+from messaging.models import ColdStreamChunk
+from messaging.redis_stream import COLD_STREAMS_KEY
+
+User = get_user_model()
+
+
+@pytest.fixture
+def conversation(db):
+    """Conversation owned by a new user"""
+    user = User.objects.create_user(username="owner", email="owner@example.com")
+    return Conversation.objects.create(name="Doomed", created_by=user)
+
+
+@pytest.mark.django_db
+class TestConversationCleanup:
+    """Test Redis keys do not outlive their conversation"""
+
+    def test_delete_removes_keys(
+        self, stream_client, conversation, django_capture_on_commit_callbacks
+    ):
+        """Test deleting a conversation unlinks its keys after commit"""
+        conversation_id = str(conversation.id)
+        stream_client.add_message(conversation_id, 1, "owner", "Hello")
+        redis_client = stream_client.redis_client
+        redis_client.hset(f"reads:conv:{conversation_id}", "1", "0-1")
+        redis_client.set(f"throttle:conv:{conversation_id}", 1)
+        redis_client.hset(COLD_STREAMS_KEY, conversation_id, "{}")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            conversation.delete()
+
+        assert not redis_client.exists(
+            f"stream:conv:{conversation_id}",
+            f"reads:conv:{conversation_id}",
+            f"throttle:conv:{conversation_id}",
+        )
+        assert not redis_client.hexists(COLD_STREAMS_KEY, conversation_id)
+
+    def test_purge_orphans(self, stream_client, conversation):
+        """Test the command removes only keys of missing conversations"""
+        orphan_id = str(uuid.uuid4())
+        cold_orphan_id = uuid.uuid4()
+        stream_client.add_message(str(conversation.id), 1, "owner", "Kept")
+        stream_client.add_message(orphan_id, 1, "ghost", "Gone")
+        stream_client.add_message("not-a-uuid", 1, "other", "Not ours")
+        stream_client.redis_client.hset(COLD_STREAMS_KEY, str(cold_orphan_id), "{}")
+        ColdStreamChunk.objects.create(
+            conversation_id=cold_orphan_id,
+            index=0,
+            first_id="1-0",
+            last_id="1-0",
+            entry_count=1,
+            data=b"",
+        )
+        out = StringIO()
+
+        call_command("purge_orphaned_keys", "--batch-size", "1", stdout=out)
+
+        redis_client = stream_client.redis_client
+        assert redis_client.exists(f"stream:conv:{conversation.id}")
+        assert redis_client.exists("stream:conv:not-a-uuid")
+        assert not redis_client.exists(f"stream:conv:{orphan_id}")
+        assert not redis_client.hexists(COLD_STREAMS_KEY, str(cold_orphan_id))
+        assert not ColdStreamChunk.objects.exists()
+        assert "Removed 2 keys of 2 orphaned conversations" in out.getvalue()
+
+    def test_dry_run(self, stream_client):
+        """Test a dry run only reports orphans"""
+        orphan_id = str(uuid.uuid4())
+        stream_client.add_message(orphan_id, 1, "ghost", "Gone")
+        out = StringIO()
+
+        call_command("purge_orphaned_keys", "--dry-run", stdout=out)
+
+        assert stream_client.redis_client.exists(f"stream:conv:{orphan_id}")
+        assert orphan_id in out.getvalue()
+        assert "Found 1 orphaned conversations" in out.getvalue()
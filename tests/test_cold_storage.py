@@ -0,0 +1,104 @@
+"""
+Tests for cold storage of idle streams
+"""
+
+import time
+import uuid
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from messaging.cold_storage import ColdStreamStore
+from messaging.models import ColdStreamChunk
+from messaging.redis_stream import COLD_STREAMS_KEY
+
+DAY_MS = 86400000
+
+
+@pytest.fixture
+def store(stream_client):
+    """Fixture for ColdStreamStore"""
+    return ColdStreamStore()
+
+
+@pytest.fixture
+def idle_stream(stream_client):
+    """Conversation whose three messages were sent 30 days ago"""
+    conversation_id = str(uuid.uuid4())
+    key = f"stream:conv:{conversation_id}"
+    start_ms = int(time.time() * 1000) - 30 * DAY_MS
+    ids = [
+        stream_client.redis_client.xadd(key, {"p": f"1|1|Message {i}"}, id=f"{start_ms + i}-0")
+        for i in range(3)
+    ]
+    return conversation_id, key, ids
+
+
+@pytest.mark.django_db
+class TestColdStreamStore:
+    """Test moving idle streams out of Redis and back"""
+
+    def test_compact_and_rehydrate(self, stream_client, store, idle_stream):
+        """Test a compacted stream comes back with the same entries"""
+        conversation_id, key, ids = idle_stream
+
+        result = store.compact(key, idle_ms=7 * DAY_MS, chunk_size=2)
+
+        assert result.entries == 3
+        assert not stream_client.redis_client.exists(key)
+        assert ColdStreamChunk.objects.filter(conversation_id=conversation_id).count() == 2
+
+        assert store.ensure_hot(conversation_id) is True
+        messages = stream_client.get_messages(conversation_id)
+        assert [message["id"] for message in messages] == ids
+        assert not stream_client.redis_client.hexists(COLD_STREAMS_KEY, conversation_id)
+        assert not ColdStreamChunk.objects.filter(conversation_id=conversation_id).exists()
+
+    def test_active_stream_kept(self, stream_client, store, idle_stream):
+        """Test streams with recent messages stay in Redis"""
+        _, key, _ = idle_stream
+
+        assert store.compact(key, idle_ms=60 * DAY_MS, chunk_size=100) is None
+        assert stream_client.redis_client.exists(key)
+
+    def test_waits_for_consumer_groups(self, stream_client, store, idle_stream):
+        """Test a stream is kept until its consumer groups have caught up"""
+        _, key, ids = idle_stream
+        stream_client.redis_client.xgroup_create(key, "archiver", id=ids[0])
+
+        assert store.compact(key, idle_ms=7 * DAY_MS, chunk_size=100) is None
+
+        stream_client.redis_client.xgroup_setid(key, "archiver", id=ids[-1])
+        assert store.compact(key, idle_ms=7 * DAY_MS, chunk_size=100) is not None
+        store.ensure_hot(key.rsplit(":", 1)[-1])
+        assert stream_client.redis_client.xinfo_groups(key)[0]["last-delivered-id"] == ids[-1]
+
+    def test_messages_sent_while_cold(self, stream_client, store, idle_stream):
+        """Test rehydration keeps messages written while the stream was cold"""
+        conversation_id, key, ids = idle_stream
+        store.compact(key, idle_ms=7 * DAY_MS, chunk_size=100)
+        new_id = stream_client.add_message(conversation_id, 1, "user1", "Back again")
+
+        store.ensure_hot(conversation_id)
+
+        messages = stream_client.get_messages(conversation_id)
+        assert [message["id"] for message in messages] == ids + [new_id]
+
+    def test_preview_of_cold_stream(self, stream_client, store, idle_stream):
+        """Test inbox previews still show a cold conversation's last message"""
+        conversation_id, key, ids = idle_stream
+        store.compact(key, idle_ms=7 * DAY_MS, chunk_size=100)
+
+        preview = stream_client.get_previews([conversation_id])[conversation_id]
+
+        assert preview["message_count"] == 3
+        assert preview["last_message"]["id"] == ids[-1]
+
+    def test_command(self, stream_client, idle_stream):
+        """Test compact_cold_streams reports what it moved"""
+        out = StringIO()
+
+        call_command("compact_cold_streams", "--idle-days", "7", stdout=out)
+
+        assert "Moved 1 of 1 streams (3 entries)" in out.getvalue()
@@ -0,0 +1,532 @@
+"""
+Tests for the WebSocket consumers
+"""
+
+import asyncio
+import json
+
+import pytest
+import redis
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from accounts.username_cache import username_cache
+from conversations.membership import membership_cache
+from conversations.models import Conversation, Participant
+from messaging import consumers
+from messaging.cold_storage import cold_streams
+from messaging.fanout import StreamFanout, stream_fanout
+from messaging.read_cursors import read_cursors
+from messaging.redis_stream import async_redis_stream_client
+from messaging.routing import websocket_urlpatterns
+from messaging.shutdown import CLOSE_CODE_RESTARTING, close_all_connections, open_connections
+from messaging.throttle import async_message_throttler
+
+User = get_user_model()
+
+# Module-level async clients whose pooled connections belong to the event
+# loop of the test that opened them
+ASYNC_REDIS_CLIENTS = [
+    async_redis_stream_client.redis_client,
+    async_message_throttler.redis_client,
+    membership_cache.async_redis_client,
+    username_cache.async_redis_client,
+    read_cursors.async_redis_client,
+    cold_streams.async_redis_client,
+    stream_fanout.redis_client,
+]
+
+
+@pytest.fixture(autouse=True)
+async def redis_clients():
+    """Empty Redis, and close the shared async clients' connections after each test"""
+    client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+    client.flushdb()
+    yield
+    for async_client in ASYNC_REDIS_CLIENTS:
+        await async_client.connection_pool.disconnect()
+    client.flushdb()
+
+
+@pytest.fixture
+def user(django_user_model):
+    """A user who takes part in the conversation fixture"""
+    return django_user_model.objects.create_user(
+        email="socket@example.com",
+        username="socketuser",
+        first_name="Socket",
+        last_name="User",
+        password="SecurePass123!",
+    )
+
+
+@pytest.fixture
+def conversation(user):
+    """A conversation with the user fixture as participant"""
+    conversation = Conversation.objects.create(name="Socket Conversation", created_by=user)
+    Participant.objects.create(conversation=conversation, user=user)
+    return conversation
+
+
+class Recipient:
+    """Stands in for a consumer and records the frames it is handed"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def chat_message(self, event):
+        self.frames.append(event["text"])
+
+
+def connect(user, path: str = "/ws/conversations/") -> WebsocketCommunicator:
+    """Build a communicator for the WebSocket routes, authenticated as user"""
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+    communicator.scope["user"] = user
+    return communicator
+
+
+async def send(communicator: WebsocketCommunicator, **frame):
+    """Send a JSON frame"""
+    await communicator.send_to(text_data=json.dumps(frame))
+
+
+async def receive(communicator: WebsocketCommunicator) -> dict:
+    """Receive a JSON frame"""
+    return json.loads(await communicator.receive_from())
+
+
+@pytest.mark.django_db(transaction=True)
+class TestMultiplexChatConsumer:
+    """Test the multiplexed WebSocket endpoint"""
+
+    async def test_subscribe_and_unsubscribe(self, user, conversation):
+        """Test live messages flow only while subscribed"""
+        conversation_id = str(conversation.id)
+        communicator = connect(user)
+        connected, _ = await communicator.connect()
+        assert connected
+
+        await send(communicator, type="subscribe", conversation_id=conversation_id)
+        assert await receive(communicator) == {
+            "type": "subscribed",
+            "conversation_id": conversation_id,
+        }
+
+        await send(communicator, type="message.send", conversation_id=conversation_id, content="Hi")
+        frame = await receive(communicator)
+        assert frame["type"] == "message"
+        assert frame["message"]["content"] == "Hi"
+        assert frame["message"]["conversation_id"] == conversation_id
+
+        await send(communicator, type="unsubscribe", conversation_id=conversation_id)
+        assert (await receive(communicator))["type"] == "unsubscribed"
+
+        await send(communicator, type="message.send", conversation_id=conversation_id, content="Hi")
+        assert (await receive(communicator))["code"] == "NOT_SUBSCRIBED"
+        await communicator.disconnect()
+
+    async def test_send_before_subscribe(self, user, conversation):
+        """Test messages to conversations not subscribed to are refused"""
+        communicator = connect(user)
+        await communicator.connect()
+
+        await send(
+            communicator, type="message.send", conversation_id=str(conversation.id), content="Hi"
+        )
+
+        assert (await receive(communicator))["code"] == "NOT_SUBSCRIBED"
+        await communicator.disconnect()
+
+    async def test_non_participant_forbidden(self, user, django_user_model):
+        """Test subscribing to someone else's conversation is refused"""
+        other = await django_user_model.objects.acreate(
+            email="other@example.com", username="other", first_name="O", last_name="U"
+        )
+        conversation = await Conversation.objects.acreate(name="Private", created_by=other)
+        await Participant.objects.acreate(conversation=conversation, user=other)
+        communicator = connect(user)
+        await communicator.connect()
+
+        await send(communicator, type="subscribe", conversation_id=str(conversation.id))
+
+        assert (await receive(communicator))["code"] == "FORBIDDEN"
+        await communicator.disconnect()
+
+    async def test_subscription_limit(self, user, conversation, settings):
+        """Test MAX_SUBSCRIPTIONS caps the conversations of one connection"""
+        settings.CHAT_WEBSOCKET = {**settings.CHAT_WEBSOCKET, "MAX_SUBSCRIPTIONS": 1}
+        second = await Conversation.objects.acreate(name="Second", created_by=user)
+        await Participant.objects.acreate(conversation=second, user=user)
+        communicator = connect(user)
+        await communicator.connect()
+        await send(communicator, type="subscribe", conversation_id=str(conversation.id))
+        assert (await receive(communicator))["type"] == "subscribed"
+
+        await send(communicator, type="subscribe", conversation_id=str(second.id))
+
+        assert (await receive(communicator))["code"] == "TOO_MANY_SUBSCRIPTIONS"
+        await communicator.disconnect()
+
+    async def test_non_object_frame(self, user):
+        """Test JSON that is not an object is reported as invalid"""
+        communicator = connect(user)
+        await communicator.connect()
+
+        await communicator.send_to(text_data="[1, 2]")
+
+        assert (await receive(communicator))["code"] == "INVALID_JSON"
+        await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestMessageFrames:
+    """Test how live message frames reach clients"""
+
+    async def test_frame_encoded_once(self, user, conversation, monkeypatch):
+        """Test one encoded frame is forwarded verbatim to every recipient"""
+        encoded = []
+        encode = consumers.encode_message_frame
+
+        def encode_message_frame(message):
+            encoded.append(message["id"])
+            return encode(message)
+
+        monkeypatch.setattr(consumers, "encode_message_frame", encode_message_frame)
+        path = f"/ws/conversations/{conversation.id}/"
+        sender, recipient = connect(user, path), connect(user, path)
+        await sender.connect()
+        await recipient.connect()
+
+        await send(sender, type="message.send", content="Hello")
+
+        sent, received = await sender.receive_from(), await recipient.receive_from()
+        assert sent == received
+        assert json.loads(received)["message"]["content"] == "Hello"
+        assert len(encoded) == 1
+        await sender.disconnect()
+        await recipient.disconnect()
+
+    async def test_text_forwarded_verbatim(self, user, conversation):
+        """Test the sender's encoding is passed through untouched"""
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/")
+        await communicator.connect()
+        text = '{"type": "message", "message": {"id": "5-0", "content": "As sent"}}'
+
+        await get_channel_layer().group_send(
+            consumers.get_group_name(str(conversation.id)),
+            {
+                "type": "chat_message",
+                "id": "5-0",
+                "conversation_id": str(conversation.id),
+                "text": text,
+            },
+        )
+
+        assert await communicator.receive_from() == text
+        await communicator.disconnect()
+
+    async def test_legacy_message_event(self, user, conversation):
+        """Test events from older workers carrying a message dict are encoded here"""
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/")
+        await communicator.connect()
+        message = {
+            "id": "5-0",
+            "user_id": user.id,
+            "username": user.username,
+            "content": "From an older worker",
+            "conversation_id": str(conversation.id),
+        }
+
+        await get_channel_layer().group_send(
+            consumers.get_group_name(str(conversation.id)),
+            {"type": "chat_message", "message": message},
+        )
+
+        assert await receive(communicator) == {"type": "message", "message": message}
+        await communicator.disconnect()
+
+    async def test_stream_fanout_frame_matches(self, user, conversation):
+        """Test stream fan-out sends the same frame as the channel layer"""
+        conversation_id = str(conversation.id)
+        communicator = connect(user, f"/ws/conversations/{conversation_id}/")
+        await communicator.connect()
+        await send(communicator, type="message.send", content="Same either way")
+        channel_layer_frame = await communicator.receive_from()
+        await communicator.disconnect()
+
+        fanout, recipient = StreamFanout(), Recipient()
+        fanout.subscribers[conversation_id] = {recipient}
+        entries = await async_redis_stream_client.redis_client.xrange(
+            f"stream:conv:{conversation_id}"
+        )
+        await fanout.dispatch(conversation_id, entries)
+
+        assert recipient.frames == [channel_layer_frame]
+
+    async def test_replay_matches_live_frames(self, user, conversation):
+        """Test replayed messages are sent in the same frames as live ones"""
+        path = f"/ws/conversations/{conversation.id}/"
+        communicator = connect(user, path)
+        await communicator.connect()
+        live = []
+        for content in ("one", "two"):
+            await send(communicator, type="message.send", content=content)
+            live.append(await communicator.receive_from())
+        await communicator.disconnect()
+
+        first_id = json.loads(live[0])["message"]["id"]
+        communicator = connect(user, f"{path}?last_id={first_id}")
+        await communicator.connect()
+
+        assert await communicator.receive_from() == live[1]
+        await send(communicator, type="resume", last_id=first_id)
+        assert await communicator.receive_from() == live[1]
+        await communicator.disconnect()
+
+    async def test_stream_fanout_during_replay(self, user, conversation, settings, monkeypatch):
+        """Test a message written between joining and replaying is sent once"""
+        settings.CHAT_WEBSOCKET = {**settings.CHAT_WEBSOCKET, "FANOUT": "stream"}
+        monkeypatch.setattr(stream_fanout, "block_ms", 100)
+        conversation_id = str(conversation.id)
+        first_id = await async_redis_stream_client.add_message(
+            conversation_id, user.id, user.username, "one"
+        )
+        get_messages_since = async_redis_stream_client.get_messages_since
+
+        async def written_before_read(*args, **kwargs):
+            await async_redis_stream_client.add_message(
+                conversation_id, user.id, user.username, "two"
+            )
+            # Let the fan-out hand the message over before the replay reads it
+            await asyncio.sleep(0.3)
+            return await get_messages_since(*args, **kwargs)
+
+        monkeypatch.setattr(async_redis_stream_client, "get_messages_since", written_before_read)
+        communicator = connect(user, f"/ws/conversations/{conversation_id}/?last_id={first_id}")
+        await communicator.connect()
+
+        frames = [await receive(communicator)]
+        while not await communicator.receive_nothing(timeout=0.3):
+            frames.append(await receive(communicator))
+        assert [frame["message"]["content"] for frame in frames] == ["two"]
+        await send(communicator, type="message.send", content="three")
+        assert (await receive(communicator))["message"]["content"] == "three"
+        await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCoalescing:
+    """Test batching of live messages for clients that opt in"""
+
+    async def test_batch_keeps_order(self, user, conversation, settings):
+        """Test messages within the delay arrive as one batch, in order"""
+        settings.CHAT_WEBSOCKET = {**settings.CHAT_WEBSOCKET, "COALESCE_MS": 50}
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/?coalesce=1")
+        await communicator.connect()
+
+        for content in ("one", "two", "three"):
+            await send(communicator, type="message.send", content=content)
+
+        frame = await receive(communicator)
+        assert frame["type"] == "messages"
+        assert [message["content"] for message in frame["messages"]] == ["one", "two", "three"]
+        await communicator.disconnect()
+
+    async def test_full_batch_flushed_early(self, user, conversation, settings):
+        """Test a batch is sent as soon as it reaches COALESCE_MAX_BATCH"""
+        settings.CHAT_WEBSOCKET = {
+            **settings.CHAT_WEBSOCKET,
+            "COALESCE_MS": 10000,
+            "COALESCE_MAX_BATCH": 2,
+        }
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/?coalesce=1")
+        await communicator.connect()
+
+        for content in ("one", "two"):
+            await send(communicator, type="message.send", content=content)
+
+        frame = await receive(communicator)
+        assert [message["content"] for message in frame["messages"]] == ["one", "two"]
+        await communicator.disconnect()
+
+    async def test_single_message_frame(self, user, conversation, settings):
+        """Test a lone buffered message is sent as a plain message frame"""
+        settings.CHAT_WEBSOCKET = {**settings.CHAT_WEBSOCKET, "COALESCE_MS": 10}
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/?coalesce=1")
+        await communicator.connect()
+
+        await send(communicator, type="message.send", content="alone")
+
+        frame = await receive(communicator)
+        assert frame["type"] == "message"
+        assert frame["message"]["content"] == "alone"
+        await communicator.disconnect()
+
+    async def test_not_coalesced_without_opt_in(self, user, conversation, settings):
+        """Test clients that did not ask for batches get one frame per message"""
+        settings.CHAT_WEBSOCKET = {**settings.CHAT_WEBSOCKET, "COALESCE_MS": 50}
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/")
+        await communicator.connect()
+
+        for content in ("one", "two"):
+            await send(communicator, type="message.send", content=content)
+
+        assert [(await receive(communicator))["type"] for _ in range(2)] == ["message"] * 2
+        await communicator.disconnect()
+
+
+def message_event(conversation_id: str, sequence: int) -> dict:
+    """A channel layer event for a live message"""
+    message = {
+        "id": f"{sequence}-0",
+        "user_id": 1,
+        "username": "sender",
+        "content": f"Message {sequence}",
+    }
+    return {
+        "type": "chat_message",
+        "id": message["id"],
+        "conversation_id": conversation_id,
+        "text": consumers.encode_message_frame(consumers.build_message(message, conversation_id)),
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSlowClients:
+    """Test the slow client policies against clients that stop reading"""
+
+    @pytest.fixture(autouse=True)
+    def small_window(self, settings):
+        """Send window and queue of two frames, without timed heartbeats"""
+        settings.CHAT_WEBSOCKET = {
+            **settings.CHAT_WEBSOCKET,
+            "SEND_WINDOW": 2,
+            "SEND_QUEUE_SIZE": 2,
+            "HEARTBEAT_SECONDS": 0,
+        }
+
+    async def publish(self, conversation_id: str, count: int):
+        """Publish live messages 1 to count to the conversation"""
+        channel_layer = get_channel_layer()
+        for sequence in range(1, count + 1):
+            await channel_layer.group_send(
+                consumers.get_group_name(conversation_id), message_event(conversation_id, sequence)
+            )
+
+    async def test_close_policy(self, user, conversation, settings):
+        """Test a client that never acknowledges is disconnected with code 4008"""
+        settings.CHAT_WEBSOCKET = {**settings.CHAT_WEBSOCKET, "SLOW_CLIENT_POLICY": "close"}
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/")
+        await communicator.connect()
+
+        await self.publish(str(conversation.id), 6)
+
+        frames = []
+        while (output := await communicator.receive_output())["type"] != "websocket.close":
+            frames.append(json.loads(output["text"]))
+        assert output["code"] == 4008
+        assert [frame["message"]["id"] for frame in frames if frame["type"] == "message"] == [
+            "1-0",
+            "2-0",
+        ]
+        await communicator.disconnect()
+
+    async def test_drop_oldest_policy(self, user, conversation):
+        """Test messages held back from a client that stopped reading turn into a resync"""
+        conversation_id = str(conversation.id)
+        communicator = connect(user, f"/ws/conversations/{conversation_id}/")
+        await communicator.connect()
+
+        await self.publish(conversation_id, 6)
+        await asyncio.sleep(0.1)
+        # Catch up, answering every ping
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.2):
+            frame = await receive(communicator)
+            if frame["type"] == "ping":
+                await send(communicator, type="pong")
+            else:
+                frames.append(frame)
+
+        assert [frame.get("message", {}).get("id") for frame in frames] == [
+            "1-0",
+            "2-0",
+            None,
+            "6-0",
+        ]
+        assert frames[2] == {"type": "resync", "conversation_id": conversation_id, "last_id": "2-0"}
+        await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestHeartbeats:
+    """Test pinging clients and reaping idle connections"""
+
+    @pytest.fixture(autouse=True)
+    def short_heartbeat(self, settings):
+        """Ping every 50ms and reap after 200ms of silence"""
+        settings.CHAT_WEBSOCKET = {
+            **settings.CHAT_WEBSOCKET,
+            "HEARTBEAT_SECONDS": 0.05,
+            "IDLE_TIMEOUT_SECONDS": 0.2,
+        }
+
+    async def test_silent_client_reaped(self, user, conversation):
+        """Test a client that never answers is closed with code 4408"""
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/")
+        await communicator.connect()
+
+        frames = []
+        while (output := await communicator.receive_output())["type"] != "websocket.close":
+            frames.append(json.loads(output["text"]))
+
+        assert output["code"] == 4408
+        assert frames and all(frame == {"type": "ping"} for frame in frames)
+        await communicator.disconnect()
+
+    async def test_answering_client_kept(self, user, conversation):
+        """Test a client that answers every ping stays connected"""
+        communicator = connect(user, f"/ws/conversations/{conversation.id}/")
+        await communicator.connect()
+
+        for _ in range(10):
+            assert await receive(communicator) == {"type": "ping"}
+            await send(communicator, type="pong")
+
+        await send(communicator, type="message.send", content="Still here")
+        frame = await receive(communicator)
+        while frame["type"] == "ping":
+            frame = await receive(communicator)
+        assert frame["message"]["content"] == "Still here"
+        await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestShutdown:
+    """Test closing open connections when the worker shuts down"""
+
+    async def test_close_with_retry_after(self, user, conversation, settings):
+        """Test every socket gets close code 4503 with a JSON retry_after reason"""
+        settings.CHAT_WEBSOCKET = {
+            **settings.CHAT_WEBSOCKET,
+            "SHUTDOWN_RECONNECT_SPREAD_SECONDS": 5,
+        }
+        single = connect(user, f"/ws/conversations/{conversation.id}/")
+        multiplexed = connect(user)
+        await single.connect()
+        await multiplexed.connect()
+        await send(multiplexed, type="subscribe", conversation_id=str(conversation.id))
+        assert (await receive(multiplexed))["type"] == "subscribed"
+
+        await close_all_connections()
+
+        for communicator in (single, multiplexed):
+            output = await communicator.receive_output()
+            assert output["type"] == "websocket.close"
+            assert output["code"] == CLOSE_CODE_RESTARTING
+            assert 0 <= json.loads(output["reason"])["retry_after"] <= 5
+            await communicator.disconnect()
+        assert not open_connections
@@ -7,6 +7,7 @@ from django.contrib.auth import get_user_model
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from conversations.membership import membership_cache
 from conversations.models import Conversation, Participant
 
 User = get_user_model()
@@ -105,3 +106,59 @@ class TestConversations:
         response = self.client.get(f"/api/v1/conversations/{conversation.id}/")
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestMembershipCache:
+    """Test cached membership checks"""
+
+    def setup_method(self):
+        self.user = User.objects.create_user(
+            email="member@example.com",
+            username="member",
+            first_name="Member",
+            last_name="User",
+            password="SecurePass123!",
+        )
+        self.conversation = Conversation.objects.create(
+            name="Cached Conversation",
+            created_by=self.user,
+        )
+
+    def test_participant_added_and_removed(self):
+        """Test that participant changes invalidate cached membership"""
+        assert membership_cache.is_participant(self.conversation.id, self.user.id) is False
+
+        participant = Participant.objects.create(
+            conversation=self.conversation,
+            user=self.user,
+            role=Participant.Role.ADMIN,
+        )
+        assert membership_cache.get_role(self.conversation.id, self.user.id) == "admin"
+
+        participant.delete()
+        assert membership_cache.is_participant(self.conversation.id, self.user.id) is False
+
+    def test_removal_during_load_not_cached(self, monkeypatch):
+        """Test that members loaded before a removal are not written back to the cache"""
+        participant = Participant.objects.create(conversation=self.conversation, user=self.user)
+        load_members = membership_cache._load_members
+
+        def load_then_remove(conversation_id):
+            members = load_members(conversation_id)
+            participant.delete()
+            return members
+
+        monkeypatch.setattr(membership_cache, "_load_members", load_then_remove)
+        assert membership_cache.get_role(self.conversation.id, self.user.id) == "member"
+        monkeypatch.setattr(membership_cache, "_load_members", load_members)
+
+        assert membership_cache.is_participant(self.conversation.id, self.user.id) is False
+
+    def test_cached_lookup_skips_database(self, django_assert_num_queries):
+        """Test that repeated checks are served from the cache"""
+        Participant.objects.create(conversation=self.conversation, user=self.user)
+        membership_cache.is_participant(self.conversation.id, self.user.id)
+
+        with django_assert_num_queries(0):
+            assert membership_cache.is_participant(self.conversation.id, self.user.id) is True
@@ -0,0 +1,98 @@
+"""
+Tests for stream-native fan-out
+"""
+
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from messaging.fanout import StreamFanout
+from messaging.redis_stream import AsyncRedisStreamClient
+
+
+class RecordingConsumer:
+    """Stands in for a consumer and records the frames it is handed"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def chat_message(self, event):
+        self.frames.append(json.loads(event["text"]))
+
+
+@pytest.fixture
+async def stream_client():
+    """Fixture for AsyncRedisStreamClient"""
+    client = AsyncRedisStreamClient()
+    await client.redis_client.flushdb()
+    yield client
+    await client.redis_client.flushdb()
+    await client.redis_client.aclose()
+
+
+@pytest.fixture
+async def fanout():
+    """StreamFanout with short blocking reads"""
+    fanout = StreamFanout(block_ms=100)
+    yield fanout
+    fanout.subscribers.clear()
+    if fanout.task is not None:
+        await fanout.wake()
+        await fanout.task
+
+
+async def wait_for(condition, timeout=2):
+    """Poll until condition() is true"""
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+class TestStreamFanout:
+    """Test delivering stream entries to local consumers"""
+
+    async def test_delivers_new_messages(self, stream_client, fanout):
+        """Test subscribers get messages added after they subscribed, once each"""
+        conversation_id = str(uuid.uuid4())
+        await stream_client.add_message(conversation_id, 1, "user1", "Before")
+        first, second = RecordingConsumer(), RecordingConsumer()
+
+        await fanout.subscribe(conversation_id, first)
+        await fanout.subscribe(conversation_id, second)
+        message_id = await stream_client.add_message(conversation_id, 1, "user1", "Hello")
+
+        await wait_for(lambda: first.frames and second.frames)
+        assert first.frames == second.frames
+        assert [frame["message"]["id"] for frame in first.frames] == [message_id]
+        assert first.frames[0]["message"]["username"] == "user1"
+        assert first.frames[0]["message"]["conversation_id"] == conversation_id
+
+    async def test_new_conversation_wakes_reader(self, stream_client, fanout):
+        """Test a conversation subscribed while a read is blocked is picked up"""
+        busy, quiet = str(uuid.uuid4()), str(uuid.uuid4())
+        fanout.block_ms = 10000
+        await fanout.subscribe(busy, RecordingConsumer())
+        await asyncio.sleep(0.05)
+        consumer = RecordingConsumer()
+
+        await fanout.subscribe(quiet, consumer)
+        await stream_client.add_message(quiet, 2, "user2", "Hi")
+
+        await wait_for(lambda: consumer.frames, timeout=1)
+
+    async def test_unsubscribe(self, stream_client, fanout):
+        """Test unsubscribed consumers stop receiving messages"""
+        conversation_id = str(uuid.uuid4())
+        kept, removed = RecordingConsumer(), RecordingConsumer()
+        await fanout.subscribe(conversation_id, kept)
+        await fanout.subscribe(conversation_id, removed)
+
+        fanout.unsubscribe(conversation_id, removed)
+        await stream_client.add_message(conversation_id, 1, "user1", "Hello")
+
+        await wait_for(lambda: kept.frames)
+        assert removed.frames == []
@@ -0,0 +1,81 @@
+"""
+Tests for Redis memory accounting
+"""
+
+import time
+import uuid
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from messaging.memory import memory_report
+
+User = get_user_model()
+
+
+@pytest.fixture
+def streams(stream_client):
+    """A busy conversation, a slow old one and some throttle keys"""
+    busy, slow = str(uuid.uuid4()), str(uuid.uuid4())
+    # Spans several stream nodes, so it is clearly the larger stream even
+    # where Redis preallocates small streams to the same size
+    for i in range(250):
+        stream_client.add_message(busy, 1, "user1", f"Message {i} " * 10)
+    old_ms = int(time.time() * 1000) - 10 * 86400000
+    for i in range(5):
+        stream_client.redis_client.xadd(
+            f"stream:conv:{slow}", {"p": "1|1|Hi"}, id=f"{old_ms + i}-0"
+        )
+    stream_client.redis_client.set("throttle:user:1", 1)
+    stream_client.redis_client.set(f"throttle:conv:{busy}:bucket", 1)
+    stream_client.redis_client.set(f"throttle:1:{busy}", 1)
+    return busy, slow
+
+
+class TestMemoryReport:
+    """Test sampling stream memory"""
+
+    def test_top_conversations(self, streams):
+        """Test conversations are ranked by bytes, entries and growth"""
+        busy, slow = streams
+
+        report = memory_report(top=1, batch_size=1)
+
+        assert report["streams"] == 2
+        assert report["entries"] == 255
+        assert [usage["conversation_id"] for usage in report["top"]["bytes"]] == [busy]
+        assert report["top"]["entries"][0]["entries"] == 250
+        assert report["top"]["entries_per_day"][0]["conversation_id"] == busy
+        assert report["throttle_keys"] == {"user": 1, "conversation": 1, "user_conversation": 1}
+
+    def test_command(self, streams):
+        """Test redis_memory_report prints the top conversations"""
+        busy, _ = streams
+        out = StringIO()
+
+        call_command("redis_memory_report", "--top", "1", stdout=out)
+
+        assert "2 streams, 255 entries" in out.getvalue()
+        assert busy in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestRedisMemoryView:
+    """Test the admin-only memory endpoint"""
+
+    def test_requires_staff(self, streams):
+        """Test regular users are refused and staff get the report"""
+        client = APIClient()
+        user = User.objects.create_user(username="user", email="user@example.com")
+        client.force_authenticate(user)
+        assert client.get("/api/v1/admin/redis-memory").status_code == 403
+
+        user.is_staff = True
+        user.save()
+        response = client.get("/api/v1/admin/redis-memory?top=1")
+
+        assert response.status_code == 200
+        assert response.json()["streams"] == 2
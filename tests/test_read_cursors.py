@@ -0,0 +1,70 @@
+"""
+Tests for read cursors and unread counts
+"""
+
+import pytest
+
+from messaging.read_cursors import ReadCursorStore
+
+
+@pytest.fixture
+def store(stream_client):
+    """Fixture for ReadCursorStore with a small cap"""
+    return ReadCursorStore(max_unread=3)
+
+
+def add_messages(stream_client, conversation_id, count):
+    """Add `count` messages to a conversation and return their IDs"""
+    return [
+        stream_client.add_message(conversation_id, 1, "user1", f"Message {i}") for i in range(count)
+    ]
+
+
+class TestReadCursors:
+    """Test read cursor storage and unread counting"""
+
+    def test_unread_counts_without_cursor(self, stream_client, store):
+        """Test a conversation never read counts every message, up to the cap"""
+        add_messages(stream_client, "conv-a", 2)
+        add_messages(stream_client, "conv-b", 5)
+
+        counts = store.get_unread_counts(2, ["conv-a", "conv-b", "conv-empty"])
+
+        assert counts == {"conv-a": 2, "conv-b": 3, "conv-empty": 0}
+
+    def test_mark_read(self, stream_client, store):
+        """Test unread counts start after the cursor"""
+        ids = add_messages(stream_client, "conv-a", 3)
+
+        assert store.mark_read(2, {"conv-a": ids[0]}) is True
+
+        assert store.get_unread_counts(2, ["conv-a"]) == {"conv-a": 2}
+        assert store.get_unread_counts(3, ["conv-a"]) == {"conv-a": 3}
+
+    def test_cursor_never_moves_back(self, stream_client, store):
+        """Test an older read receipt does not rewind the cursor"""
+        ids = add_messages(stream_client, "conv-a", 3)
+
+        store.mark_read(2, {"conv-a": ids[2]})
+        store.mark_read(2, {"conv-a": ids[0]})
+
+        assert store.get_unread_counts(2, ["conv-a"]) == {"conv-a": 0}
+
+    def test_cursor_capped_at_newest_message(self, stream_client, store):
+        """Test a cursor past the stream end cannot hide later messages"""
+        add_messages(stream_client, "conv-a", 1)
+
+        store.mark_read(2, {"conv-a": "99999999999999-0"})
+        add_messages(stream_client, "conv-a", 1)
+
+        assert store.get_unread_counts(2, ["conv-a"]) == {"conv-a": 1}
+
+    @pytest.mark.asyncio
+    async def test_amark_read(self, stream_client, store):
+        """Test storing cursors for several conversations from async code"""
+        ids_a = add_messages(stream_client, "conv-a", 2)
+        ids_b = add_messages(stream_client, "conv-b", 2)
+
+        assert await store.amark_read(2, {"conv-a": ids_a[1], "conv-b": ids_b[0]}) is True
+
+        assert store.get_unread_counts(2, ["conv-a", "conv-b"]) == {"conv-a": 0, "conv-b": 1}
@@ -2,9 +2,18 @@
 Tests for Redis Streams messaging
 """
 
+from datetime import datetime, timezone
+from io import StringIO
+
 import pytest
+from django.core.management import call_command
 
-from messaging.redis_stream import RedisStreamClient
+from messaging.redis_stream import (
+    AsyncRedisStreamClient,
+    RedisStreamClient,
+    stream_id_to_timestamp,
+    timestamp_to_stream_id,
+)
 
 
 @pytest.fixture
@@ -66,3 +75,220 @@ class TestRedisStream:
     def test_ping_redis(self, redis_client):
         """Test Redis connectivity"""
         assert redis_client.ping_redis() is True
+
+    def test_get_previews(self, redis_client):
+        """Test last message and length for several conversations at once"""
+        redis_client.add_message("conv-a", 1, "user1", "First")
+        redis_client.add_message("conv-a", 1, "user1", "Second")
+
+        previews = redis_client.get_previews(["conv-a", "conv-empty"])
+
+        assert previews["conv-a"]["message_count"] == 2
+        assert previews["conv-a"]["last_message"]["content"] == "Second"
+        assert previews["conv-empty"] == {"last_message": None, "message_count": 0}
+
+    def test_get_message_page_before(self, redis_client, test_conversation_id):
+        """Test paging backward through history with a before cursor"""
+        ids = [
+            redis_client.add_message(test_conversation_id, 1, "user1", f"Message {i}")
+            for i in range(5)
+        ]
+
+        latest, has_more = redis_client.get_message_page(test_conversation_id, limit=2)
+        assert [m["id"] for m in latest] == ids[3:]
+        assert has_more is True
+
+        older, has_more = redis_client.get_message_page(
+            test_conversation_id, before=latest[0]["id"], limit=2
+        )
+        assert [m["id"] for m in older] == ids[1:3]
+        assert has_more is True
+
+        oldest, has_more = redis_client.get_message_page(
+            test_conversation_id, before=older[0]["id"], limit=2
+        )
+        assert [m["id"] for m in oldest] == ids[:1]
+        assert has_more is False
+
+    def test_get_message_page_from(self, redis_client, test_conversation_id):
+        """Test paging forward reports whether newer messages remain"""
+        ids = [
+            redis_client.add_message(test_conversation_id, 1, "user1", f"Message {i}")
+            for i in range(3)
+        ]
+
+        page, has_more = redis_client.get_message_page(
+            test_conversation_id, from_id=ids[0], limit=1
+        )
+        assert [m["id"] for m in page] == ids[1:2]
+        assert has_more is True
+
+        page, has_more = redis_client.get_message_page(
+            test_conversation_id, from_id=ids[1], limit=1
+        )
+        assert [m["id"] for m in page] == ids[2:]
+        assert has_more is False
+
+    def test_get_messages_since(self, redis_client, test_conversation_id):
+        """Test replaying the messages after a known ID"""
+        first_id = redis_client.add_message(test_conversation_id, 1, "user1", "Seen")
+        redis_client.add_message(test_conversation_id, 2, "user2", "Missed 1")
+        redis_client.add_message(test_conversation_id, 2, "user2", "Missed 2")
+
+        messages = redis_client.get_messages_since(test_conversation_id, first_id)
+
+        assert [msg["content"] for msg in messages] == ["Missed 1", "Missed 2"]
+
+    def test_get_messages_since_gap_too_large(self, redis_client, test_conversation_id):
+        """Test that a gap over the limit asks for a refetch"""
+        first_id = redis_client.add_message(test_conversation_id, 1, "user1", "Seen")
+        for i in range(3):
+            redis_client.add_message(test_conversation_id, 2, "user2", f"Missed {i}")
+
+        assert redis_client.get_messages_since(test_conversation_id, first_id, limit=2) is None
+
+
+class TestTimeSeek:
+    """Test loading history around a point in time"""
+
+    @pytest.fixture
+    def timed_stream(self, redis_client, test_conversation_id):
+        """Stream with one message per second, from 1000s to 1009s after the epoch"""
+        stream_key = redis_client._get_stream_key(test_conversation_id)
+        for second in range(1000, 1010):
+            redis_client.redis_client.xadd(
+                stream_key,
+                {"user_id": "1", "username": "user1", "content": f"at {second}"},
+                id=f"{second * 1000}-0",
+            )
+        return test_conversation_id
+
+    def test_timestamp_to_stream_id(self):
+        """Test naive datetimes are read as UTC"""
+        assert timestamp_to_stream_id(datetime(1970, 1, 1, 0, 16, 40)) == "1000000"
+        aware = datetime(1970, 1, 1, 0, 16, 40, tzinfo=timezone.utc)
+        assert timestamp_to_stream_id(aware) == "1000000"
+
+    def test_get_messages_around(self, redis_client, timed_stream):
+        """Test a window of messages on each side of a time"""
+        messages, has_more_before, has_more_after = redis_client.get_messages_around(
+            timed_stream, around="1005000", limit=2
+        )
+
+        assert [m["content"] for m in messages] == ["at 1003", "at 1004", "at 1005", "at 1006"]
+        assert has_more_before is True
+        assert has_more_after is True
+
+    def test_get_messages_between(self, redis_client, timed_stream):
+        """Test since pages forward and until alone pages backward"""
+        messages, has_more = redis_client.get_messages_between(
+            timed_stream, since="1002000", until="1004000", limit=5
+        )
+        assert [m["content"] for m in messages] == ["at 1002", "at 1003", "at 1004"]
+        assert has_more is False
+
+        messages, has_more = redis_client.get_messages_between(
+            timed_stream, until="1004000", limit=2
+        )
+        assert [m["content"] for m in messages] == ["at 1003", "at 1004"]
+        assert has_more is True
+
+
+class TestStreamEncoding:
+    """Test compact and legacy stream entries"""
+
+    def test_compact_entry(self, redis_client, test_conversation_id):
+        """Test that new entries are packed and decoded transparently"""
+        message_id = redis_client.add_message(test_conversation_id, 1, "user1", "a|b")
+
+        raw = redis_client.redis_client.xrange(f"stream:conv:{test_conversation_id}")
+        message = redis_client.get_messages(test_conversation_id)[0]
+
+        assert raw[0][1] == {"p": "1|1|a|b"}
+        assert message["username"] == "user1"
+        assert message["content"] == "a|b"
+        assert message["timestamp"] == stream_id_to_timestamp(message_id)
+
+    def test_legacy_entries_migrated(self, redis_client, test_conversation_id):
+        """Test that legacy entries decode and are rewritten by compact_streams"""
+        stream_key = f"stream:conv:{test_conversation_id}"
+        legacy_id = redis_client.redis_client.xadd(
+            stream_key,
+            {
+                "user_id": "42",
+                "username": "legacy",
+                "content": "Old message",
+                "timestamp": "2024-01-01T00:00:00",
+            },
+        )
+        redis_client.add_message(test_conversation_id, 1, "user1", "New message")
+
+        call_command("compact_streams", stdout=StringIO())
+
+        raw = redis_client.redis_client.xrange(stream_key)
+        messages = redis_client.get_messages(test_conversation_id)
+        assert raw[0] == (legacy_id, {"p": "1|42|Old message"})
+        assert [msg["username"] for msg in messages] == ["legacy", "user1"]
+
+    def test_compaction_keeps_consumer_groups(self, redis_client, test_conversation_id):
+        """Test that compact_streams restores consumer groups and pending entries"""
+        stream_key = f"stream:conv:{test_conversation_id}"
+        legacy_id = redis_client.redis_client.xadd(
+            stream_key, {"user_id": "42", "username": "legacy", "content": "Old message"}
+        )
+        redis_client.redis_client.xgroup_create(stream_key, "archiver", id="0")
+        # Delivered but not acknowledged
+        redis_client.redis_client.xreadgroup("archiver", "test", {stream_key: ">"})
+
+        call_command("compact_streams", stdout=StringIO())
+
+        response = redis_client.redis_client.xreadgroup("archiver", "test", {stream_key: ">"})
+        assert [entry_id for entry_id, _ in response[0][1]] == [legacy_id]
+
+    def test_compaction_skips_helper_keys(self, redis_client, test_conversation_id):
+        """Test that compact_streams leaves other keys under the stream prefix alone"""
+        stream_key = f"stream:conv:{test_conversation_id}"
+        legacy = {"user_id": "42", "username": "legacy", "content": "Old message"}
+        redis_client.redis_client.xadd(f"{stream_key}:compacting", legacy)
+        redis_client.redis_client.set(f"{stream_key}:meta", "not a stream")
+
+        call_command("compact_streams", stdout=StringIO())
+
+        assert redis_client.redis_client.xrange(f"{stream_key}:compacting")[0][1] == legacy
+        assert redis_client.redis_client.get(f"{stream_key}:meta") == "not a stream"
+
+
+@pytest.fixture
+async def async_redis_client():
+    """Fixture for AsyncRedisStreamClient"""
+    client = AsyncRedisStreamClient()
+    await client.redis_client.flushdb()
+    yield client
+    await client.redis_client.flushdb()
+    await client.redis_client.aclose()
+
+
+class TestAsyncRedisStream:
+    """Test asyncio Redis Stream operations"""
+
+    async def test_add_and_get_messages(self, async_redis_client, test_conversation_id):
+        """Test adding and retrieving messages without the sync client"""
+        message_id = await async_redis_client.add_message(
+            conversation_id=test_conversation_id,
+            user_id=1,
+            username="user1",
+            content="Async message",
+        )
+
+        messages = await async_redis_client.get_messages(
+            conversation_id=test_conversation_id,
+            limit=10,
+        )
+
+        assert messages[-1]["id"] == message_id
+        assert messages[-1]["content"] == "Async message"
+        assert messages[-1]["user_id"] == 1
+
+    async def test_ping_redis(self, async_redis_client):
+        """Test Redis connectivity"""
+        assert await async_redis_client.ping_redis() is True
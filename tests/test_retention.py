@@ -0,0 +1,125 @@
+"""
+Tests for stream retention
+"""
+
+import time
+import uuid
+from io import StringIO
+
+import pytest
+import redis
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from conversations.models import Conversation
+from messaging.retention import RetentionPolicy, StreamTrimmer
+
+User = get_user_model()
+
+
+def fill_stream(stream_client, conversation_id, ages_days):
+    """Add one message per age, oldest first, with IDs at those ages"""
+    key = f"stream:conv:{conversation_id}"
+    now_ms = int(time.time() * 1000)
+    for age in ages_days:
+        stream_client.redis_client.xadd(
+            key,
+            {"p": "1|1|Message"},
+            id=f"{now_ms - int(age * 86400000)}-0",
+        )
+    return key
+
+
+@pytest.mark.django_db
+class TestStreamTrimmer:
+    """Test trimming streams to their retention policy"""
+
+    def test_max_length(self, stream_client):
+        """Test streams are trimmed to their newest entries"""
+        key = fill_stream(stream_client, uuid.uuid4(), [5, 4, 3, 2, 1])
+
+        results = StreamTrimmer(RetentionPolicy(0, 2)).trim([key])
+
+        assert results[0].trimmed == 3
+        assert stream_client.redis_client.xlen(key) == 2
+
+    def test_max_length_far_exceeded(self, stream_client, monkeypatch):
+        """Test the cutoff is found without reading the whole excess"""
+        key = fill_stream(stream_client, uuid.uuid4(), [n / 1000 for n in range(1000, 0, -1)])
+        newest = [entry_id for entry_id, _ in stream_client.redis_client.xrevrange(key, count=3)]
+        monkeypatch.setattr(
+            "redis.client.Pipeline.xrange",
+            lambda *args, **kwargs: pytest.fail("read the excess"),
+        )
+
+        results = StreamTrimmer(RetentionPolicy(0, 3)).trim([key])
+
+        assert results[0].trimmed == 997
+        assert [entry_id for entry_id, _ in stream_client.redis_client.xrange(key)] == newest[::-1]
+
+    def test_max_length_slightly_exceeded(self, stream_client, monkeypatch):
+        """Test a small excess is found by reading only the excess"""
+        key = fill_stream(stream_client, uuid.uuid4(), [n / 1000 for n in range(510, 0, -1)])
+        newest = [entry_id for entry_id, _ in stream_client.redis_client.xrevrange(key, count=500)]
+        counts = []
+        xrange = redis.client.Pipeline.xrange
+
+        def counting_xrange(pipe, *args, count=None, **kwargs):
+            counts.append(count)
+            return xrange(pipe, *args, count=count, **kwargs)
+
+        monkeypatch.setattr("redis.client.Pipeline.xrange", counting_xrange)
+        monkeypatch.setattr(
+            "redis.client.Pipeline.xrevrange",
+            lambda *args, **kwargs: pytest.fail("read the entries to keep"),
+        )
+
+        results = StreamTrimmer(RetentionPolicy(0, 500)).trim([key])
+
+        assert counts == [10]
+        assert results[0].trimmed == 10
+        assert [entry_id for entry_id, _ in stream_client.redis_client.xrange(key)] == newest[::-1]
+
+    def test_max_age(self, stream_client):
+        """Test entries older than the maximum age are trimmed"""
+        key = fill_stream(stream_client, uuid.uuid4(), [10, 8, 1, 0])
+
+        StreamTrimmer(RetentionPolicy(7, 0)).trim([key])
+
+        assert stream_client.redis_client.xlen(key) == 2
+
+    def test_conversation_override(self, stream_client):
+        """Test a conversation's own retention replaces the default"""
+        user = User.objects.create_user(username="owner", email="owner@example.com")
+        conversation = Conversation.objects.create(
+            name="Keep all", created_by=user, retention_max_messages=0
+        )
+        kept = fill_stream(stream_client, conversation.id, [3, 2, 1])
+        trimmed = fill_stream(stream_client, uuid.uuid4(), [3, 2, 1])
+
+        StreamTrimmer(RetentionPolicy(0, 1)).trim([kept, trimmed])
+
+        assert stream_client.redis_client.xlen(kept) == 3
+        assert stream_client.redis_client.xlen(trimmed) == 1
+
+    def test_held_back_by_consumer_group(self, stream_client):
+        """Test entries a consumer group still needs are kept"""
+        key = fill_stream(stream_client, uuid.uuid4(), [4, 3, 2, 1])
+        stream_client.redis_client.xgroup_create(key, "archiver", id="0")
+        # Deliver the first two entries but acknowledge neither
+        stream_client.redis_client.xreadgroup("archiver", "test", {key: ">"}, count=2)
+
+        results = StreamTrimmer(RetentionPolicy(0, 1)).trim([key])
+
+        assert results[0].held_back is True
+        assert stream_client.redis_client.xlen(key) == 4
+
+    def test_command(self, stream_client):
+        """Test trim_streams reports what it reclaimed"""
+        fill_stream(stream_client, uuid.uuid4(), [3, 2, 1])
+        fill_stream(stream_client, uuid.uuid4(), [1])
+        out = StringIO()
+
+        call_command("trim_streams", stdout=out)
+
+        assert "from 0 of 2 streams" in out.getvalue()
@@ -0,0 +1,74 @@
+"""
+Tests for bounded WebSocket send queues
+"""
+
+from messaging.send_queue import CLOSE, DROP_OLDEST, SendQueue, send_queue_metrics
+
+
+def drain(queue):
+    """Take every frame left in the queue"""
+    frames = []
+    while (frame := queue.get()) is not None:
+        frames.append(frame)
+    return frames
+
+
+class TestSendQueue:
+    """Test the slow client policies"""
+
+    def test_drop_oldest_queues_resync(self):
+        """Test overflow drops the oldest conversation's frames for a resync hint"""
+        queue = SendQueue(3, DROP_OLDEST)
+        queue.put("a", "1-0", "frame a1")
+        assert queue.get().message_id == "1-0"
+        queue.put("a", "2-0", "frame a2")
+        queue.put("b", "3-0", "frame b3")
+        queue.put("a", "4-0", "frame a4")
+
+        queue.put("b", "5-0", "frame b5")
+
+        frames = drain(queue)
+        assert [(frame.conversation_id, frame.message_id) for frame in frames] == [
+            ("b", "3-0"),
+            ("b", "5-0"),
+            ("a", "1-0"),
+        ]
+        # Resync from the last message of "a" the client was sent
+        assert frames[-1].text is None
+        queue.close()
+
+    def test_drop_oldest_without_sent_message(self):
+        """Test the hint points just before the first dropped message"""
+        queue = SendQueue(1, DROP_OLDEST)
+        queue.put("a", "5-0", "frame a5")
+
+        queue.put("b", "6-0", "frame b6")
+
+        frames = drain(queue)
+        assert [(frame.conversation_id, frame.message_id) for frame in frames] == [
+            ("b", "6-0"),
+            ("a", "4-18446744073709551615"),
+        ]
+        queue.close()
+
+    def test_close_policy(self):
+        """Test a full queue refuses frames under the close policy"""
+        queue = SendQueue(1, CLOSE)
+
+        assert queue.put("a", "1-0", "frame") is True
+        assert queue.put("a", "2-0", "frame") is False
+        assert len(queue) == 1
+        queue.close()
+
+    def test_metrics(self):
+        """Test queue depth is tracked across queues"""
+        before = send_queue_metrics.snapshot()
+        queue = SendQueue(10, DROP_OLDEST)
+        queue.put("a", "1-0", "frame")
+        queue.put("a", "2-0", "frame")
+
+        assert send_queue_metrics.depth == before["depth"] + 2
+        assert send_queue_metrics.queues == before["queues"] + 1
+
+        queue.close()
+        assert send_queue_metrics.snapshot()["depth"] == before["depth"]
@@ -0,0 +1,38 @@
+"""
+Tests for graceful WebSocket shutdown
+"""
+
+from messaging.shutdown import CLOSE_CODE_RESTARTING, close_all_connections, open_connections
+
+
+class ClosingConsumer:
+    """Stands in for a consumer and records how it was closed"""
+
+    def __init__(self):
+        self.closed_with = None
+
+    async def close_with_retry_after(self, code, retry_after):
+        self.closed_with = (code, retry_after)
+
+
+class TestCloseAllConnections:
+    """Test closing connections with reconnect hints"""
+
+    async def test_spreads_reconnect_delays(self, settings):
+        """Test every connection is closed with a delay within the spread"""
+        settings.CHAT_WEBSOCKET = {
+            **settings.CHAT_WEBSOCKET,
+            "SHUTDOWN_RECONNECT_SPREAD_SECONDS": 5,
+        }
+        consumers = [ClosingConsumer() for _ in range(20)]
+        for consumer in consumers:
+            open_connections.add(consumer)
+
+        await close_all_connections()
+
+        for consumer in consumers:
+            code, retry_after = consumer.closed_with
+            assert code == CLOSE_CODE_RESTARTING
+            assert 0 <= retry_after <= 5
+            open_connections.discard(consumer)
+        assert len({consumer.closed_with[1] for consumer in consumers}) > 1
@@ -6,7 +6,15 @@ import pytest
 import redis
 from django.conf import settings
 
-from messaging.throttle import MessageThrottler
+from messaging.throttle import (
+    CONVERSATION,
+    TOKEN_BUCKET,
+    USER,
+    USER_CONVERSATION,
+    AsyncMessageThrottler,
+    MessageThrottler,
+    ThrottleLimit,
+)
 
 
 @pytest.fixture
@@ -61,3 +69,158 @@ class TestMessageThrottler:
         throttler.is_allowed(user_id, conversation_id)
         remaining = throttler.get_remaining(user_id, conversation_id)
         assert remaining == 2
+
+
+@pytest.fixture
+async def async_throttler(redis_client):
+    """Fixture for AsyncMessageThrottler with low limits for testing"""
+    throttler = AsyncMessageThrottler(max_messages=3, window_seconds=60)
+    yield throttler
+    await throttler.redis_client.aclose()
+
+
+class TestAsyncMessageThrottler:
+    """Test asyncio message throttling"""
+
+    async def test_block_over_limit(self, async_throttler):
+        """Test that messages are blocked over the limit"""
+        user_id = 4
+        conversation_id = "test-conv-4"
+
+        for _ in range(3):
+            assert await async_throttler.is_allowed(user_id, conversation_id) is True
+
+        assert await async_throttler.is_allowed(user_id, conversation_id) is False
+        assert await async_throttler.get_remaining(user_id, conversation_id) == 0
+
+    async def test_shares_keys_with_sync_throttler(self, throttler, async_throttler):
+        """Test that both throttlers count against the same window"""
+        user_id = 5
+        conversation_id = "test-conv-5"
+
+        throttler.is_allowed(user_id, conversation_id)
+        await async_throttler.is_allowed(user_id, conversation_id)
+
+        assert throttler.get_remaining(user_id, conversation_id) == 1
+
+
+class TestThrottleScripts:
+    """Test the scripted throttle algorithms"""
+
+    def test_repairs_counter_without_expiry(self, redis_client, throttler):
+        """Test that a counter left without a TTL is given one again"""
+        redis_client.set("throttle:6:test-conv-6", 99)
+
+        result = throttler.check(6, "test-conv-6")
+
+        assert result.allowed is False
+        assert result.retry_after > 0
+        assert redis_client.pttl("throttle:6:test-conv-6") > 0
+
+    def test_token_bucket(self):
+        """Test that the token bucket blocks once empty and reports retry-after"""
+        throttler = MessageThrottler(max_messages=3, window_seconds=60, algorithm=TOKEN_BUCKET)
+
+        results = [throttler.check(7, "test-conv-7") for _ in range(4)]
+
+        assert [r.allowed for r in results] == [True, True, True, False]
+        assert results[2].remaining == 0
+        assert 0 < results[3].retry_after <= 20
+
+
+class TestThrottlePolicy:
+    """Test hierarchical throttle limits"""
+
+    @pytest.fixture
+    def policy_throttler(self, redis_client):
+        """Fixture for a throttler enforcing all three scopes"""
+        return MessageThrottler(
+            limits=[
+                ThrottleLimit(USER_CONVERSATION, 3, 60),
+                ThrottleLimit(USER, 4, 60),
+                ThrottleLimit(CONVERSATION, 5, 60),
+            ]
+        )
+
+    def test_user_limit_spans_conversations(self, policy_throttler):
+        """Test that fanning out across conversations trips the per-user limit"""
+        for conversation_id in ("conv-a", "conv-b", "conv-c", "conv-d"):
+            assert policy_throttler.check(8, conversation_id).allowed is True
+
+        result = policy_throttler.check(8, "conv-e")
+
+        assert result.allowed is False
+        assert result.limit == USER
+        assert result.retry_after > 0
+
+    def test_conversation_limit_spans_users(self, policy_throttler):
+        """Test that the per-conversation aggregate limit trips across users"""
+        for user_id in range(10, 15):
+            assert policy_throttler.check(user_id, "conv-busy").allowed is True
+
+        assert policy_throttler.check(15, "conv-busy").limit == CONVERSATION
+
+    def test_rejected_message_consumes_nothing(self, redis_client, policy_throttler):
+        """Test that a tripped limit leaves the other counters untouched"""
+        for _ in range(3):
+            policy_throttler.check(16, "conv-f")
+
+        assert policy_throttler.check(16, "conv-f").limit == USER_CONVERSATION
+        assert redis_client.get("throttle:user:16") == "3"
+
+
+class TestThrottleLeasing:
+    """Test local quota leasing"""
+
+    @pytest.fixture
+    def leasing_throttler(self, redis_client):
+        """Fixture for a throttler leasing 4 messages per Redis call"""
+        return MessageThrottler(max_messages=10, window_seconds=60, lease_size=4)
+
+    def test_lease_spent_locally(self, redis_client, leasing_throttler):
+        """Test that one Redis call covers a whole lease"""
+        for _ in range(4):
+            assert leasing_throttler.is_allowed(17, "conv-g") is True
+
+        assert redis_client.get("throttle:17:conv-g") == "4"
+
+    def test_limit_preserved(self, leasing_throttler):
+        """Test that leasing never allows more than the limit"""
+        results = [leasing_throttler.is_allowed(18, "conv-h") for _ in range(12)]
+
+        assert results == [True] * 10 + [False] * 2
+
+    def test_aggregate_lease_shared(self, redis_client):
+        """Test that aggregate quota leased in one conversation serves the others"""
+        throttler = MessageThrottler(
+            limits=[
+                ThrottleLimit(USER_CONVERSATION, 10, 60),
+                ThrottleLimit(USER, 30, 60),
+                ThrottleLimit(CONVERSATION, 100, 60),
+            ],
+            lease_size=10,
+        )
+
+        # One user in many conversations gets the whole per-user limit
+        results = [throttler.is_allowed(19, f"conv-i{n}") for n in range(10) for _ in range(3)]
+        assert results == [True] * 30
+        assert throttler.check(19, "conv-i10").limit == USER
+
+        # Many senders in one conversation share its lease
+        results = [throttler.is_allowed(user_id, "conv-j") for user_id in range(100, 120)]
+        assert results == [True] * 20
+        assert int(redis_client.get("throttle:conv:conv-j")) <= 30
+
+    def test_refused_message_returns_lease(self, redis_client):
+        """Test that a message refused by one limit keeps the others' leased quota"""
+        throttler = MessageThrottler(
+            limits=[ThrottleLimit(USER_CONVERSATION, 2, 60), ThrottleLimit(USER, 10, 60)],
+            lease_size=5,
+        )
+        for _ in range(2):
+            assert throttler.is_allowed(20, "conv-k") is True
+
+        assert throttler.check(20, "conv-k").limit == USER_CONVERSATION
+
+        assert [throttler.is_allowed(20, f"conv-l{n}") for n in range(8)] == [True] * 8
+        assert throttler.is_allowed(20, "conv-m") is False
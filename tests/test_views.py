@@ -0,0 +1,181 @@
+"""
+Tests for the messaging API endpoints
+"""
+
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from conversations.models import Conversation, Participant
+from messaging.cold_storage import ColdStreamStore
+from messaging.read_cursors import read_cursors
+
+DAY_MS = 86400000
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user():
+    """A user who takes part in the conversation fixture"""
+    return User.objects.create_user(
+        email="test@example.com",
+        username="testuser",
+        first_name="Test",
+        last_name="User",
+        password="SecurePass123!",
+    )
+
+
+@pytest.fixture
+def client(user):
+    """API client authenticated as the user fixture"""
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.fixture
+def conversation(user):
+    """A conversation with the user fixture as participant"""
+    conversation = Conversation.objects.create(name="Test Conversation", created_by=user)
+    Participant.objects.create(conversation=conversation, user=user)
+    return conversation
+
+
+def add_messages(stream_client, conversation, count):
+    """Add `count` messages to a conversation and return their IDs"""
+    return [
+        stream_client.add_message(str(conversation.id), 1, "testuser", f"Message {i}")
+        for i in range(count)
+    ]
+
+
+@pytest.mark.django_db
+class TestMessageHistoryView:
+    """Test the message history endpoint"""
+
+    def get(self, client, conversation, **params):
+        return client.get(f"/api/v1/conversations/{conversation.id}/messages", params)
+
+    def test_latest_page(self, client, conversation, stream_client):
+        """Test the latest page links to the previous one"""
+        ids = add_messages(stream_client, conversation, 5)
+
+        response = self.get(client, conversation, limit=2)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [message["id"] for message in response.data["messages"]] == ids[3:]
+        assert response.data["has_more"] is True
+        assert response.data["prev"] == ids[3]
+        assert response.data["next"] == ids[4]
+
+    def test_page_backward(self, client, conversation, stream_client):
+        """Test paging back with before until the start of the conversation"""
+        ids = add_messages(stream_client, conversation, 5)
+
+        response = self.get(client, conversation, before=ids[3], limit=2)
+        assert [message["id"] for message in response.data["messages"]] == ids[1:3]
+        assert response.data["has_more"] is True
+        assert response.data["prev"] == ids[1]
+
+        response = self.get(client, conversation, before=ids[1], limit=2)
+        assert [message["id"] for message in response.data["messages"]] == ids[:1]
+        assert response.data["has_more"] is False
+        assert response.data["prev"] is None
+
+    def test_page_forward(self, client, conversation, stream_client):
+        """Test paging forward with from until the newest message"""
+        ids = add_messages(stream_client, conversation, 3)
+
+        response = self.get(client, conversation, **{"from": ids[0], "limit": 5})
+
+        assert [message["id"] for message in response.data["messages"]] == ids[1:]
+        assert response.data["has_more"] is False
+        assert response.data["next"] == ids[2]
+
+    @pytest.mark.parametrize(
+        "params",
+        [{"from": "1-0", "before": "2-0"}, {"before": "yesterday"}, {"from": "1"}],
+    )
+    def test_invalid_cursors(self, client, conversation, stream_client, params):
+        """Test conflicting or malformed cursors are refused"""
+        response = self.get(client, conversation, **params)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.parametrize("limit", ["-3", "0"])
+    def test_limit_clamped(self, client, conversation, stream_client, limit):
+        """Test limits below one return a single message"""
+        ids = add_messages(stream_client, conversation, 3)
+
+        response = self.get(client, conversation, limit=limit)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [message["id"] for message in response.data["messages"]] == ids[2:]
+        assert response.data["has_more"] is True
+        assert response.data["prev"] == ids[2]
+
+    def test_non_participant_forbidden(self, conversation, stream_client):
+        """Test only participants can read the history"""
+        other = User.objects.create_user(username="other", email="other@example.com")
+        client = APIClient()
+        client.force_authenticate(user=other)
+
+        response = self.get(client, conversation)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestInboxView:
+    """Test the inbox endpoint"""
+
+    def create_conversation(self, user, name):
+        conversation = Conversation.objects.create(name=name, created_by=user)
+        Participant.objects.create(conversation=conversation, user=user)
+        return conversation
+
+    def test_inbox(self, client, user, stream_client):
+        """Test conversations are listed by last activity, cold and empty ones last"""
+        empty = self.create_conversation(user, "Empty")
+        cold = self.create_conversation(user, "Cold")
+        quiet = self.create_conversation(user, "Quiet")
+        busy = self.create_conversation(user, "Busy")
+        key = stream_client._get_stream_key(str(cold.id))
+        start_ms = int(time.time() * 1000) - 30 * DAY_MS
+        for i in range(3):
+            stream_client.redis_client.xadd(key, {"p": f"1|1|Old {i}"}, id=f"{start_ms + i}-0")
+        assert ColdStreamStore().compact(key, idle_ms=7 * DAY_MS, chunk_size=100)
+        add_messages(stream_client, quiet, 1)
+        add_messages(stream_client, busy, 2)
+
+        response = client.get("/api/v1/inbox")
+
+        assert response.status_code == status.HTTP_200_OK
+        inbox = response.data["conversations"]
+        assert [entry["name"] for entry in inbox] == ["Busy", "Quiet", "Cold", "Empty"]
+        assert inbox[0]["last_message"]["content"] == "Message 1"
+        assert inbox[0]["message_count"] == 2
+        assert inbox[0]["unread_count"] == 2
+        assert inbox[2]["conversation_id"] == str(cold.id)
+        assert inbox[2]["last_message"]["content"] == "Old 2"
+        assert inbox[2]["message_count"] == 3
+        assert inbox[3]["conversation_id"] == str(empty.id)
+        assert inbox[3]["last_message"] is None
+        assert inbox[3]["message_count"] == 0
+        assert inbox[3]["unread_count"] == 0
+
+    def test_unread_counts_unavailable(
+        self, client, user, conversation, stream_client, monkeypatch
+    ):
+        """Test unread counts fall back to 0 when Redis cannot count them"""
+        add_messages(stream_client, conversation, 1)
+        monkeypatch.setattr(read_cursors, "get_unread_counts", lambda user_id, ids: {})
+
+        response = client.get("/api/v1/inbox")
+
+        assert response.data["conversations"][0]["unread_count"] == 0